@@ -2,7 +2,8 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Aula, Presenca, MacroEvolucao
+from .models import Aula, Presenca, MacroEvolucao, ResumoAgendaMensal
+from .services import recalcular_ocupacao
 
 class PresencaInline(admin.TabularInline):
     model = Presenca
@@ -14,6 +15,16 @@ class AulaAdmin(admin.ModelAdmin):
     list_filter = ['status', 'profissional', 'data_hora_inicio']
     inlines = [PresencaInline] # Permite dar presença dentro da aula
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # As presenças do inline são gravadas direto, então recontamos as vagas
+        recalcular_ocupacao([form.instance.pk])
+
+@admin.register(ResumoAgendaMensal)
+class ResumoAgendaMensalAdmin(admin.ModelAdmin):
+    list_display = ['mes', 'profissional', 'status', 'aulas', 'vagas', 'presentes', 'faltas']
+    list_filter = ['mes', 'status', 'profissional']
+
 @admin.register(MacroEvolucao)
 class MacroAdmin(admin.ModelAdmin):
     list_display = ['titulo', 'organizacao']
\ No newline at end of file
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AgendaFitConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agenda_fit'
+
+    def ready(self):
+        import agenda_fit.signals
@@ -0,0 +1,115 @@
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context
+from agenda_fit.models import Aula, Presenca
+from cadastros_fit.models import Aluno, Profissional, Unidade
+from core.periodos import filtro_periodo, limites_dia, limites_mes
+
+
+class Rollback(Exception):
+    """Usada só para desfazer a massa de teste no fim do benchmark."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Popula um tenant com N aulas (dentro de uma transação que é desfeita no final) '
+        'e mostra o EXPLAIN ANALYZE das consultas da agenda sem e com os índices. '
+        'Também compara os filtros __date/__year/__month com os intervalos do core.periodos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schema', help='Schema do tenant usado no teste')
+        parser.add_argument('--aulas', type=int, default=100_000)
+        parser.add_argument('--alunos', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('O benchmark usa EXPLAIN do PostgreSQL.')
+
+        with schema_context(options['schema']):
+            try:
+                with transaction.atomic():
+                    self.popular(options['aulas'], options['alunos'])
+                    self.comparar()
+                    raise Rollback
+            except Rollback:
+                self.stdout.write(self.style.SUCCESS('Massa de teste removida (rollback).'))
+
+    # ------------------------------------------------------------------
+    # MASSA DE TESTE
+    # ------------------------------------------------------------------
+    def popular(self, qtde_aulas, qtde_alunos):
+        t0 = time.perf_counter()
+        unidade = Unidade.objects.create(nome='Benchmark')
+        profs = list(Profissional.objects.values_list('id', flat=True)[:10]) or [None]
+        alunos = Aluno.objects.bulk_create(
+            [Aluno(nome=f'Aluno Benchmark {i}') for i in range(qtde_alunos)], batch_size=1000
+        )
+
+        # Aulas de hora em hora, a partir de ~2 anos atrás
+        inicio = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=730)
+        aulas = []
+        for i in range(qtde_aulas):
+            dh = inicio + timedelta(hours=i // len(profs))
+            aulas.append(Aula(
+                unidade=unidade, profissional_id=profs[i % len(profs)],
+                data_hora_inicio=dh, data_hora_fim=dh + timedelta(hours=1),
+                status=random.choice(['AGENDADA', 'REALIZADA', 'CANCELADA']),
+            ))
+        aulas = Aula.objects.bulk_create(aulas, batch_size=5000)
+
+        presencas = []
+        for aula in aulas:
+            for aluno in random.sample(alunos, 2):
+                presencas.append(Presenca(aula=aula, aluno=aluno, status=random.choice(['PRESENTE', 'FALTA'])))
+        Presenca.objects.bulk_create(presencas, batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE agenda_fit_aula; ANALYZE agenda_fit_presenca;')
+
+        self.amostra = {'aula': aulas[len(aulas) // 2], 'aluno': alunos[0]}
+        self.stdout.write(f'{len(aulas)} aulas e {len(presencas)} presenças criadas em {time.perf_counter() - t0:.1f}s')
+
+    # ------------------------------------------------------------------
+    # CONSULTAS
+    # ------------------------------------------------------------------
+    def consultas(self):
+        aula = self.amostra['aula']
+        aluno = self.amostra['aluno']
+        semana = aula.data_hora_inicio
+        dia = timezone.localtime(semana).date()
+        return {
+            'semana (range)': Aula.objects.filter(
+                data_hora_inicio__gte=semana, data_hora_inicio__lt=semana + timedelta(days=7)
+            ),
+            'dia com __date (função na coluna)': Aula.objects.filter(data_hora_inicio__date=dia),
+            'dia com filtro_periodo': Aula.objects.filter(filtro_periodo('data_hora_inicio', *limites_dia(dia))),
+            'mês REALIZADA com __year/__month': Aula.objects.filter(
+                data_hora_inicio__year=dia.year, data_hora_inicio__month=dia.month, status='REALIZADA'
+            ),
+            'mês REALIZADA com filtro_periodo': Aula.objects.filter(
+                filtro_periodo('data_hora_inicio', *limites_mes(dia.year, dia.month)), status='REALIZADA'
+            ),
+            'get_or_create (horario, profissional)': Aula.objects.filter(
+                data_hora_inicio=aula.data_hora_inicio, profissional_id=aula.profissional_id
+            ),
+            'existe (aula, aluno)': Presenca.objects.filter(aula=aula, aluno=aluno),
+            'agenda futura do aluno': Presenca.objects.filter(
+                aluno=aluno, aula__data_hora_inicio__gte=semana
+            ).order_by('aula__data_hora_inicio'),
+        }
+
+    def comparar(self):
+        for titulo, desligar in (('SEM ÍNDICES', True), ('COM ÍNDICES', False)):
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {titulo} ==='))
+            with connection.cursor() as cursor:
+                valor = 'off' if desligar else 'on'
+                cursor.execute(f'SET LOCAL enable_indexscan = {valor}; SET LOCAL enable_bitmapscan = {valor}; SET LOCAL enable_indexonlyscan = {valor};')
+
+            for nome, qs in self.consultas().items():
+                self.stdout.write(self.style.HTTP_INFO(f'\n-- {nome}'))
+                self.stdout.write(qs.explain(analyze=True))
@@ -1,62 +1,31 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from contratos_fit.models import Contrato
-from agenda_fit.models import Aula, Presenca
-from cadastros_fit.models import Unidade
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from agenda_fit.services import materializar_agenda
 
 class Command(BaseCommand):
-    help = 'Gera a agenda dos próximos 30 dias com base nos contratos ativos'
+    help = 'Materializa a agenda dos contratos vigentes até o horizonte (padrão: 30 dias), em todos os tenants'
 
-    def handle(self, *args, **kwargs):
-        hoje = timezone.now().date()
-        data_limite = hoje + timedelta(days=30)
-        
-        # Pega contratos ativos
-        contratos = Contrato.objects.filter(status='ATIVO', data_fim__gte=hoje)
-        
-        aulas_criadas = 0
-        
-        for contrato in contratos:
-            # Pega os horários fixos desse contrato (Ex: Seg 08:00)
-            horarios = contrato.horarios_fixos.all()
-            
-            # Itera dia a dia pelos próximos 30 dias
-            dia_atual = hoje
-            while dia_atual <= data_limite:
-                dia_semana_atual = dia_atual.weekday() # 0=Seg, 6=Dom
-                
-                # Verifica se tem horário fixo pra esse dia da semana
-                for h in horarios:
-                    if h.dia_semana == dia_semana_atual:
-                        
-                        # Monta a data/hora completa
-                        inicio = timezone.make_aware(timezone.datetime.combine(dia_atual, h.horario))
-                        fim = inicio + timedelta(hours=1) # Aula de 1h padrão
-                        
-                        # Verifica se já existe aula nesse horário com esse prof
-                        # Se existir, usamos ela. Se não, criamos uma nova.
-                        aula, created = Aula.objects.get_or_create(
-                            data_hora_inicio=inicio,
-                            profissional=h.profissional,
-                            defaults={
-                                'organizacao': contrato.plano.organizacao,
-                                'unidade': Unidade.objects.first(), # Melhorar lógica depois pra pegar do contrato
-                                'data_hora_fim': fim,
-                                'status': 'AGENDADA'
-                            }
-                        )
-                        
-                        # Adiciona o aluno na lista de presença (se já não estiver)
-                        if not aula.presencas.filter(aluno=contrato.aluno).exists():
-                            # Verifica capacidade
-                            if aula.presencas.count() < aula.capacidade_maxima:
-                                Presenca.objects.create(aula=aula, aluno=contrato.aluno)
-                                aulas_criadas += 1
-                                self.stdout.write(f"Agendado: {contrato.aluno} em {inicio}")
-                            else:
-                                self.stdout.write(self.style.WARNING(f"Lotado: {inicio}"))
-                
-                dia_atual += timedelta(days=1)
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30, help='Tamanho do horizonte em dias')
+        parser.add_argument('--schema', help='Processa apenas este schema')
 
-        self.stdout.write(self.style.SUCCESS(f'Processo finalizado! {aulas_criadas} agendamentos criados.'))
\ No newline at end of file
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+
+        # Roda em todos os schemas de clientes (o public não tem agenda)
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+
+        total = 0
+        for tenant in tenants:
+            with tenant_context(tenant):
+                # Cada contrato só avança do seu "gerado até" em diante
+                contratos, criadas = materializar_agenda(hoje=hoje, dias=options['dias'])
+
+            total += criadas
+            if contratos:
+                self.stdout.write(f"[{tenant.schema_name}] {contratos} contratos, {criadas} agendamentos criados.")
+
+        self.stdout.write(self.style.SUCCESS(f'Processo finalizado! {total} agendamentos criados.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from agenda_fit.models import Aula
+from agenda_fit.services import recalcular_ocupacao
+
+class Command(BaseCommand):
+    help = (
+        'Confere o contador de vagas (Aula.vagas_ocupadas) com as presenças gravadas, em todos os tenants. '
+        'Rodar periodicamente (cron) corrige qualquer alteração feita por fora dos serviços da agenda.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='Processa apenas este schema')
+        parser.add_argument('--todas', action='store_true', help='Recalcula também as aulas passadas (padrão: só as futuras)')
+
+    def handle(self, *args, **options):
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+
+        for tenant in tenants:
+            with tenant_context(tenant):
+                aula_ids = None
+                if not options['todas']:
+                    aula_ids = Aula.objects.filter(data_hora_inicio__gte=timezone.now()).values('pk')
+                total = recalcular_ocupacao(aula_ids)
+            self.stdout.write(f"[{tenant.schema_name}] {total} aulas conferidas.")
+
+        self.stdout.write(self.style.SUCCESS('Ocupação das aulas recalculada!'))
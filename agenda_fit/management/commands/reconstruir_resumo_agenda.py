@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from agenda_fit.services_resumo import reconstruir_resumo
+
+class Command(BaseCommand):
+    help = 'Refaz o consolidado mensal da agenda (ResumoAgendaMensal) a partir das aulas e presenças, em todos os tenants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='Processa apenas este schema')
+
+    def handle(self, *args, **options):
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+
+        for tenant in tenants:
+            with tenant_context(tenant):
+                linhas = reconstruir_resumo()
+            self.stdout.write(f"[{tenant.schema_name}] {linhas} linhas de resumo.")
+
+        self.stdout.write(self.style.SUCCESS('Consolidado da agenda reconstruído!'))
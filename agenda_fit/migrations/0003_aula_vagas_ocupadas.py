@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def preencher_vagas_ocupadas(apps, schema_editor):
+    Aula = apps.get_model('agenda_fit', 'Aula')
+    Presenca = apps.get_model('agenda_fit', 'Presenca')
+    contagem = Presenca.objects.filter(aula=OuterRef('pk')).order_by().values('aula').annotate(c=Count('id')).values('c')
+    Aula.objects.update(vagas_ocupadas=Coalesce(Subquery(contagem), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda_fit', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aula',
+            name='vagas_ocupadas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_vagas_ocupadas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:41
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remover_presencas_duplicadas(apps, schema_editor):
+    """Mantém só a presença mais antiga de cada (aula, aluno) antes de criar a constraint."""
+    Aula = apps.get_model('agenda_fit', 'Aula')
+    Presenca = apps.get_model('agenda_fit', 'Presenca')
+
+    duplicadas = (
+        Presenca.objects.values('aula_id', 'aluno_id')
+        .annotate(total=Count('id'), manter=Min('id'))
+        .filter(total__gt=1)
+    )
+    aulas_afetadas = set()
+    for d in duplicadas:
+        Presenca.objects.filter(aula_id=d['aula_id'], aluno_id=d['aluno_id']).exclude(id=d['manter']).delete()
+        aulas_afetadas.add(d['aula_id'])
+
+    if aulas_afetadas:
+        contagem = Presenca.objects.filter(aula=OuterRef('pk')).order_by().values('aula').annotate(c=Count('id')).values('c')
+        Aula.objects.filter(pk__in=aulas_afetadas).update(vagas_ocupadas=Coalesce(Subquery(contagem), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda_fit', '0003_aula_vagas_ocupadas'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_presencas_duplicadas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='aula',
+            index=models.Index(fields=['data_hora_inicio', 'profissional'], name='aula_inicio_prof_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aula',
+            index=models.Index(fields=['status', 'data_hora_inicio'], name='aula_status_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='presenca',
+            index=models.Index(fields=['aluno', 'status'], name='presenca_aluno_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='presenca',
+            constraint=models.UniqueConstraint(fields=('aula', 'aluno'), name='presenca_aula_aluno_unica'),
+        ),
+    ]
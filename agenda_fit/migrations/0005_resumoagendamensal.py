@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda_fit', '0004_indices_agenda'),
+        ('cadastros_fit', '0002_profissional_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoAgendaMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês')),
+                ('status', models.CharField(choices=[('AGENDADA', 'Agendada'), ('CONFIRMADA', 'Confirmada (Whats)'), ('REALIZADA', 'Realizada'), ('CANCELADA', 'Cancelada')], max_length=20)),
+                ('aulas', models.PositiveIntegerField(default=0)),
+                ('vagas', models.PositiveIntegerField(default=0, help_text='Soma da capacidade das aulas')),
+                ('presencas', models.PositiveIntegerField(default=0)),
+                ('presentes', models.PositiveIntegerField(default=0)),
+                ('faltas', models.PositiveIntegerField(default=0)),
+                ('faltas_justificadas', models.PositiveIntegerField(default=0)),
+                ('profissional', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='cadastros_fit.profissional')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('mes', 'profissional', 'status'), name='resumo_agenda_mes_prof_status_unico', nulls_distinct=False)],
+            },
+        ),
+    ]
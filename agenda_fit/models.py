@@ -21,6 +21,8 @@ class Aula(models.Model):
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='AGENDADA')
     capacidade_maxima = models.PositiveIntegerField(default=3)
+    # Contador desnormalizado de presenças (mantido pelos serviços de agendamento)
+    vagas_ocupadas = models.PositiveIntegerField(default=0, editable=False)
     
     # Evolução (O que foi feito na aula)
     evolucao_texto = models.TextField(blank=True, verbose_name="Evolução / Prontuário")
@@ -34,6 +36,17 @@ class Aula(models.Model):
         verbose_name="Tipo de Serviço"
     )
 
+    class Meta:
+        indexes = [
+            # Filtros por período (semana, mês, dia) e o lookup (horário, profissional) da geração de agenda
+            models.Index(fields=['data_hora_inicio', 'profissional'], name='aula_inicio_prof_idx'),
+            models.Index(fields=['status', 'data_hora_inicio'], name='aula_status_inicio_idx'),
+        ]
+
+    @property
+    def lotada(self):
+        return self.vagas_ocupadas >= self.capacidade_maxima
+
     def __str__(self):
         return f"Aula {self.data_hora_inicio.strftime('%d/%m %H:%M')} - {self.profissional}"
 
@@ -47,6 +60,15 @@ class Presenca(models.Model):
     aula = models.ForeignKey(Aula, on_delete=models.CASCADE, related_name='presencas')
     aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_PRESENCA, default='PRESENTE')
+
+    class Meta:
+        constraints = [
+            # Um aluno só ocupa uma vaga por aula (a checagem de "já inscrito" vira busca no índice)
+            models.UniqueConstraint(fields=['aula', 'aluno'], name='presenca_aula_aluno_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['aluno', 'status'], name='presenca_aluno_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.aluno} em {self.aula}"
@@ -69,4 +91,30 @@ class ConfiguracaoIntegracao(models.Model):
     gympass_ativo = models.BooleanField(default=False)
 
     def __str__(self):
-        return "Configurações de Integração"
\ No newline at end of file
+        return "Configurações de Integração"
+
+class ResumoAgendaMensal(models.Model):
+    """
+    Consolidado mensal da agenda por profissional e status da aula.
+    Mantido por agenda_fit.services_resumo (sinais + serviços em lote);
+    os dashboards leem daqui em vez de varrer Aula/Presenca.
+    """
+    mes = models.DateField(help_text="Primeiro dia do mês")
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Aula.STATUS_CHOICES)
+
+    aulas = models.PositiveIntegerField(default=0)
+    vagas = models.PositiveIntegerField(default=0, help_text="Soma da capacidade das aulas")
+    presencas = models.PositiveIntegerField(default=0)
+    presentes = models.PositiveIntegerField(default=0)
+    faltas = models.PositiveIntegerField(default=0)
+    faltas_justificadas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # nulls_distinct=False: o balde "sem profissional" também é único por mês/status
+            models.UniqueConstraint(fields=['mes', 'profissional', 'status'], name='resumo_agenda_mes_prof_status_unico', nulls_distinct=False),
+        ]
+
+    def __str__(self):
+        return f"{self.mes:%m/%Y} - {self.profissional} ({self.status})"
@@ -1,64 +1,348 @@
-from datetime import timedelta
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from agenda_fit.models import Aula, Presenca
+from cadastros_fit.models import Unidade
+from .services_resumo import marcar_para_recalculo, mes_de
 
-def gerar_agenda_contrato(contrato):
-    print(f"--- INICIANDO GERAÇÃO PARA CONTRATO {contrato.id} ---")
-    
-    horarios = contrato.horarios_fixos.all()
-    if not horarios:
-        print("ERRO: Nenhum horário fixo encontrado.")
-        return
+DURACAO_AULA_PADRAO = timedelta(hours=1)
+
+# ==============================================================================
+# MOTOR DE GERAÇÃO DE AGENDA (SET-BASED)
+# ==============================================================================
+
+def expandir_horarios(horarios, data_inicio, data_fim):
+    """
+    Transforma a grade fixa (dia da semana + horário) em slots concretos no período.
+    Em vez de varrer o calendário dia a dia, pula direto para a primeira ocorrência
+    de cada dia da semana e avança de 7 em 7 dias.
+
+    Retorna uma lista ordenada de (inicio, profissional_id), sem repetições.
+    """
+    slots = set()
+    if not data_inicio or not data_fim or data_inicio > data_fim:
+        return []
 
-    print(f"Horários encontrados: {horarios.count()}")
     for h in horarios:
-        print(f" - Dia: {h.get_dia_semana_display()} ({h.dia_semana}) às {h.horario}")
-
-    data_atual = contrato.data_inicio
-    data_final = contrato.data_fim
-    
-    print(f"Período: {data_atual} até {data_final}")
-    
-    aulas_criadas = 0
-    
-    while data_atual <= data_final:
-        dia_semana = data_atual.weekday() # 0=Segunda
-        # print(f"Checando dia {data_atual} (Dia da semana: {dia_semana})") 
-        
-        for h in horarios:
-            if h.dia_semana == dia_semana:
-                print(f" >> MATCH! Dia {data_atual} bate com horário {h}")
-                
-                inicio = timezone.make_aware(timezone.datetime.combine(data_atual, h.horario))
-                fim = inicio + timedelta(hours=1)
-                
-                try:
-                    aula, created = Aula.objects.get_or_create(
-                        data_hora_inicio=inicio,
-                        profissional=h.profissional,
-                        defaults={
-                            'organizacao': contrato.plano.organizacao,
-                            'unidade': contrato.unidade,
-                            'data_hora_fim': fim,
-                            'status': 'AGENDADA'
-                        }
-                    )
-                    
-                    if created:
-                        print(f"    [NOVA] Aula criada: {aula}")
-                    else:
-                        print(f"    [EXISTE] Usando aula existente: {aula}")
-
-                    if not aula.presencas.filter(aluno=contrato.aluno).exists():
-                        Presenca.objects.create(aula=aula, aluno=contrato.aluno)
-                        aulas_criadas += 1
-                        print(f"    [PRESENÇA] Aluno adicionado!")
-                    else:
-                        print(f"    [INFO] Aluno já estava na lista.")
-                        
-                except Exception as e:
-                    print(f"    [ERRO CRÍTICO] {e}")
-
-        data_atual += timedelta(days=1)
-
-    print(f"--- FIM. Total agendado: {aulas_criadas} ---")
\ No newline at end of file
+        deslocamento = (h.dia_semana - data_inicio.weekday()) % 7
+        dia = data_inicio + timedelta(days=deslocamento)
+        while dia <= data_fim:
+            inicio = timezone.make_aware(datetime.combine(dia, h.horario))
+            slots.add((inicio, h.profissional_id))
+            dia += timedelta(days=7)
+
+    return sorted(slots, key=lambda s: (s[0], s[1] or 0))
+
+
+def _travar_slots(slots):
+    """
+    Trava de transação (advisory lock) por slot (horário, profissional). Não há
+    unicidade em Aula para esse par, então duas gerações de agenda em paralelo
+    poderiam não achar a aula do slot e cada uma criar a sua, dividindo a turma e
+    furando a capacidade; com a trava a segunda espera e encontra a aula da primeira.
+    Ordenado para não haver deadlock.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    schema = getattr(connection, 'schema_name', 'public')
+    chaves = sorted({f"aula_slot:{schema}:{int(inicio.timestamp())}:{prof_id}" for inicio, prof_id in slots})
+    with connection.cursor() as cursor:
+        for chave in chaves:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [chave])
+
+
+def buscar_aulas_dos_slots(slots, travar=False):
+    """
+    Busca, numa única query, as aulas já existentes para os slots informados.
+    Com `travar=True` as linhas ficam bloqueadas (SELECT ... FOR UPDATE) até o fim
+    da transação, para que o contador de vagas não seja alterado por outra reserva.
+    Só os horários exatos dos slots são buscados (não o intervalo entre o primeiro e
+    o último), então as outras aulas dos mesmos profissionais continuam livres; as
+    linhas são travadas em ordem de pk, a mesma ordem das outras travas da agenda.
+
+    Retorna um dict {(inicio, profissional_id): aula}.
+    """
+    if not slots:
+        return {}
+
+    slots = set(slots)
+    inicios = {s[0] for s in slots}
+    profs = {s[1] for s in slots}
+
+    filtro_prof = Q(profissional_id__in=[p for p in profs if p is not None])
+    if None in profs:
+        filtro_prof |= Q(profissional__isnull=True)
+
+    qs = Aula.objects.filter(filtro_prof, data_hora_inicio__in=inicios)
+    if travar:
+        qs = qs.select_for_update()
+
+    aulas = {}
+    # Se houver aulas duplicadas no mesmo horário/profissional, fica a mais antiga
+    for aula in qs.order_by('id'):
+        chave = (aula.data_hora_inicio, aula.profissional_id)
+        if chave in slots:
+            aulas.setdefault(chave, aula)
+    return aulas
+
+
+def agendar_em_lote(pedidos, capacidade=None, agora=None):
+    """
+    Garante Aula + Presença para uma lista de pedidos, tudo numa transação:
+    1 query para as aulas existentes, 1 para as inscrições já feitas e
+    bulk_create para as aulas e presenças que faltam.
+
+    pedidos: iterável de (aluno_id, unidade_id, inicio, profissional_id).
+    capacidade: limite fixo de alunos por aula. Se None, usa a capacidade_maxima da aula
+    (aulas novas herdam a capacidade_padrao da unidade).
+    Os slots do lote ficam travados (_travar_slots) e as aulas existentes também, e o
+    contador `vagas_ocupadas` é atualizado junto, então a geração respeita as reservas
+    e as outras gerações feitas em paralelo.
+    Retorna a quantidade de presenças criadas.
+    """
+    pedidos = list(pedidos)
+    if not pedidos:
+        return 0
+
+    agora = agora or timezone.now()
+
+    with transaction.atomic():
+        slots = {(inicio, prof_id) for _, _, inicio, prof_id in pedidos}
+        _travar_slots(slots)
+        aulas = buscar_aulas_dos_slots(slots, travar=True)
+        capacidade_unidade = dict(
+            Unidade.objects.filter(id__in={p[1] for p in pedidos}).values_list('id', 'capacidade_padrao')
+        )
+
+        # Inscrições já gravadas + as que vão sendo feitas neste lote, por slot
+        inscritos = defaultdict(set)
+        if aulas:
+            por_id = {a.id: chave for chave, a in aulas.items()}
+            existentes = Presenca.objects.filter(
+                aula_id__in=por_id.keys(),
+                aluno_id__in={p[0] for p in pedidos},
+            ).values_list('aula_id', 'aluno_id')
+            for aula_id, aluno_id in existentes:
+                inscritos[por_id[aula_id]].add(aluno_id)
+
+        ocupacao = {chave: a.vagas_ocupadas for chave, a in aulas.items()}
+        aulas_alteradas = {}
+        aulas_novas = []
+        presencas_novas = []
+
+        for aluno_id, unidade_id, inicio, prof_id in pedidos:
+            # Futuro é AGENDADA, passado já nasce como REALIZADA
+            status_inicial = 'AGENDADA' if inicio > agora else 'REALIZADA'
+            chave = (inicio, prof_id)
+            aula = aulas.get(chave)
+
+            if aula is None:
+                aula = Aula(
+                    data_hora_inicio=inicio,
+                    data_hora_fim=inicio + DURACAO_AULA_PADRAO,
+                    profissional_id=prof_id,
+                    unidade_id=unidade_id,
+                    status=status_inicial,
+                )
+                if capacidade_unidade.get(unidade_id):
+                    aula.capacidade_maxima = capacidade_unidade[unidade_id]
+                aulas[chave] = aula
+                ocupacao[chave] = 0
+                aulas_novas.append(aula)
+            elif aula.pk and inicio > agora and aula.status != 'AGENDADA':
+                # Se a aula já existia mas é futura, garantimos que o status dela seja AGENDADA
+                aula.status = 'AGENDADA'
+                aulas_alteradas[aula.pk] = aula
+
+            if aluno_id in inscritos[chave]:
+                continue
+
+            limite = capacidade if capacidade is not None else aula.capacidade_maxima
+            if ocupacao[chave] >= limite:
+                continue
+
+            ocupacao[chave] += 1
+            inscritos[chave].add(aluno_id)
+            presencas_novas.append(Presenca(aula=aula, aluno_id=aluno_id, status=status_inicial))
+
+        for chave, aula in aulas.items():
+            if aula.vagas_ocupadas != ocupacao[chave]:
+                aula.vagas_ocupadas = ocupacao[chave]
+                if aula.pk:
+                    aulas_alteradas[aula.pk] = aula
+
+        if aulas_alteradas:
+            Aula.objects.bulk_update(aulas_alteradas.values(), ['status', 'vagas_ocupadas'])
+        if aulas_novas:
+            Aula.objects.bulk_create(aulas_novas)
+        if presencas_novas:
+            # As presenças das aulas novas pegam o pk gerado no bulk_create acima
+            Presenca.objects.bulk_create(presencas_novas)
+
+        # bulk_* não dispara sinais: marca os baldes do consolidado na mão
+        if aulas_alteradas or aulas_novas or presencas_novas:
+            marcar_para_recalculo({(mes_de(inicio), prof_id) for inicio, prof_id in aulas})
+
+    return len(presencas_novas)
+
+
+# ==============================================================================
+# RESERVA DE VAGAS (CONCORRÊNCIA)
+# ==============================================================================
+
+def reservar_vaga(aula, aluno, status='PRESENTE'):
+    """
+    Reserva uma vaga na aula de forma atômica.
+    A linha da aula é travada (SELECT ... FOR UPDATE), então duas reservas simultâneas
+    na mesma aula são serializadas e a checagem de lotação é O(1) via `vagas_ocupadas`.
+
+    Retorna (True, presenca) ou (False, "mensagem de erro").
+    """
+    with transaction.atomic():
+        aula = Aula.objects.select_for_update().get(pk=aula.pk)
+
+        if Presenca.objects.filter(aula=aula, aluno=aluno).exists():
+            return False, "Aluno já está agendado nesta aula."
+
+        if aula.lotada:
+            return False, "Esta aula já está lotada."
+
+        presenca = Presenca.objects.create(aula=aula, aluno=aluno, status=status)
+        Aula.objects.filter(pk=aula.pk).update(vagas_ocupadas=F('vagas_ocupadas') + 1)
+
+    return True, presenca
+
+
+def liberar_vaga(presenca):
+    """Remove a presença; a vaga volta para a aula no post_delete (agenda_fit.signals)."""
+    presenca.delete()
+
+
+def remarcar_presenca(presenca, nova_data, status='AGENDADA'):
+    """
+    Move a presença para a aula do mesmo profissional em `nova_data` (cria a aula se preciso),
+    respeitando a capacidade da aula de destino.
+
+    Retorna (True, presenca) ou (False, "mensagem de erro").
+    """
+    with transaction.atomic():
+        aula_origem = presenca.aula
+        _travar_slots([(nova_data, aula_origem.profissional_id)])
+        nova_aula, _ = Aula.objects.get_or_create(
+            data_hora_inicio=nova_data,
+            profissional=aula_origem.profissional,
+            defaults={
+                'data_hora_fim': nova_data + DURACAO_AULA_PADRAO,
+                'unidade': aula_origem.unidade,
+                'capacidade_maxima': aula_origem.unidade.capacidade_padrao,
+                'status': 'AGENDADA',
+            }
+        )
+        if nova_aula.pk == aula_origem.pk:
+            return True, presenca
+
+        # Trava as duas aulas sempre na mesma ordem para evitar deadlock
+        travadas = {a.pk: a for a in Aula.objects.select_for_update().filter(
+            pk__in=[aula_origem.pk, nova_aula.pk]
+        ).order_by('pk')}
+        nova_aula = travadas[nova_aula.pk]
+
+        if Presenca.objects.filter(aula=nova_aula, aluno_id=presenca.aluno_id).exists():
+            return False, "Aluno já está agendado neste horário."
+        if nova_aula.lotada:
+            return False, "A aula de destino já está lotada."
+
+        Presenca.objects.filter(pk=presenca.pk).update(aula=nova_aula, status=status)
+        Aula.objects.filter(pk=nova_aula.pk).update(vagas_ocupadas=F('vagas_ocupadas') + 1)
+        Aula.objects.filter(pk=aula_origem.pk, vagas_ocupadas__gt=0).update(vagas_ocupadas=F('vagas_ocupadas') - 1)
+        marcar_para_recalculo(aula_ids={aula_origem.pk, nova_aula.pk})
+
+    presenca.aula = nova_aula
+    presenca.status = status
+    return True, presenca
+
+
+def recalcular_ocupacao(aula_ids=None):
+    """
+    Recalcula `vagas_ocupadas` a partir das presenças (um único UPDATE).
+    Usado no admin, onde as presenças são editadas direto, e na conferência
+    periódica (manage.py recalcular_ocupacao_agenda).
+    """
+    contagem = Presenca.objects.filter(aula=OuterRef('pk')).order_by().values('aula').annotate(c=Count('id')).values('c')
+    qs = Aula.objects.all()
+    if aula_ids is not None:
+        qs = qs.filter(pk__in=aula_ids)
+    return qs.update(vagas_ocupadas=Coalesce(Subquery(contagem), 0))
+
+
+def agendar_aluno_em_slots(aluno, unidade, slots, capacidade=None, agora=None):
+    """Atalho do agendar_em_lote para um único aluno."""
+    return agendar_em_lote(
+        [(aluno.id, unidade.id, inicio, prof_id) for inicio, prof_id in slots],
+        capacidade=capacidade,
+        agora=agora,
+    )
+
+
+def gerar_agenda_contrato(contrato, data_inicio=None, capacidade=None):
+    """Gera a agenda completa de um contrato a partir da grade fixa."""
+    horarios = list(contrato.horarios_fixos.all())
+    if not horarios:
+        return 0
+
+    slots = expandir_horarios(horarios, data_inicio or contrato.data_inicio, contrato.data_fim)
+    return agendar_aluno_em_slots(contrato.aluno, contrato.unidade, slots, capacidade=capacidade)
+
+
+# ==============================================================================
+# MATERIALIZADOR DIÁRIO (HORIZONTE ROLANTE)
+# ==============================================================================
+
+def materializar_agenda(hoje=None, dias=30):
+    """
+    Gera apenas os dias que ainda não foram materializados, para todos os contratos
+    vigentes do schema atual.
+
+    Cada contrato guarda em `agenda_gerada_ate` até onde a agenda já existe;
+    a janela desta execução vai do dia seguinte a essa marca até hoje + `dias`.
+    Cada contrato é gravado na sua própria transação: as travas das aulas duram
+    só o lote daquele aluno, sem segurar a agenda inteira contra as reservas.
+    Retorna (contratos_processados, presencas_criadas).
+    """
+    from contratos_fit.models import Contrato
+
+    hoje = hoje or timezone.localdate()
+    horizonte = hoje + timedelta(days=dias)
+
+    contratos = list(
+        Contrato.objects.filter(data_fim__gte=hoje)
+        .exclude(status__in=['CANCELADO', 'ENCERRADO'])
+        .filter(Q(agenda_gerada_ate__isnull=True) | Q(agenda_gerada_ate__lt=horizonte))
+        .prefetch_related('horarios_fixos')
+    )
+
+    processados = 0
+    criadas = 0
+    for contrato in contratos:
+        inicio = contrato.data_inicio
+        if contrato.agenda_gerada_ate:
+            inicio = contrato.agenda_gerada_ate + timedelta(days=1)
+        inicio = max(inicio, hoje)
+        fim = min(horizonte, contrato.data_fim)
+        if inicio > fim:
+            continue
+
+        pedidos = [
+            (contrato.aluno_id, contrato.unidade_id, slot_inicio, prof_id)
+            for slot_inicio, prof_id in expandir_horarios(contrato.horarios_fixos.all(), inicio, fim)
+        ]
+
+        with transaction.atomic():
+            criadas += agendar_em_lote(pedidos)
+            Contrato.objects.filter(pk=contrato.pk).update(agenda_gerada_ate=fim)
+        processados += 1
+
+    return processados, criadas
@@ -0,0 +1,150 @@
+import threading
+from collections import defaultdict
+from datetime import date
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from core.periodos import filtro_periodo, limites_mes
+from .models import Aula, Presenca, ResumoAgendaMensal
+
+# ==============================================================================
+# CONSOLIDADO MENSAL DA AGENDA (ResumoAgendaMensal)
+# ==============================================================================
+# Cada mudança em Aula/Presença marca o "balde" (mês, profissional) como sujo.
+# No commit, só esses baldes são recalculados a partir da origem, com consultas
+# por intervalo que usam os índices. Recalcular é idempotente, então não existe
+# risco de o contador "andar errado" como aconteceria somando deltas.
+
+_pendentes = threading.local()
+
+
+def mes_de(data_hora):
+    """Primeiro dia do mês de um datetime, no fuso do tenant."""
+    local = timezone.localtime(data_hora)
+    return date(local.year, local.month, 1)
+
+
+def marcar_para_recalculo(pares=(), aula_ids=()):
+    """
+    Agenda o recálculo dos baldes (mes, profissional_id) para depois do commit.
+    `aula_ids` é resolvido para baldes no próprio commit, numa query só
+    (assim os sinais de Presença não precisam buscar a aula um por um).
+    Baldes repetidos dentro da mesma transação são recalculados uma vez só.
+    """
+    pares, aula_ids = set(pares), set(aula_ids)
+    if not pares and not aula_ids:
+        return
+
+    # Separado por schema, para uma transação desfeita não vazar baldes para outro tenant
+    if not hasattr(_pendentes, 'por_schema'):
+        _pendentes.por_schema = {}
+    schema = getattr(connection, 'schema_name', None)
+    pendente = _pendentes.por_schema.setdefault(schema, {'pares': set(), 'aula_ids': set()})
+    pendente['pares'].update(pares)
+    pendente['aula_ids'].update(aula_ids)
+
+    transaction.on_commit(lambda: _descarregar(schema))
+
+
+def _descarregar(schema):
+    pendente = _pendentes.por_schema.pop(schema, None)
+    if not pendente:
+        return
+
+    pares = pendente['pares']
+    if pendente['aula_ids']:
+        for inicio, prof_id in Aula.objects.filter(id__in=pendente['aula_ids']).values_list('data_hora_inicio', 'profissional_id'):
+            pares.add((mes_de(inicio), prof_id))
+    if pares:
+        recalcular_resumo(pares)
+
+
+def _travar_baldes(pares):
+    """
+    Trava de transação (advisory lock) por balde: dois recálculos do mesmo balde
+    em paralelo (commits simultâneos) rodam um depois do outro, em vez de os dois
+    apagarem e inserirem as mesmas linhas. Ordenado para não haver deadlock.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    schema = getattr(connection, 'schema_name', 'public')
+    chaves = sorted(f"resumo_agenda:{schema}:{mes:%Y-%m}:{prof_id}" for mes, prof_id in pares)
+    with connection.cursor() as cursor:
+        for chave in chaves:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [chave])
+
+
+def recalcular_resumo(pares):
+    """Recalcula os baldes (mes, profissional_id) informados a partir de Aula/Presença."""
+    por_mes = defaultdict(set)
+    for mes, prof_id in pares:
+        por_mes[mes].add(prof_id)
+
+    with transaction.atomic():
+        _travar_baldes(pares)
+        for mes, profs in por_mes.items():
+            filtro_prof = Q(profissional_id__in=[p for p in profs if p is not None])
+            if None in profs:
+                filtro_prof |= Q(profissional__isnull=True)
+
+            ResumoAgendaMensal.objects.filter(filtro_prof, mes=mes).delete()
+
+            periodo = filtro_periodo('data_hora_inicio', *limites_mes(mes.year, mes.month))
+            aulas = Aula.objects.filter(periodo, filtro_prof).order_by()
+            presencas = Presenca.objects.filter(aula__in=aulas.values('id')).order_by()
+
+            ResumoAgendaMensal.objects.bulk_create(_montar_linhas(
+                aulas.values('profissional_id', 'status').annotate(
+                    total=Count('id'), capacidade=Sum('capacidade_maxima')
+                ),
+                presencas.values('aula__profissional_id', 'aula__status', 'status').annotate(total=Count('id')),
+                mes_fixo=mes,
+            ))
+
+
+def reconstruir_resumo():
+    """Refaz o consolidado inteiro do schema atual (backfill)."""
+    aulas = Aula.objects.annotate(mes=TruncMonth('data_hora_inicio')).order_by()
+    presencas = Presenca.objects.annotate(mes=TruncMonth('aula__data_hora_inicio')).order_by()
+
+    with transaction.atomic():
+        ResumoAgendaMensal.objects.all().delete()
+        linhas = _montar_linhas(
+            aulas.values('mes', 'profissional_id', 'status').annotate(
+                total=Count('id'), capacidade=Sum('capacidade_maxima')
+            ),
+            presencas.values('mes', 'aula__profissional_id', 'aula__status', 'status').annotate(total=Count('id')),
+        )
+        ResumoAgendaMensal.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+def _montar_linhas(grupos_aulas, grupos_presencas, mes_fixo=None):
+    def chave_mes(valor):
+        return mes_fixo or date(valor.year, valor.month, 1)
+
+    linhas = {}
+
+    def linha(mes, prof_id, status):
+        chave = (mes, prof_id, status)
+        if chave not in linhas:
+            linhas[chave] = ResumoAgendaMensal(mes=mes, profissional_id=prof_id, status=status)
+        return linhas[chave]
+
+    for g in grupos_aulas:
+        r = linha(chave_mes(g.get('mes')), g['profissional_id'], g['status'])
+        r.aulas = g['total']
+        r.vagas = g['capacidade'] or 0
+
+    for g in grupos_presencas:
+        r = linha(chave_mes(g.get('mes')), g['aula__profissional_id'], g['aula__status'])
+        r.presencas += g['total']
+        if g['status'] == 'PRESENTE':
+            r.presentes += g['total']
+        elif g['status'] == 'FALTA':
+            r.faltas += g['total']
+        elif g['status'] == 'FALTA_JUSTIFICADA':
+            r.faltas_justificadas += g['total']
+
+    return list(linhas.values())
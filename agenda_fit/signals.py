@@ -0,0 +1,53 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Aula, Presenca
+from .services_resumo import marcar_para_recalculo, mes_de
+
+
+# ==============================================================================
+# CONSOLIDADO MENSAL: marca os baldes afetados por cada mudança
+# ==============================================================================
+
+@receiver(pre_save, sender=Aula)
+def guardar_balde_anterior(sender, instance, raw=False, **kwargs):
+    """Se a aula mudou de mês/profissional, o balde antigo também precisa ser recalculado."""
+    instance._balde_anterior = None
+    if instance.pk and not raw:
+        anterior = Aula.objects.filter(pk=instance.pk).values_list('data_hora_inicio', 'profissional_id').first()
+        if anterior:
+            instance._balde_anterior = (mes_de(anterior[0]), anterior[1])
+
+
+@receiver(post_save, sender=Aula)
+def aula_salva(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    pares = {(mes_de(instance.data_hora_inicio), instance.profissional_id)}
+    if getattr(instance, '_balde_anterior', None):
+        pares.add(instance._balde_anterior)
+    marcar_para_recalculo(pares)
+
+
+@receiver(post_delete, sender=Aula)
+def aula_removida(sender, instance, **kwargs):
+    marcar_para_recalculo({(mes_de(instance.data_hora_inicio), instance.profissional_id)})
+
+
+@receiver(post_save, sender=Presenca)
+@receiver(post_delete, sender=Presenca)
+def presenca_alterada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    marcar_para_recalculo(aula_ids={instance.aula_id})
+
+
+# ==============================================================================
+# CONTADOR DE VAGAS: qualquer remoção de presença devolve a vaga
+# ==============================================================================
+# Cobre liberar_vaga, exclusões em cascata (Aluno, Contrato), admin e
+# queryset.delete() — o Django dispara post_delete por objeto quando há receiver.
+
+@receiver(post_delete, sender=Presenca)
+def presenca_removida(sender, instance, **kwargs):
+    Aula.objects.filter(pk=instance.aula_id, vagas_ocupadas__gt=0).update(vagas_ocupadas=F('vagas_ocupadas') - 1)
@@ -1,3 +1,75 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from agenda_fit.models import Aula, Presenca
+from agenda_fit.views import API_KEY_N8N, api_agenda_amanha
+from cadastros_fit.models import Aluno, Profissional, Unidade
+from core.periodos import filtro_periodo, limites_dia, limites_mes
 
-# Create your tests here.
+
+class PeriodosTests(SimpleTestCase):
+    def test_limites_mes_vira_o_ano_em_dezembro(self):
+        self.assertEqual(limites_mes(2025, 12), (date(2025, 12, 1), date(2026, 1, 1)))
+
+    def test_filtro_periodo_usa_meia_noite_no_fuso_do_tenant(self):
+        filtro = dict(filtro_periodo('data_hora_inicio', *limites_dia(date(2026, 3, 10))).children)
+        inicio, fim = filtro['data_hora_inicio__gte'], filtro['data_hora_inicio__lt']
+        self.assertTrue(timezone.is_aware(inicio))
+        self.assertEqual(timezone.localtime(inicio).time(), time.min)
+        self.assertEqual(fim - inicio, timedelta(days=1))
+
+
+class IndicesAgendaTests(TenantTestCase):
+    """
+    Os filtros de período das telas da agenda precisam virar intervalos que usam
+    os índices de Aula (migração 0004). O seqscan é desligado só para o planner
+    não preferir a varredura sequencial só porque a tabela de teste é pequena.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.amanha = timezone.localdate() + timedelta(days=1)
+        self.unidade = Unidade.objects.create(nome='Centro')
+        usuario = get_user_model().objects.create_user(username='prof_teste_indices', password='x')
+        self.profissional = Profissional.objects.create(
+            user=usuario, nome='Prof Teste', cpf='000.000.000-00', email='prof@teste.com'
+        )
+        alunos = [Aluno.objects.create(nome=f'Aluno {i}') for i in range(3)]
+        for hora in (8, 9, 10):
+            inicio = timezone.make_aware(datetime.combine(self.amanha, time(hora)))
+            aula = Aula.objects.create(
+                unidade=self.unidade, profissional=self.profissional,
+                data_hora_inicio=inicio, data_hora_fim=inicio + timedelta(hours=1),
+            )
+            for aluno in alunos:
+                Presenca.objects.create(aula=aula, aluno=aluno, status='PRESENTE')
+
+    def explicar(self, qs):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            return qs.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def test_filtro_do_dia_usa_indice_de_inicio(self):
+        plano = self.explicar(Aula.objects.filter(filtro_periodo('data_hora_inicio', *limites_dia(self.amanha))))
+        self.assertIn('aula_inicio_prof_idx', plano)
+
+    def test_filtro_do_mes_por_status_usa_indice_de_status(self):
+        qs = Aula.objects.filter(
+            filtro_periodo('data_hora_inicio', *limites_mes(self.amanha.year, self.amanha.month)),
+            status='AGENDADA',
+        )
+        self.assertIn('aula_status_inicio_idx', self.explicar(qs))
+
+    def test_agenda_de_amanha_tem_numero_fixo_de_queries(self):
+        """1 query das aulas (com o profissional) + 2 do prefetch, independente do número de aulas."""
+        request = RequestFactory().get('/', HTTP_X_API_KEY=API_KEY_N8N)
+        with self.assertNumQueries(3):
+            response = api_agenda_amanha(request)
+        self.assertEqual(response.status_code, 200)
@@ -7,25 +7,24 @@ from django.views.generic import ListView, UpdateView
 from django.urls import reverse_lazy
 from django.http import JsonResponse
 from django.contrib import messages
-from django.utils.dateparse import parse_datetime
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime
 from cadastros_fit.models import Profissional
 from django.db.models import Count, Q
 from django.db.models.functions import TruncMonth
-import calendar
-from django.db.models.functions import ExtractMonth
 from django.views.generic import TemplateView
 
 # Imports Locais
 from cadastros_fit.models import Aluno
-from .models import Aula, Presenca, ConfiguracaoIntegracao
+from core.periodos import filtro_periodo, inicio_do_dia, limites_ano, limites_dia, limites_intervalo, limites_mes
+from .models import Aula, Presenca, ConfiguracaoIntegracao, ResumoAgendaMensal
+from .services import liberar_vaga, remarcar_presenca
 from .forms import IntegracaoForm
 
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Count
-from django.db.models.functions import ExtractMonth
 from django.utils import timezone
-import calendar
 from .models import Aula, Presenca
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Count, Q, Sum
@@ -69,8 +68,7 @@ def calendario_semanal(request):
     # 3. PRESENÇAS BASE
     # =========================================================
     presencas = Presenca.objects.filter(
-        aula__data_hora_inicio__date__gte=inicio_semana,
-        aula__data_hora_inicio__date__lte=fim_semana
+        filtro_periodo('aula__data_hora_inicio', *limites_intervalo(inicio_semana, fim_semana))
     ).select_related(
         'aula',
         'aluno',
@@ -111,7 +109,7 @@ def calendario_semanal(request):
         })
 
     for p in presencas:
-        grade_semanal[p.aula.data_hora_inicio.weekday()].append(p)
+        grade_semanal[timezone.localtime(p.aula.data_hora_inicio).weekday()].append(p)
 
     # =========================================================
     # 7. CONTEXTO FINAL
@@ -145,7 +143,7 @@ def confirmar_presenca(request, pk):
 def cancelar_presenca(request, pk):
     p = get_object_or_404(Presenca, pk=pk)
     # Remove a presença (libera vaga)
-    p.delete()
+    liberar_vaga(p)
     messages.warning(request, "Agendamento cancelado.")
     return redirect(request.META.get('HTTP_REFERER', 'calendario_semanal'))
 
@@ -155,27 +153,18 @@ def remarcar_aula(request, pk):
     
     if request.method == 'POST':
         nova_data_str = request.POST.get('nova_data')
-        if nova_data_str:
-            nova_data = parse_datetime(nova_data_str)
+        nova_data = parse_datetime(nova_data_str) if nova_data_str else None
+        if nova_data:
+            if timezone.is_naive(nova_data):
+                nova_data = timezone.make_aware(nova_data)
             
-            # Cria nova aula ou usa existente
-            nova_aula, created = Aula.objects.get_or_create(
-                data_hora_inicio=nova_data,
-                # Assume 1h
-                data_hora_fim=nova_data + timedelta(hours=1),
-                profissional=presenca.aula.profissional,
-                defaults={
-                    'unidade': presenca.aula.unidade, # Ajuste se precisar de tenant
-                    'status': 'AGENDADA'
-                }
-            )
+            # Cria nova aula ou usa existente e move o aluno (reseta status se estava com falta)
+            sucesso, resultado = remarcar_presenca(presenca, nova_data)
             
-            # Move o aluno
-            presenca.aula = nova_aula
-            presenca.status = 'AGENDADA' # Reseta status se estava com falta
-            presenca.save()
-            
-            messages.success(request, f"Remarcado para {nova_data.strftime('%d/%m %H:%M')}")
+            if sucesso:
+                messages.success(request, f"Remarcado para {timezone.localtime(nova_data).strftime('%d/%m %H:%M')}")
+            else:
+                messages.error(request, resultado)
         else:
             messages.error(request, "Data inválida")
             
@@ -187,34 +176,36 @@ def gerenciar_aula(request, aula_id):
     aula = get_object_or_404(Aula, id=aula_id)
     
     if request.method == 'POST':
-        # 1. Processa as Presenças PRIMEIRO para saber se alguém veio
-        teve_presenca = False
+        # Uma transação só: o consolidado mensal é recalculado uma vez, no commit
+        with transaction.atomic():
+            # 1. Processa as Presenças PRIMEIRO para saber se alguém veio
+            teve_presenca = False
         
-        for presenca in aula.presencas.all():
-            key = f"status_{presenca.id}"
-            novo_status = request.POST.get(key)
+            for presenca in aula.presencas.all():
+                key = f"status_{presenca.id}"
+                novo_status = request.POST.get(key)
             
-            if novo_status:
-                presenca.status = novo_status
-                presenca.save()
+                if novo_status:
+                    presenca.status = novo_status
+                    presenca.save()
                 
-                # Verifica se pelo menos um aluno está presente
-                if novo_status == 'PRESENTE':
-                    teve_presenca = True
-
-        # 2. Atualiza o Status da Aula
-        # Só marca como REALIZADA se houve presença confirmada
-        if teve_presenca:
-            aula.status = 'REALIZADA'
-        else:
-            # Se todos faltaram, a aula não foi "Realizada" tecnicamente
-            # Mantemos como estava (AGENDADA) ou mudamos para CANCELADA se preferir
-            # Por enquanto, vou manter como estava para não sumir da tela
-            pass
-
-        # 3. Salva a Evolução
-        aula.evolucao_texto = request.POST.get('evolucao_texto')
-        aula.save()
+                    # Verifica se pelo menos um aluno está presente
+                    if novo_status == 'PRESENTE':
+                        teve_presenca = True
+
+            # 2. Atualiza o Status da Aula
+            # Só marca como REALIZADA se houve presença confirmada
+            if teve_presenca:
+                aula.status = 'REALIZADA'
+            else:
+                # Se todos faltaram, a aula não foi "Realizada" tecnicamente
+                # Mantemos como estava (AGENDADA) ou mudamos para CANCELADA se preferir
+                # Por enquanto, vou manter como estava para não sumir da tela
+                pass
+
+            # 3. Salva a Evolução
+            aula.evolucao_texto = request.POST.get('evolucao_texto')
+            aula.save()
         
         messages.success(request, "Chamada salva com sucesso!")
         return redirect('calendario_semanal')
@@ -257,10 +248,12 @@ class RelatorioFrequenciaView(LoginRequiredMixin, ListView):
 
         if aluno_id:
             queryset = queryset.filter(aluno_id=aluno_id)
+        data_inicio = parse_date(data_inicio) if data_inicio else None
+        data_fim = parse_date(data_fim) if data_fim else None
         if data_inicio:
-            queryset = queryset.filter(aula__data_hora_inicio__date__gte=data_inicio)
+            queryset = queryset.filter(aula__data_hora_inicio__gte=inicio_do_dia(data_inicio))
         if data_fim:
-            queryset = queryset.filter(aula__data_hora_inicio__date__lte=data_fim)
+            queryset = queryset.filter(aula__data_hora_inicio__lt=inicio_do_dia(data_fim + timedelta(days=1)))
         if status:
             queryset = queryset.filter(status=status)
 
@@ -306,26 +299,25 @@ class DashboardAulasView(LoginRequiredMixin, TemplateView):
             ano = hoje.year
             mes = hoje.month
         
-        _, last_day = calendar.monthrange(ano, mes)
-        inicio_mes = timezone.datetime(ano, mes, 1).date()
-        fim_mes = timezone.datetime(ano, mes, last_day).date()
+        periodo_mes = limites_mes(ano, mes)
         
         context['ano_atual'] = ano
         context['mes_atual'] = mes
         context['anos_select'] = range(hoje.year - 2, hoje.year + 3)
 
         # --- GRÁFICO 1: AULAS POR PROFISSIONAL (ANUAL) ---
-        aulas_ano = Aula.objects.filter(
-            data_hora_inicio__year=ano,
-            status='REALIZADA'
-        ).annotate(mes=ExtractMonth('data_hora_inicio')) \
+        # Lidos do consolidado mensal: no máximo 12 x profissionais x status linhas por ano
+        resumo_ano = ResumoAgendaMensal.objects.filter(
+            filtro_periodo('mes', *limites_ano(ano), com_hora=False)
+        )
+        aulas_ano = resumo_ano.filter(status='REALIZADA') \
          .values('mes', 'profissional__nome') \
-         .annotate(total=Count('id'))
+         .annotate(total=Sum('aulas'))
         
         dados_profs = {}
         for item in aulas_ano:
             nome = item['profissional__nome'] or "Sem Prof."
-            mes_idx = item['mes'] - 1
+            mes_idx = item['mes'].month - 1
             if nome not in dados_profs:
                 dados_profs[nome] = [0] * 12
             dados_profs[nome][mes_idx] = item['total']
@@ -347,38 +339,34 @@ class DashboardAulasView(LoginRequiredMixin, TemplateView):
         context['chart_prof_datasets'] = datasets_prof
 
         # --- GRÁFICO 2: FREQUÊNCIA (PRESENÇAS vs FALTAS - ANUAL) ---
-        frequencia_ano = Presenca.objects.filter(
-            aula__data_hora_inicio__year=ano
-        ).annotate(mes=ExtractMonth('aula__data_hora_inicio')) \
-         .values('mes', 'status') \
-         .annotate(total=Count('id'))
+        frequencia_ano = resumo_ano.values('mes').annotate(
+            presentes=Sum('presentes'), faltas=Sum('faltas')
+        )
          
         data_presente = [0] * 12
         data_falta = [0] * 12
         
         for item in frequencia_ano:
-            idx = item['mes'] - 1
-            if item['status'] == 'PRESENTE':
-                data_presente[idx] = item['total']
-            elif item['status'] == 'FALTA':
-                data_falta[idx] = item['total']
+            idx = item['mes'].month - 1
+            data_presente[idx] = item['presentes']
+            data_falta[idx] = item['faltas']
         
         context['chart_presente'] = data_presente
         context['chart_falta'] = data_falta
 
         # --- INDICADORES MENSAIS ---
         context['aulas_restantes'] = Aula.objects.filter(
-            data_hora_inicio__date__range=[timezone.now().date(), fim_mes],
+            filtro_periodo('data_hora_inicio', timezone.localdate(), periodo_mes[1]),
             status='AGENDADA'
         ).count()
 
         context['top_assiduos'] = Presenca.objects.filter(
-            aula__data_hora_inicio__date__range=[inicio_mes, fim_mes],
+            filtro_periodo('aula__data_hora_inicio', *periodo_mes),
             status='PRESENTE'
         ).values('aluno__nome').annotate(total=Count('id')).order_by('-total')[:5]
 
         context['top_faltosos'] = Presenca.objects.filter(
-            aula__data_hora_inicio__date__range=[inicio_mes, fim_mes],
+            filtro_periodo('aula__data_hora_inicio', *periodo_mes),
             status='FALTA'
         ).values('aluno__nome').annotate(total=Count('id')).order_by('-total')[:5]
 
@@ -390,10 +378,10 @@ def api_agenda_amanha(request):
     if token != API_KEY_N8N:
         return JsonResponse({'erro': 'Acesso negado'}, status=403)
 
-    amanha = timezone.now().date() + timedelta(days=1)
+    amanha = timezone.localdate() + timedelta(days=1)
     
     aulas = Aula.objects.filter(
-        data_hora_inicio__date=amanha
+        filtro_periodo('data_hora_inicio', *limites_dia(amanha))
     ).exclude(status='CANCELADA').select_related('profissional').prefetch_related('presencas__aluno')
 
     dados_envio = {}
@@ -414,7 +402,7 @@ def api_agenda_amanha(request):
         if not alunos_lista: alunos_lista = ["Vaga livre"]
 
         dados_envio[prof.id]["aulas"].append({
-            "horario": aula.data_hora_inicio.strftime('%H:%M'),
+            "horario": timezone.localtime(aula.data_hora_inicio).strftime('%H:%M'),
             "alunos": ", ".join(alunos_lista)
         })
 
@@ -430,30 +418,35 @@ def performance_aulas(request):
     prof_id = request.GET.get('prof_id')
 
     # 2. Base de Filtro para Aulas e Presenças
-    filtros_aula = Q(data_hora_inicio__month=mes_sel, data_hora_inicio__year=ano_sel)
-    filtros_presenca = Q(aula__data_hora_inicio__month=mes_sel, aula__data_hora_inicio__year=ano_sel)
+    periodo = limites_mes(ano_sel, mes_sel)
+    filtros_presenca = filtro_periodo('aula__data_hora_inicio', *periodo)
 
     if prof_id and prof_id != 'all':
-        filtros_aula &= Q(profissional_id=prof_id)
         filtros_presenca &= Q(aula__profissional_id=prof_id)
 
-    # 3. Cálculo de KPIs
-    aulas_realizadas = Aula.objects.filter(filtros_aula, status='REALIZADA').count()
+    # 3. Cálculo de KPIs (lidos do consolidado mensal)
+    resumo = ResumoAgendaMensal.objects.filter(mes=periodo[0])
+    if prof_id and prof_id != 'all':
+        resumo = resumo.filter(profissional_id=prof_id)
 
-    # Ocupação: Presenças vs Vagas
-    dados_ocupacao = Aula.objects.filter(filtros_aula, status='REALIZADA').aggregate(
-        total_vagas=Sum('capacidade_maxima'),
-        total_presencas=Count('presencas', filter=Q(presencas__status='PRESENTE'))
+    dados_ocupacao = resumo.aggregate(
+        aulas_realizadas=Sum('aulas', filter=Q(status='REALIZADA')),
+        total_vagas=Sum('vagas', filter=Q(status='REALIZADA')),
+        total_presencas=Sum('presentes', filter=Q(status='REALIZADA')),
+        faltas=Sum('faltas'),
     )
+    aulas_realizadas = dados_ocupacao['aulas_realizadas'] or 0
+
+    # Ocupação: Presenças vs Vagas
     vagas = dados_ocupacao['total_vagas'] or 1
     presencas = dados_ocupacao['total_presencas'] or 0
     taxa_ocupacao = round((presencas / vagas) * 100)
 
     # Faltas
-    faltas_mes = Presenca.objects.filter(filtros_presenca, status='FALTA').count()
+    faltas_mes = dados_ocupacao['faltas'] or 0
 
     # Novos Alunos (Geral do Studio no período)
-    novos_alunos = Aluno.objects.filter(criado_em__month=mes_sel, criado_em__year=ano_sel).count()
+    novos_alunos = Aluno.objects.filter(filtro_periodo('criado_em', *periodo)).count()
 
     # 4. Top Alunos (Ranking Real)
     top_alunos = Presenca.objects.filter(filtros_presenca, status='PRESENTE').values(
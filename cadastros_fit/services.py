@@ -2,18 +2,30 @@ import google.generativeai as genai
 from django.conf import settings
 import json
 from PIL import Image
+from core.cache_extracao import CacheExtracao, hash_imagem
 
 # Configura a API Key (Garante que está no settings)
 genai.configure(api_key=settings.GOOGLE_API_KEY)
 
 class OCRService:
+    MODELO = 'gemini-2.0-flash'
+    # Mude a versão quando o prompt correspondente mudar (invalida o cache de extrações)
+    VERSAO_PROMPT_IDENTIDADE = 'identidade-v1'
+    VERSAO_PROMPT_ENDERECO = 'endereco-v1'
+
+    @staticmethod
+    def _extrair_com_cache(img, versao_prompt, extrair):
+        """O mesmo documento reenviado sai do cache do tenant, sem chamar a API."""
+        cache = CacheExtracao.do_tenant()
+        chave = cache.chave(hash_imagem(img), versao_prompt, OCRService.MODELO)
+        return cache.obter_ou_extrair(chave, extrair)
     
     @staticmethod
     def extrair_dados_identidade(imagem_path_ou_file):
         """
         Lê CNH ou RG e retorna JSON com: nome, cpf, data_nascimento.
         """
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = genai.GenerativeModel(OCRService.MODELO)
         
         # Prepara a imagem para o Gemini
         img = Image.open(imagem_path_ou_file)
@@ -31,20 +43,23 @@ class OCRService:
         Se não encontrar algum dado, deixe null.
         """
         
-        try:
-            response = model.generate_content([prompt, img])
-            texto_limpo = response.text.replace('```json', '').replace('```', '').strip()
-            return json.loads(texto_limpo)
-        except Exception as e:
-            print(f"Erro OCR Identidade: {e}")
-            return {"erro": "Falha ao ler documento"}
+        def extrair():
+            try:
+                response = model.generate_content([prompt, img])
+                texto_limpo = response.text.replace('```json', '').replace('```', '').strip()
+                return json.loads(texto_limpo)
+            except Exception as e:
+                print(f"Erro OCR Identidade: {e}")
+                return {"erro": "Falha ao ler documento"}
+
+        return OCRService._extrair_com_cache(img, OCRService.VERSAO_PROMPT_IDENTIDADE, extrair)
 
     @staticmethod
     def extrair_dados_endereco(imagem_path_ou_file):
         """
         Lê conta de luz/água/net e retorna JSON com endereço completo.
         """
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = genai.GenerativeModel(OCRService.MODELO)
         
         img = Image.open(imagem_path_ou_file)
 
@@ -64,10 +79,13 @@ class OCRService:
         Priorize o endereço de instalação ou do cliente.
         """
         
-        try:
-            response = model.generate_content([prompt, img])
-            texto_limpo = response.text.replace('```json', '').replace('```', '').strip()
-            return json.loads(texto_limpo)
-        except Exception as e:
-            print(f"Erro OCR Endereço: {e}")
-            return {"erro": "Falha ao ler comprovante"}
\ No newline at end of file
+        def extrair():
+            try:
+                response = model.generate_content([prompt, img])
+                texto_limpo = response.text.replace('```json', '').replace('```', '').strip()
+                return json.loads(texto_limpo)
+            except Exception as e:
+                print(f"Erro OCR Endereço: {e}")
+                return {"erro": "Falha ao ler comprovante"}
+
+        return OCRService._extrair_com_cache(img, OCRService.VERSAO_PROMPT_ENDERECO, extrair)
\ No newline at end of file
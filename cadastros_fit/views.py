@@ -39,7 +39,11 @@ class AlunoCreateView(LoginRequiredMixin, CreateView):
     form_class = AlunoForm
     template_name = 'cadastros_fit/aluno_form.html'
     success_url = reverse_lazy('aluno_list')
-    # O form_valid manual não é mais necessário (Model sem organização)
+
+    @transaction.atomic
+    def form_valid(self, form):
+        # Aluno e mensagem de boas-vindas (caixa de saída, via signal) na mesma transação
+        return super().form_valid(form)
 
 class AlunoUpdateView(LoginRequiredMixin, UpdateView):
     model = Aluno
@@ -268,7 +272,8 @@ def cobrar_aluno_whatsapp(request, aluno_id):
     """
     Busca o template de cobrança e dispara para o aluno
     """
-    from comunicacao_fit.utils import enviar_mensagem_evolution # Importe aqui para evitar loop
+    from comunicacao_fit.services_envio import enviar_e_registrar # Importe aqui para evitar loop
+    from comunicacao_fit.services_template import compilado_de
     
     aluno = get_object_or_404(Aluno, id=aluno_id)
     
@@ -283,19 +288,13 @@ def cobrar_aluno_whatsapp(request, aluno_id):
         return JsonResponse({'status': 'error', 'message': 'Template de cobrança não configurado.'})
 
     # Substitui as variáveis básicas
-    texto = template.conteudo.replace('[[aluno]]', aluno.nome)
-    # Se você tiver financeiro, pode adicionar aqui: texto = texto.replace('[[valor]]', ...)
+    texto = compilado_de(template).renderizar({'aluno': aluno.nome, 'telefone': aluno.telefone})
+    # Se você tiver financeiro, pode adicionar aqui: 'valor': ...
 
-    # Dispara o envio
-    sucesso, resposta = enviar_mensagem_evolution(request.tenant, aluno.telefone, texto)
-    
-    # Salva o Log
-    LogEnvio.objects.create(
-        organizacao=request.tenant,
-        aluno=aluno,
-        mensagem=texto,
-        status='ENVIADO' if sucesso else f'ERRO: {resposta}'
-    )
+    # Dispara o envio (sessão reaproveitada) e salva o log
+    if not aluno.telefone:
+        return JsonResponse({'status': 'error', 'message': 'Aluno sem telefone cadastrado.'})
+    [(_, sucesso, resposta)] = enviar_e_registrar(request.tenant, [(aluno, texto)])
     
     if sucesso:
         return JsonResponse({'status': 'ok'})
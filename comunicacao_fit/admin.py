@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import ConexaoWhatsapp, TemplateMensagem, LogEnvio
+from django.utils import timezone
+from .models import ConexaoWhatsapp, TemplateMensagem, LogEnvio, MensagemSaida, DisparoRotina
 
 @admin.register(ConexaoWhatsapp)
 class ConexaoWhatsappAdmin(admin.ModelAdmin):
@@ -13,4 +14,24 @@ class TemplateMensagemAdmin(admin.ModelAdmin):
 @admin.register(LogEnvio)
 class LogEnvioAdmin(admin.ModelAdmin):
     list_display = ('aluno', 'status', 'data_hora')
-    readonly_fields = ('data_hora',)
\ No newline at end of file
+    readonly_fields = ('data_hora',)
+
+@admin.register(MensagemSaida)
+class MensagemSaidaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'canal', 'status', 'tentativas', 'proxima_tentativa_em', 'criado_em')
+    list_filter = ('status', 'canal', 'tipo')
+    readonly_fields = ('tentativas', 'ultimo_erro', 'criado_em', 'enviado_em', 'atualizado_em')
+    actions = ['reenfileirar']
+
+    @admin.action(description="Reenviar (volta para a fila com tentativas zeradas)")
+    def reenfileirar(self, request, queryset):
+        total = queryset.filter(status__in=['PENDENTE', 'MORTA']).update(
+            status='PENDENTE', tentativas=0, proxima_tentativa_em=timezone.now()
+        )
+        self.message_user(request, f"{total} mensagens de volta na fila.")
+
+@admin.register(DisparoRotina)
+class DisparoRotinaAdmin(admin.ModelAdmin):
+    list_display = ('aluno', 'gatilho', 'data_referencia', 'status', 'atualizado_em')
+    list_filter = ('gatilho', 'status', 'data_referencia')
+    readonly_fields = ('chave', 'execucao', 'resposta', 'criado_em', 'atualizado_em')
@@ -1,78 +1,45 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import timedelta
-from cadastros_fit.models import Aluno
-from agenda_fit.models import Presenca # Ajuste se o nome do app de agenda for outro
-import requests
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from comunicacao_fit.services_rotinas import GATILHOS_ROTINA, executar_rotinas
 
 class Command(BaseCommand):
-    help = 'Verifica notificações diárias: Aniversários, Lembretes de Aula e Contratos'
+    help = (
+        'Rotinas diárias de WhatsApp em todos os tenants: aniversários e lembretes de aula. '
+        'Pode rodar várias vezes ao dia (ex.: cron de hora em hora): cada template sai a partir '
+        'do seu horário de envio e nenhum aluno recebe a mesma mensagem duas vezes.'
+    )
+    gatilhos = None  # todos
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='Roda só neste tenant')
+        if self.gatilhos is None:
+            parser.add_argument('--gatilho', action='append', choices=list(GATILHOS_ROTINA), help='Roda só estes gatilhos')
+        parser.add_argument('--ignorar-horario', action='store_true', help='Envia mesmo antes do horário de envio do template')
 
     def handle(self, *args, **options):
         self.stdout.write("Iniciando rotina de notificações...")
-        
-        hoje = timezone.now().date()
-        amanha = hoje + timedelta(days=1)
-        
-        # URL do seu n8n (pode ser a mesma do signals)
-        N8N_URL = "https://SEU-LINK-DO-N8N.hooks.n8n.cloud/webhook/comunicacao"
-
-        # ---------------------------------------------------------
-        # 1. ANIVERSARIANTES DO DIA
-        # ---------------------------------------------------------
-        aniversariantes = Aluno.objects.filter(
-            data_nascimento__day=hoje.day, 
-            data_nascimento__month=hoje.month,
-            ativo=True
-        )
-        
-        count_niver = 0
-        for aluno in aniversariantes:
-            if aluno.telefone:
-                payload = {
-                    "tipo": "aniversario",
-                    "nome": aluno.nome,
-                    "telefone": aluno.telefone
-                }
-                requests.post(N8N_URL, json=payload)
-                count_niver += 1
-        
-        self.stdout.write(f"- Aniversariantes enviados: {count_niver}")
+        gatilhos = self.gatilhos or options.get('gatilho')
 
-        # ---------------------------------------------------------
-        # 2. LEMBRETE DE AULA (PARA AMANHÃ)
-        # ---------------------------------------------------------
-        # Busca presenças agendadas para o dia seguinte
-        presencas_amanha = Presenca.objects.filter(
-            aula__data_hora_inicio__date=amanha,
-            aula__status='AGENDADA' # Confirme se o status no seu model é esse mesmo
-        ).select_related('aluno', 'aula', 'aula__profissional')
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
 
-        count_aulas = 0
-        for presenca in presencas_amanha:
-            aluno = presenca.aluno
-            if aluno.telefone:
-                hora_aula = presenca.aula.data_hora_inicio.strftime('%H:%M')
-                prof_nome = presenca.aula.profissional.nome if presenca.aula.profissional else "Instrutor"
-                
-                payload = {
-                    "tipo": "lembrete_aula",
-                    "nome": aluno.nome,
-                    "telefone": aluno.telefone,
-                    "dia": amanha.strftime('%d/%m'),
-                    "horario": hora_aula,
-                    "profissional": prof_nome
-                }
-                requests.post(N8N_URL, json=payload)
-                count_aulas += 1
+        for tenant in tenants:
+            with tenant_context(tenant):
+                try:
+                    resultado = executar_rotinas(gatilhos, respeitar_horario=not options['ignorar_horario'])
+                except Exception as e:
+                    # Um tenant com problema não impede os outros
+                    self.stdout.write(self.style.ERROR(f"[{tenant.schema_name}] Erro na rotina: {e}"))
+                    continue
 
-        self.stdout.write(f"- Lembretes de aula enviados: {count_aulas}")
+            for gatilho, resumo in resultado.items():
+                if resumo is None:
+                    continue
+                estilo = self.style.SUCCESS if not resumo['erros'] else self.style.WARNING
+                self.stdout.write(estilo(
+                    f"[{tenant.schema_name}] {gatilho}: {resumo['enviados']} enviados, "
+                    f"{resumo['erros']} erros, {resumo['ja_enviados']} já enviados antes"
+                ))
 
-        # ---------------------------------------------------------
-        # 3. CONTRATO VENCENDO (Exemplo)
-        # ---------------------------------------------------------
-        # Como não vi o model de Contrato, deixo a lógica preparada:
-        # contratos = Contrato.objects.filter(data_fim=hoje + timedelta(days=5), ativo=True)
-        # ... loop e request post ...
-        
-        self.stdout.write(self.style.SUCCESS("Rotina finalizada com sucesso!"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("Rotina finalizada com sucesso!"))
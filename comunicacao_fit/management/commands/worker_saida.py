@@ -0,0 +1,58 @@
+import time
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from comunicacao_fit.services_saida import drenar_lote, metricas_fila
+
+class Command(BaseCommand):
+    help = (
+        'Worker da caixa de saída: envia em lotes as mensagens pendentes de cada tenant, '
+        'com novas tentativas e descarte (MORTA) quando as tentativas se esgotam.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia as filas e sai (útil em cron)')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera com as filas vazias')
+        parser.add_argument('--metricas', action='store_true', help='Só mostra o tamanho das filas de cada tenant e sai')
+
+    def handle(self, *args, **options):
+        if options['metricas']:
+            self.mostrar_metricas()
+            return
+
+        self.stdout.write('Worker da caixa de saída iniciado.')
+        while True:
+            trabalhou = self.rodar_rodada()
+            if not trabalhou:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+
+    def tenants(self):
+        return get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+
+    def rodar_rodada(self):
+        """Um lote por tenant, para nenhum tenant monopolizar o worker."""
+        trabalhou = False
+        for tenant in self.tenants():
+            with tenant_context(tenant):
+                m = drenar_lote()
+            total = m['enviadas'] + m['reagendadas'] + m['mortas']
+            if not total:
+                continue
+            trabalhou = True
+            estilo = self.style.SUCCESS if not (m['reagendadas'] or m['mortas']) else self.style.WARNING
+            self.stdout.write(estilo(
+                f"[{tenant.schema_name}] {m['enviadas']} enviadas, {m['reagendadas']} reagendadas, "
+                f"{m['mortas']} mortas em {m['segundos']}s"
+            ))
+        return trabalhou
+
+    def mostrar_metricas(self):
+        for tenant in self.tenants():
+            with tenant_context(tenant):
+                m = metricas_fila()
+            self.stdout.write(
+                f"[{tenant.schema_name}] pendentes={m['PENDENTE']} processando={m['PROCESSANDO']} "
+                f"enviadas={m['ENVIADA']} mortas={m['MORTA']} "
+                f"pendência mais antiga={m['idade_pendente_mais_antiga']:.0f}s"
+            )
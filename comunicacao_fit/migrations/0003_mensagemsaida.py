@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comunicacao_fit', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensagemSaida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('canal', models.CharField(choices=[('N8N', 'Webhook n8n')], default='N8N', max_length=10)),
+                ('tipo', models.CharField(help_text='Ex: boas_vindas, aniversario', max_length=30)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('ENVIADA', 'Enviada'), ('MORTA', 'Falhou (tentativas esgotadas)')], default='PENDENTE', max_length=12)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('proxima_tentativa_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Mensagem na Caixa de Saída',
+                'verbose_name_plural': 'Caixa de Saída',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa_em'], name='mensagem_saida_fila_idx')],
+            },
+        ),
+    ]
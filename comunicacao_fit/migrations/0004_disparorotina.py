@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastros_fit', '0001_initial'),
+        ('comunicacao_fit', '0003_mensagemsaida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisparoRotina',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=120, unique=True)),
+                ('gatilho', models.CharField(choices=[('AULA_AMANHA', 'Confirmação de Aula (Dia Anterior)'), ('ANIVERSARIO', 'Aniversário do Aluno'), ('COBRANCA', 'Cobrança Manual (Botão)'), ('BOAS_VINDAS', 'Boas-vindas (Novo Aluno)')], max_length=30)),
+                ('data_referencia', models.DateField()),
+                ('status', models.CharField(choices=[('RESERVADO', 'Reservado (envio em andamento)'), ('ENVIADO', 'Enviado'), ('ERRO', 'Erro')], default='RESERVADO', max_length=12)),
+                ('execucao', models.CharField(max_length=32)),
+                ('resposta', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('aluno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cadastros_fit.aluno')),
+            ],
+            options={
+                'verbose_name': 'Disparo de Rotina',
+                'verbose_name_plural': 'Disparos de Rotinas',
+                'indexes': [models.Index(fields=['gatilho', 'data_referencia'], name='disparo_gatilho_data_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comunicacao_fit', '0004_disparorotina'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='templatemensagem',
+            name='versao',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='templatemensagem',
+            name='conteudo',
+            field=models.TextField(help_text='Variáveis: [[aluno]], [[telefone]], [[data]], [[horario]], [[unidade]], [[profissional]], [[valor]]'),
+        ),
+    ]
@@ -1,6 +1,9 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from core.models import Organizacao
 from cadastros_fit.models import Aluno
+from .services_template import variaveis_invalidas
 
 class ConexaoWhatsapp(models.Model):
     """Configuração técnica da Evolution API"""
@@ -28,21 +31,112 @@ class TemplateMensagem(models.Model):
     
     # É aqui que você escreve a mensagem no sistema
     conteudo = models.TextField(
-        help_text="Variáveis: [[aluno]], [[data]], [[horario]], [[valor]]"
+        help_text="Variáveis: [[aluno]], [[telefone]], [[data]], [[horario]], [[unidade]], [[profissional]], [[valor]]"
     )
     
     # Agendamento de horário
     horario_envio = models.TimeField(null=True, blank=True, help_text="Para mensagens automáticas")
     
     ativo = models.BooleanField(default=True)
+    # Incrementada a cada save: invalida a versão compilada em cache (services_template)
+    versao = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return f"{self.titulo} ({self.get_gatilho_display()})"
 
+    def clean(self):
+        invalidas = variaveis_invalidas(self.conteudo or '', self.gatilho)
+        if invalidas:
+            raise ValidationError({'conteudo': (
+                f"Variáveis não disponíveis para '{self.get_gatilho_display()}': "
+                + ", ".join(f"[[{nome}]]" for nome in invalidas)
+            )})
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            self.versao += 1
+        super().save(*args, **kwargs)
+
 class LogEnvio(models.Model):
     """Histórico de tudo que foi enviado"""
     organizacao = models.ForeignKey(Organizacao, on_delete=models.CASCADE)
     aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE)
     mensagem = models.TextField()
     status = models.CharField(max_length=20) # Enviado, Erro
-    data_hora = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    data_hora = models.DateTimeField(auto_now_add=True)
+
+# ==============================================================================
+# CAIXA DE SAÍDA (OUTBOX)
+# ==============================================================================
+# Quem gera a mensagem (ex.: o sinal de aluno novo) só grava uma linha aqui, na
+# mesma transação da mudança que a originou: sem chamada de rede nem thread no
+# caminho do cadastro. O worker (manage.py worker_saida) envia em lotes, repete
+# com backoff e, esgotadas as tentativas, marca a mensagem como MORTA para
+# análise/reenvio pelo admin.
+
+class MensagemSaida(models.Model):
+    CANAL_CHOICES = [
+        ('N8N', 'Webhook n8n'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('ENVIADA', 'Enviada'),
+        ('MORTA', 'Falhou (tentativas esgotadas)'),
+    ]
+
+    canal = models.CharField(max_length=10, choices=CANAL_CHOICES, default='N8N')
+    tipo = models.CharField(max_length=30, help_text="Ex: boas_vindas, aniversario")
+    payload = models.JSONField()
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='PENDENTE')
+
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa_em = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+    # Reivindicação do worker: PROCESSANDO parado há muito tempo é de um worker que morreu
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Mensagem na Caixa de Saída"
+        verbose_name_plural = "Caixa de Saída"
+        ordering = ['-criado_em']
+        indexes = [models.Index(fields=['status', 'proxima_tentativa_em'], name='mensagem_saida_fila_idx')]
+
+    def __str__(self):
+        return f"{self.tipo} via {self.canal} ({self.get_status_display()})"
+
+
+class DisparoRotina(models.Model):
+    """
+    Registro de idempotência das rotinas automáticas (aniversário, lembrete de aula).
+    A chave identifica o envio (gatilho + referência + aluno): uma rotina que roda de
+    novo no mesmo dia encontra a chave e não manda a mensagem outra vez.
+    """
+    STATUS_CHOICES = [
+        ('RESERVADO', 'Reservado (envio em andamento)'),
+        ('ENVIADO', 'Enviado'),
+        ('ERRO', 'Erro'),
+    ]
+
+    chave = models.CharField(max_length=120, unique=True)
+    gatilho = models.CharField(max_length=30, choices=TemplateMensagem.TIPO_GATILHO)
+    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE)
+    data_referencia = models.DateField()
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='RESERVADO')
+    # Execução da rotina dona da reserva: duas execuções simultâneas nunca enviam a mesma chave
+    execucao = models.CharField(max_length=32)
+    resposta = models.TextField(blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Disparo de Rotina"
+        verbose_name_plural = "Disparos de Rotinas"
+        indexes = [models.Index(fields=['gatilho', 'data_referencia'], name='disparo_gatilho_data_idx')]
+
+    def __str__(self):
+        return f"{self.get_gatilho_display()} - {self.aluno} ({self.data_referencia:%d/%m/%Y})"
@@ -0,0 +1,207 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from core.limitador import LimitadorTaxa
+from .models import ConexaoWhatsapp, LogEnvio
+from .utils import limpar_e_formatar_numero
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MOTOR DE DISPARO DO WHATSAPP (EVOLUTION API)
+# ==============================================================================
+# Cada instância da Evolution (url_base + instancia) tem uma Session HTTP própria,
+# com pool de conexões keep-alive, e um token bucket próprio: uma academia com
+# lembrete para centenas de alunos não derruba a cota das outras. Os envios de um
+# lote saem em paralelo (concorrência limitada) e erros temporários (rede, 429,
+# 5xx) são repetidos com backoff exponencial.
+#
+# Só o HTTP roda nas threads do pool. Consultas e gravações no banco (conexão,
+# LogEnvio) ficam na thread de quem chamou: as threads não herdam o schema do tenant.
+
+WHATSAPP_CONCORRENCIA = getattr(settings, 'WHATSAPP_CONCORRENCIA', 8)
+WHATSAPP_MENSAGENS_POR_MINUTO = getattr(settings, 'WHATSAPP_MENSAGENS_POR_MINUTO', 300)
+WHATSAPP_RAJADA = getattr(settings, 'WHATSAPP_RAJADA', 10)
+WHATSAPP_TENTATIVAS = getattr(settings, 'WHATSAPP_TENTATIVAS', 3)
+WHATSAPP_TIMEOUT = getattr(settings, 'WHATSAPP_TIMEOUT', 10)
+# Maior Retry-After que vale esperar (segundos); acima disso o envio falha na hora
+WHATSAPP_RETRY_AFTER_MAXIMO = getattr(settings, 'WHATSAPP_RETRY_AFTER_MAXIMO', 30)
+# Atraso de "digitando..." que a própria Evolution aplica antes de cada mensagem
+WHATSAPP_DELAY_MS = getattr(settings, 'WHATSAPP_DELAY_MS', 1200)
+
+# Conexão do tenant fica no cache do Django por um minuto e é invalidada ao salvar
+# (ver signals). A invalidação só alcança os outros workers e o cron (disparar_rotinas)
+# se o CACHES do settings for compartilhado (Redis, banco); no LocMemCache padrão cada
+# processo tem a sua cópia, e uma apikey trocada vale nos outros em até este tempo.
+CACHE_CONEXAO_SEGUNDOS = getattr(settings, 'WHATSAPP_CACHE_CONEXAO_SEGUNDOS', 60)
+
+STATUS_TEMPORARIOS = {429, 500, 502, 503, 504}
+
+
+# ============================================================
+# CONFIGURAÇÃO POR TENANT (CACHE)
+# ============================================================
+
+_SEM_CONEXAO = 'sem-conexao'  # "não há conexão ativa" também fica em cache
+
+
+def _chave_conexao(organizacao_id, schema_name=None):
+    return f"whatsapp_conexao:{schema_name or getattr(connection, 'schema_name', 'public')}:{organizacao_id}"
+
+
+def obter_conexao(organizacao):
+    """ConexaoWhatsapp ativa da organização (ou None), consultando o banco no máximo uma vez a cada CACHE_CONEXAO_SEGUNDOS."""
+    chave = _chave_conexao(organizacao.pk)
+    conexao = cache.get(chave)
+    if conexao is None:
+        conexao = ConexaoWhatsapp.objects.filter(organizacao=organizacao, ativo=True).first() or _SEM_CONEXAO
+        cache.set(chave, conexao, CACHE_CONEXAO_SEGUNDOS)
+    return None if conexao == _SEM_CONEXAO else conexao
+
+
+def invalidar_conexao(organizacao_id):
+    cache.delete(_chave_conexao(organizacao_id))
+
+
+# ============================================================
+# POOL DE SESSÕES E LIMITES POR INSTÂNCIA
+# ============================================================
+
+class InstanciaEvolution:
+    """Session HTTP reaproveitada + limitador de taxa de uma instância da Evolution."""
+
+    def __init__(self, url_base, instancia):
+        self.url = f"{url_base.rstrip('/')}/message/sendText/{instancia}"
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=WHATSAPP_CONCORRENCIA)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+        self.limitador = LimitadorTaxa(WHATSAPP_MENSAGENS_POR_MINUTO, rajada=WHATSAPP_RAJADA)
+
+
+_instancias = {}
+_trava_instancias = threading.Lock()
+
+
+def instancia_para(conexao):
+    chave = (conexao.url_base.rstrip('/'), conexao.instancia)
+    with _trava_instancias:
+        if chave not in _instancias:
+            _instancias[chave] = InstanciaEvolution(*chave)
+        return _instancias[chave]
+
+
+# ============================================================
+# ENVIO
+# ============================================================
+
+def _ler_retry_after(valor):
+    """Retry-After em segundos ("120") ou como data HTTP; None se ausente ou inválido."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (data - datetime.now(dt_timezone.utc)).total_seconds())
+
+
+def _espera_backoff(tentativa, resposta=None):
+    """
+    Respeita o Retry-After do provedor; senão 1s, 2s, 4s... com um pouco de jitter.
+    Devolve None quando o provedor pede mais que WHATSAPP_RETRY_AFTER_MAXIMO: esperar
+    prenderia a thread do pool (e a request de quem chamou), então o envio falha.
+    """
+    if resposta is not None:
+        espera = _ler_retry_after(resposta.headers.get('Retry-After'))
+        if espera is not None:
+            return espera if espera <= WHATSAPP_RETRY_AFTER_MAXIMO else None
+    return (2 ** tentativa) + random.uniform(0, 0.5)
+
+
+def _enviar_um(instancia, apikey, telefone, texto):
+    payload = {
+        "number": limpar_e_formatar_numero(telefone),
+        "options": {
+            "delay": WHATSAPP_DELAY_MS,
+            "presence": "composing",
+            "linkPreview": False
+        },
+        "text": texto  # Em algumas versões da Evolution é 'text', em outras 'textMessage'
+    }
+    headers = {"apikey": apikey}
+
+    for tentativa in range(WHATSAPP_TENTATIVAS):
+        ultima = tentativa == WHATSAPP_TENTATIVAS - 1
+        instancia.limitador.aguardar()
+        try:
+            response = instancia.session.post(instancia.url, json=payload, headers=headers, timeout=WHATSAPP_TIMEOUT)
+        except requests.RequestException as e:
+            if ultima:
+                return False, str(e)
+            logger.warning(f"Falha de rede no envio do WhatsApp (tentativa {tentativa + 1}): {e}")
+            time.sleep(_espera_backoff(tentativa))
+            continue
+
+        if response.status_code in STATUS_TEMPORARIOS and not ultima:
+            espera = _espera_backoff(tentativa, response)
+            if espera is None:
+                return False, f"Evolution respondeu {response.status_code} e pediu para aguardar mais de {WHATSAPP_RETRY_AFTER_MAXIMO}s."
+            logger.warning(f"Evolution respondeu {response.status_code} (tentativa {tentativa + 1}), repetindo...")
+            time.sleep(espera)
+            continue
+        return response.status_code in [200, 201], response.text
+
+
+def enviar_lote(organizacao, mensagens):
+    """
+    Envia [(telefone, texto), ...] pela conexão da organização.
+    Devolve [(sucesso, resposta), ...] na mesma ordem das mensagens.
+    """
+    mensagens = list(mensagens)
+    if not mensagens:
+        return []
+
+    conexao = obter_conexao(organizacao)
+    if not conexao:
+        return [(False, "Configuração de API não encontrada ou inativa.")] * len(mensagens)
+
+    instancia = instancia_para(conexao)
+    if len(mensagens) == 1:
+        return [_enviar_um(instancia, conexao.apikey, *mensagens[0])]
+
+    with ThreadPoolExecutor(max_workers=min(WHATSAPP_CONCORRENCIA, len(mensagens))) as executor:
+        return list(executor.map(lambda m: _enviar_um(instancia, conexao.apikey, *m), mensagens))
+
+
+def enviar_e_registrar(organizacao, envios):
+    """
+    Envia [(aluno, texto), ...] em lote e grava um LogEnvio por mensagem (bulk_create).
+    Alunos sem telefone são ignorados. Devolve [(aluno, sucesso, resposta), ...].
+    """
+    envios = [(aluno, texto) for aluno, texto in envios if aluno.telefone]
+    resultados = enviar_lote(organizacao, [(aluno.telefone, texto) for aluno, texto in envios])
+
+    LogEnvio.objects.bulk_create([
+        LogEnvio(
+            organizacao=organizacao,
+            aluno=aluno,
+            mensagem=texto,
+            status=('ENVIADO' if sucesso else f'ERRO: {resposta}')[:20]
+        )
+        for (aluno, texto), (sucesso, resposta) in zip(envios, resultados)
+    ])
+    return [(aluno, sucesso, resposta) for (aluno, _), (sucesso, resposta) in zip(envios, resultados)]
@@ -0,0 +1,175 @@
+import logging
+import uuid
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from agenda_fit.models import Presenca
+from cadastros_fit.models import Aluno
+from .models import DisparoRotina, TemplateMensagem
+from .services_envio import enviar_e_registrar
+from .services_template import compilado_de
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MOTOR DAS ROTINAS AUTOMÁTICAS (ANIVERSÁRIO, LEMBRETE DE AULA)
+# ==============================================================================
+# Para cada gatilho: o template ativo do tenant, os destinatários numa consulta só
+# (com select_related), as mensagens montadas em lote pelo template compilado
+# (services_template) e o envio pelo motor de disparo (services_envio). Antes de
+# enviar, cada destinatário é reservado em DisparoRotina pela chave do envio: rodar
+# a rotina de novo (cron a cada hora, reprocessamento manual, dois workers ao mesmo
+# tempo) nunca manda duas vezes. Envios que voltaram com erro, e reservas de uma
+# execução que caiu no meio do lote, são tentados de novo na próxima execução.
+
+# Quantos envios são reservados/enviados por vez
+LOTE_ROTINA = 200
+# Reserva RESERVADO parada há mais que isso é de uma execução que caiu antes de gravar o resultado
+RESERVA_ORFA_APOS = timedelta(minutes=30)
+
+
+def _primeiro_nome(nome):
+    return nome.split()[0] if nome else ''
+
+
+# ============================================================
+# DESTINATÁRIOS POR GATILHO
+# ============================================================
+# Cada função devolve [(chave, aluno, variaveis), ...] para a data de referência.
+
+def destinatarios_aniversario(hoje):
+    alunos = Aluno.objects.filter(
+        data_nascimento__day=hoje.day,
+        data_nascimento__month=hoje.month,
+        ativo=True
+    ).exclude(telefone='')
+    return [
+        (f"ANIVERSARIO:{hoje:%Y-%m-%d}:{aluno.pk}", aluno, {
+            'aluno': _primeiro_nome(aluno.nome),
+            'telefone': aluno.telefone,
+            'data': hoje.strftime('%d/%m'),
+        })
+        for aluno in alunos
+    ]
+
+
+def destinatarios_aula_amanha(hoje):
+    amanha = hoje + timedelta(days=1)
+    presencas = Presenca.objects.filter(
+        aula__data_hora_inicio__date=amanha,
+        aula__status='AGENDADA',
+        aluno__ativo=True
+    ).exclude(aluno__telefone='').select_related('aluno', 'aula', 'aula__unidade', 'aula__profissional')
+
+    destinatarios = []
+    for presenca in presencas:
+        aluno, aula = presenca.aluno, presenca.aula
+        destinatarios.append((f"AULA_AMANHA:{aula.pk}:{aluno.pk}", aluno, {
+            'aluno': _primeiro_nome(aluno.nome),
+            'telefone': aluno.telefone,
+            'data': amanha.strftime('%d/%m'),
+            'horario': timezone.localtime(aula.data_hora_inicio).strftime('%H:%M'),
+            'unidade': aula.unidade.nome,
+            'profissional': aula.profissional.nome if aula.profissional else "Instrutor",
+        }))
+    return destinatarios
+
+
+GATILHOS_ROTINA = {
+    'ANIVERSARIO': destinatarios_aniversario,
+    'AULA_AMANHA': destinatarios_aula_amanha,
+}
+
+
+# ============================================================
+# IDEMPOTÊNCIA
+# ============================================================
+
+def _reservar(gatilho, hoje, destinatarios, execucao):
+    """
+    Reserva as chaves ainda não enviadas para esta execução e devolve só os
+    destinatários que ficaram com ela. Chaves novas entram com bulk_create
+    (ignore_conflicts: quem inserir primeiro é o dono); chaves com ERRO ou com
+    reserva órfã são retomadas com um UPDATE condicional, que também só um vence.
+    """
+    por_chave = {chave: (aluno, variaveis) for chave, aluno, variaveis in destinatarios}
+    chaves = list(por_chave)
+
+    DisparoRotina.objects.bulk_create([
+        DisparoRotina(chave=chave, gatilho=gatilho, aluno=aluno, data_referencia=hoje, execucao=execucao)
+        for chave, (aluno, _) in por_chave.items()
+    ], ignore_conflicts=True)
+    agora = timezone.now()
+    DisparoRotina.objects.filter(
+        Q(status='ERRO') | Q(status='RESERVADO', atualizado_em__lt=agora - RESERVA_ORFA_APOS),
+        chave__in=chaves,
+    ).exclude(execucao=execucao).update(status='RESERVADO', execucao=execucao, atualizado_em=agora)
+
+    minhas = DisparoRotina.objects.filter(chave__in=chaves, execucao=execucao, status='RESERVADO').values_list('chave', flat=True)
+    return [(chave, *por_chave[chave]) for chave in minhas]
+
+
+def _finalizar(resultados):
+    """Grava o resultado de cada envio reservado: [(chave, sucesso, resposta), ...]."""
+    registros = list(DisparoRotina.objects.filter(chave__in=[chave for chave, _, _ in resultados]))
+    por_chave = {chave: (sucesso, resposta) for chave, sucesso, resposta in resultados}
+    agora = timezone.now()
+    for registro in registros:
+        sucesso, resposta = por_chave[registro.chave]
+        registro.status = 'ENVIADO' if sucesso else 'ERRO'
+        registro.resposta = str(resposta)[:1000]
+        registro.atualizado_em = agora
+    DisparoRotina.objects.bulk_update(registros, ['status', 'resposta', 'atualizado_em'])
+
+
+# ============================================================
+# EXECUÇÃO
+# ============================================================
+
+def executar_gatilho(gatilho, hoje=None, respeitar_horario=True):
+    """
+    Roda um gatilho no tenant atual. Devolve {'enviados', 'erros', 'ja_enviados'}
+    ou None quando não há template ativo (ou ainda não chegou o horário de envio).
+    """
+    organizacao = connection.tenant
+    hoje = hoje or timezone.localdate()
+
+    template = TemplateMensagem.objects.filter(organizacao=organizacao, gatilho=gatilho, ativo=True).first()
+    if not template:
+        return None
+    if respeitar_horario and template.horario_envio and timezone.localtime().time() < template.horario_envio:
+        return None
+
+    compilado = compilado_de(template)
+    destinatarios = GATILHOS_ROTINA[gatilho](hoje)
+    execucao = uuid.uuid4().hex
+    resumo = {'enviados': 0, 'erros': 0, 'ja_enviados': 0}
+
+    for i in range(0, len(destinatarios), LOTE_ROTINA):
+        lote = destinatarios[i:i + LOTE_ROTINA]
+        reservados = _reservar(gatilho, hoje, lote, execucao)
+        resumo['ja_enviados'] += len(lote) - len(reservados)
+        if not reservados:
+            continue
+
+        textos = compilado.renderizar_lote([variaveis for _, _, variaveis in reservados])
+        envios = [(aluno, texto) for (_, aluno, _), texto in zip(reservados, textos)]
+        resultados = enviar_e_registrar(organizacao, envios)
+
+        _finalizar([
+            (chave, sucesso, resposta)
+            for (chave, _, _), (_, sucesso, resposta) in zip(reservados, resultados)
+        ])
+        for _, sucesso, _ in resultados:
+            resumo['enviados' if sucesso else 'erros'] += 1
+
+    return resumo
+
+
+def executar_rotinas(gatilhos=None, hoje=None, respeitar_horario=True):
+    """Roda os gatilhos no tenant atual. Devolve {gatilho: resumo ou None}."""
+    return {
+        gatilho: executar_gatilho(gatilho, hoje=hoje, respeitar_horario=respeitar_horario)
+        for gatilho in (gatilhos or GATILHOS_ROTINA)
+    }
@@ -0,0 +1,154 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from .models import MensagemSaida
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# WORKER DA CAIXA DE SAÍDA
+# ==============================================================================
+
+# IMPORTANTE: URL do Webhook do n8n (pode ser sobrescrita no settings)
+N8N_WEBHOOK_URL = getattr(settings, 'N8N_WEBHOOK_URL', "https://dry-octopus-5.hooks.n8n.cloud/webhook/comunicacao")
+
+SAIDA_TAMANHO_LOTE = getattr(settings, 'SAIDA_TAMANHO_LOTE', 50)
+SAIDA_CONCORRENCIA = getattr(settings, 'SAIDA_CONCORRENCIA', 4)
+SAIDA_MAX_TENTATIVAS = getattr(settings, 'SAIDA_MAX_TENTATIVAS', 6)
+SAIDA_TIMEOUT = 10  # segundos por requisição
+
+# Backoff entre tentativas: 30s, 1min, 2min, 4min... até 1h
+BACKOFF_INICIAL = timedelta(seconds=30)
+BACKOFF_MAXIMO = timedelta(hours=1)
+# Mensagem PROCESSANDO sem atualização há mais que isso é de um worker que caiu
+MENSAGEM_ORFA_APOS = timedelta(minutes=5)
+
+
+def enfileirar(tipo, payload, canal='N8N'):
+    """
+    Grava a mensagem na caixa de saída. Chamado dentro de uma transação, só vale se ela
+    for confirmada: um cadastro desfeito não gera mensagem.
+    """
+    return MensagemSaida.objects.create(canal=canal, tipo=tipo, payload=payload)
+
+
+# ============================================================
+# ENVIADORES POR CANAL
+# ============================================================
+# Recebem a mensagem e devolvem None (sucesso) ou o texto do erro.
+# Rodam nas threads do pool: só HTTP, nada de banco.
+
+_sessao_n8n = requests.Session()
+_sessao_n8n.mount('https://', HTTPAdapter(pool_maxsize=SAIDA_CONCORRENCIA))
+_sessao_n8n.mount('http://', HTTPAdapter(pool_maxsize=SAIDA_CONCORRENCIA))
+
+
+def _enviar_n8n(mensagem):
+    try:
+        response = _sessao_n8n.post(N8N_WEBHOOK_URL, json=mensagem.payload, timeout=SAIDA_TIMEOUT)
+    except requests.RequestException as e:
+        return str(e)
+    if response.status_code >= 300:
+        return f"HTTP {response.status_code}: {response.text[:500]}"
+    return None
+
+
+ENVIADORES = {
+    'N8N': _enviar_n8n,
+}
+
+
+def _enviar(mensagem):
+    try:
+        return ENVIADORES[mensagem.canal](mensagem)
+    except Exception as e:  # um erro inesperado numa mensagem não derruba o lote
+        return f"{type(e).__name__}: {e}"
+
+
+# ============================================================
+# FILA
+# ============================================================
+
+def reivindicar_lote(tamanho=SAIDA_TAMANHO_LOTE):
+    """
+    Marca como PROCESSANDO as próximas mensagens vencidas (e as órfãs).
+    skip_locked permite vários workers sem que dois peguem a mesma mensagem.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        lote = list(
+            MensagemSaida.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status='PENDENTE', proxima_tentativa_em__lte=agora)
+                | Q(status='PROCESSANDO', atualizado_em__lt=agora - MENSAGEM_ORFA_APOS)
+            )
+            .order_by('proxima_tentativa_em')[:tamanho]
+        )
+        if lote:
+            MensagemSaida.objects.filter(pk__in=[m.pk for m in lote]).update(status='PROCESSANDO', atualizado_em=agora)
+    return lote
+
+
+def _backoff(tentativas):
+    return min(BACKOFF_INICIAL * (2 ** (tentativas - 1)), BACKOFF_MAXIMO)
+
+
+def drenar_lote(tamanho=SAIDA_TAMANHO_LOTE):
+    """
+    Envia um lote da caixa de saída do tenant atual. Devolve as métricas do lote:
+    {'enviadas', 'reagendadas', 'mortas', 'segundos'}.
+    """
+    inicio = time.monotonic()
+    lote = reivindicar_lote(tamanho)
+    metricas = {'enviadas': 0, 'reagendadas': 0, 'mortas': 0, 'segundos': 0.0}
+    if not lote:
+        return metricas
+
+    with ThreadPoolExecutor(max_workers=min(SAIDA_CONCORRENCIA, len(lote))) as executor:
+        erros = list(executor.map(_enviar, lote))
+
+    agora = timezone.now()
+    for mensagem, erro in zip(lote, erros):
+        mensagem.tentativas += 1
+        mensagem.atualizado_em = agora
+        if erro is None:
+            mensagem.status = 'ENVIADA'
+            mensagem.enviado_em = agora
+            mensagem.ultimo_erro = ''
+            metricas['enviadas'] += 1
+        elif mensagem.tentativas >= SAIDA_MAX_TENTATIVAS:
+            mensagem.status = 'MORTA'
+            mensagem.ultimo_erro = erro
+            metricas['mortas'] += 1
+            logger.error(f"Mensagem #{mensagem.pk} ({mensagem.tipo}) descartada após {mensagem.tentativas} tentativas: {erro}")
+        else:
+            mensagem.status = 'PENDENTE'
+            mensagem.proxima_tentativa_em = agora + _backoff(mensagem.tentativas)
+            mensagem.ultimo_erro = erro
+            metricas['reagendadas'] += 1
+            logger.warning(f"Mensagem #{mensagem.pk} ({mensagem.tipo}) falhou (tentativa {mensagem.tentativas}): {erro}")
+
+    MensagemSaida.objects.bulk_update(
+        lote, ['status', 'tentativas', 'proxima_tentativa_em', 'ultimo_erro', 'enviado_em', 'atualizado_em']
+    )
+    metricas['segundos'] = round(time.monotonic() - inicio, 2)
+    return metricas
+
+
+def metricas_fila():
+    """Tamanho da fila por status e idade da pendência mais antiga (segundos), para monitoramento."""
+    por_status = dict(
+        MensagemSaida.objects.order_by().values('status').annotate(total=Count('id')).values_list('status', 'total')
+    )
+    mais_antiga = MensagemSaida.objects.filter(status='PENDENTE').aggregate(m=Min('criado_em'))['m']
+    return {
+        **{status: por_status.get(status, 0) for status, _ in MensagemSaida.STATUS_CHOICES},
+        'idade_pendente_mais_antiga': (timezone.now() - mais_antiga).total_seconds() if mais_antiga else 0,
+    }
@@ -0,0 +1,88 @@
+import re
+import threading
+from django.db import connection
+
+# ==============================================================================
+# COMPILADOR DOS TEMPLATES DE MENSAGEM
+# ==============================================================================
+# O conteúdo do TemplateMensagem é analisado uma vez e vira uma lista de trechos
+# fixos intercalados com variáveis. O resultado fica em cache por (schema, id,
+# versão): renderizar para centenas de alunos é só um join por aluno, sem regex
+# nem replace em cadeia. Aceita as duas sintaxes que já existem nos templates,
+# [[aluno]] e {{aluno}}, e serve tanto o texto do WhatsApp quanto os payloads do n8n.
+
+PADRAO_VARIAVEL = re.compile(r'\[\[\s*(\w+)\s*\]\]|\{\{\s*(\w+)\s*\}\}')
+
+# Variáveis que cada gatilho preenche (validadas ao salvar o template)
+VARIAVEIS_COMUNS = {'aluno', 'telefone'}
+VARIAVEIS_POR_GATILHO = {
+    'AULA_AMANHA': VARIAVEIS_COMUNS | {'data', 'horario', 'unidade', 'profissional'},
+    'ANIVERSARIO': VARIAVEIS_COMUNS | {'data'},
+    'COBRANCA': VARIAVEIS_COMUNS | {'valor'},
+    'BOAS_VINDAS': VARIAVEIS_COMUNS,
+}
+
+MAX_TEMPLATES_EM_CACHE = 2000
+
+
+class TemplateCompilado:
+    """
+    `literais` tem sempre um item a mais que `nomes`: literal, variável, literal, ...
+    Variável sem valor no render fica como foi escrita no template (ex.: [[valor]]).
+    """
+    __slots__ = ('literais', 'nomes', 'originais')
+
+    def __init__(self, conteudo):
+        self.literais, self.nomes, self.originais = [], [], []
+        inicio = 0
+        for m in PADRAO_VARIAVEL.finditer(conteudo):
+            self.literais.append(conteudo[inicio:m.start()])
+            self.nomes.append(m.group(1) or m.group(2))
+            self.originais.append(m.group(0))
+            inicio = m.end()
+        self.literais.append(conteudo[inicio:])
+
+    @property
+    def variaveis(self):
+        return set(self.nomes)
+
+    def renderizar(self, variaveis):
+        if not self.nomes:
+            return self.literais[0]
+        partes = [self.literais[0]]
+        for nome, original, literal in zip(self.nomes, self.originais, self.literais[1:]):
+            valor = variaveis.get(nome)
+            partes.append(original if valor is None else str(valor))
+            partes.append(literal)
+        return ''.join(partes)
+
+    def renderizar_lote(self, lista_variaveis):
+        renderizar = self.renderizar
+        return [renderizar(variaveis) for variaveis in lista_variaveis]
+
+
+def variaveis_invalidas(conteudo, gatilho):
+    """Variáveis usadas no conteúdo que o gatilho não preenche (vazio = template válido)."""
+    permitidas = VARIAVEIS_POR_GATILHO.get(gatilho, VARIAVEIS_COMUNS)
+    return sorted(TemplateCompilado(conteudo).variaveis - permitidas)
+
+
+_cache = {}
+_trava_cache = threading.Lock()
+
+
+def compilado_de(template):
+    """Versão compilada do TemplateMensagem, do cache quando id e versão batem."""
+    if template.pk is None:
+        return TemplateCompilado(template.conteudo)
+
+    chave = (getattr(connection, 'schema_name', 'public'), template.pk, template.versao)
+    compilado = _cache.get(chave)
+    if compilado is None:
+        compilado = TemplateCompilado(template.conteudo)
+        with _trava_cache:
+            if len(_cache) >= MAX_TEMPLATES_EM_CACHE:
+                _cache.pop(next(iter(_cache)))  # o mais antigo
+            _cache[chave] = compilado
+    return compilado
+
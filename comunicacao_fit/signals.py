@@ -1,25 +1,17 @@
-from django.db.models.signals import post_save
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from cadastros_fit.models import Aluno
-import requests
-import threading
-import json
-
-# IMPORTANTE: Coloque aqui a URL do Webhook do seu n8n
-# Como você está usando o tunnel, pegue a URL que começa com https://....hooks.n8n.cloud
-N8N_WEBHOOK_URL = "https://dry-octopus-5.hooks.n8n.cloud/webhook/comunicacao"
-
-def enviar_n8n_background(payload):
-    """Envia os dados para o n8n em segundo plano para não travar o cadastro"""
-    try:
-        requests.post(N8N_WEBHOOK_URL, json=payload, timeout=10)
-    except Exception as e:
-        print(f"[ERRO N8N] Falha ao enviar: {e}")
+from .models import ConexaoWhatsapp, TemplateMensagem
+from .services_envio import invalidar_conexao
+from .services_saida import enfileirar
+from .services_template import compilado_de
 
 @receiver(post_save, sender=Aluno)
 def gatilho_boas_vindas(sender, instance, created, **kwargs):
     """
-    Sempre que um Aluno é criado (created=True), dispara mensagem.
+    Sempre que um Aluno é criado (created=True), coloca a mensagem na caixa de saída.
+    O envio ao n8n é feito pelo worker (manage.py worker_saida), fora do cadastro.
     """
     if created and instance.telefone:
         payload = {
@@ -28,5 +20,19 @@ def gatilho_boas_vindas(sender, instance, created, **kwargs):
             "telefone": instance.telefone,
             # Pode mandar mais dados se quiser
         }
-        # Dispara thread para não deixar o usuário esperando a resposta da API
-        threading.Thread(target=enviar_n8n_background, args=(payload,)).start()
\ No newline at end of file
+        # Texto do template de boas-vindas do tenant, renderizado com o mesmo compilador do WhatsApp
+        template = TemplateMensagem.objects.filter(
+            organizacao=connection.tenant, gatilho='BOAS_VINDAS', ativo=True
+        ).first()
+        if template:
+            payload["mensagem"] = compilado_de(template).renderizar(
+                {'aluno': instance.nome, 'telefone': instance.telefone}
+            )
+        enfileirar("boas_vindas", payload)
+
+
+@receiver(post_save, sender=ConexaoWhatsapp)
+@receiver(post_delete, sender=ConexaoWhatsapp)
+def invalidar_cache_conexao(sender, instance, **kwargs):
+    """Troca de apikey/instância vale na hora para os próximos disparos."""
+    invalidar_conexao(instance.organizacao_id)
@@ -1,3 +1,137 @@
-from django.test import TestCase
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from cadastros_fit.models import Aluno
+from comunicacao_fit import services_saida
+from comunicacao_fit.models import DisparoRotina, MensagemSaida, TemplateMensagem
+from comunicacao_fit.services_rotinas import RESERVA_ORFA_APOS, executar_gatilho
+from comunicacao_fit.services_saida import MENSAGEM_ORFA_APOS, SAIDA_MAX_TENTATIVAS, _backoff, drenar_lote, enfileirar
 
-# Create your tests here.
+
+class RotinaIdempotenteTests(TenantTestCase):
+    """Rodar a rotina de novo nunca manda a mesma mensagem duas vezes."""
+
+    def setUp(self):
+        super().setUp()
+        self.hoje = date(2026, 3, 10)
+        TemplateMensagem.objects.create(
+            organizacao=self.tenant, titulo='Aniversário', gatilho='ANIVERSARIO',
+            conteudo='Parabéns, [[aluno]]!',
+        )
+        self.ana = Aluno.objects.create(nome='Ana Souza', telefone='11999990001', data_nascimento=date(1990, 3, 10))
+        self.bia = Aluno.objects.create(nome='Bia Lima', telefone='11999990002', data_nascimento=date(1985, 3, 10))
+        self.enviados = Counter()
+        self.falhar = set()
+        patcher = mock.patch('comunicacao_fit.services_envio.enviar_lote', side_effect=self.enviar_lote_falso)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enviar_lote_falso(self, organizacao, mensagens):
+        resultados = []
+        for telefone, _ in mensagens:
+            self.enviados[telefone] += 1
+            resultados.append((False, 'HTTP 500') if telefone in self.falhar else (True, 'ok'))
+        return resultados
+
+    def executar(self):
+        return executar_gatilho('ANIVERSARIO', hoje=self.hoje, respeitar_horario=False)
+
+    def chave(self, aluno):
+        return f"ANIVERSARIO:{self.hoje:%Y-%m-%d}:{aluno.pk}"
+
+    def test_segunda_execucao_nao_reenvia(self):
+        self.assertEqual(self.executar(), {'enviados': 2, 'erros': 0, 'ja_enviados': 0})
+        self.assertEqual(self.executar(), {'enviados': 0, 'erros': 0, 'ja_enviados': 2})
+        self.assertEqual(self.enviados, {self.ana.telefone: 1, self.bia.telefone: 1})
+        self.assertEqual(DisparoRotina.objects.filter(status='ENVIADO').count(), 2)
+
+    def test_envio_com_erro_e_repetido_na_proxima_execucao(self):
+        self.falhar = {self.bia.telefone}
+        self.assertEqual(self.executar(), {'enviados': 1, 'erros': 1, 'ja_enviados': 0})
+        self.assertEqual(DisparoRotina.objects.get(chave=self.chave(self.bia)).status, 'ERRO')
+
+        self.falhar = set()
+        self.assertEqual(self.executar(), {'enviados': 1, 'erros': 0, 'ja_enviados': 1})
+        self.assertEqual(self.enviados, {self.ana.telefone: 1, self.bia.telefone: 2})
+        self.assertEqual(DisparoRotina.objects.get(chave=self.chave(self.bia)).status, 'ENVIADO')
+
+    def test_reserva_orfa_e_retomada_e_a_recente_nao(self):
+        # Ana: execução que caiu há muito tempo; Bia: execução que ainda está enviando
+        for aluno in (self.ana, self.bia):
+            DisparoRotina.objects.create(
+                chave=self.chave(aluno), gatilho='ANIVERSARIO', aluno=aluno,
+                data_referencia=self.hoje, execucao='outra',
+            )
+        DisparoRotina.objects.filter(chave=self.chave(self.ana)).update(
+            atualizado_em=timezone.now() - RESERVA_ORFA_APOS - timedelta(minutes=1)
+        )
+
+        self.assertEqual(self.executar(), {'enviados': 1, 'erros': 0, 'ja_enviados': 1})
+        self.assertEqual(self.enviados, {self.ana.telefone: 1})
+        self.assertEqual(DisparoRotina.objects.get(chave=self.chave(self.ana)).status, 'ENVIADO')
+        self.assertEqual(DisparoRotina.objects.get(chave=self.chave(self.bia)).status, 'RESERVADO')
+
+
+class CaixaSaidaTests(TenantTestCase):
+    """Estados da MensagemSaida no worker: ENVIADA, reagendada com backoff, MORTA e órfã retomada."""
+
+    def setUp(self):
+        super().setUp()
+        self.erro = None
+        self.chamadas = []
+        patcher = mock.patch.dict(services_saida.ENVIADORES, {'N8N': self.enviar_falso})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enviar_falso(self, mensagem):
+        self.chamadas.append(mensagem.pk)
+        return self.erro
+
+    def test_pendente_vira_enviada(self):
+        mensagem = enfileirar('teste', {'nome': 'Ana'})
+        metricas = drenar_lote()
+        self.assertEqual((metricas['enviadas'], metricas['reagendadas'], metricas['mortas']), (1, 0, 0))
+        mensagem.refresh_from_db()
+        self.assertEqual(mensagem.status, 'ENVIADA')
+        self.assertEqual(mensagem.tentativas, 1)
+        self.assertIsNotNone(mensagem.enviado_em)
+
+    def test_falha_reagenda_com_backoff(self):
+        mensagem = enfileirar('teste', {'nome': 'Ana'})
+        self.erro = 'HTTP 502: Bad Gateway'
+        antes = timezone.now()
+        self.assertEqual(drenar_lote()['reagendadas'], 1)
+        mensagem.refresh_from_db()
+        self.assertEqual(mensagem.status, 'PENDENTE')
+        self.assertEqual(mensagem.tentativas, 1)
+        self.assertEqual(mensagem.ultimo_erro, self.erro)
+        self.assertGreaterEqual(mensagem.proxima_tentativa_em, antes + _backoff(1))
+
+        # Ainda não venceu: o próximo lote não pega a mensagem
+        self.assertEqual(drenar_lote()['reagendadas'], 0)
+        self.assertEqual(self.chamadas, [mensagem.pk])
+
+    def test_ultima_tentativa_com_falha_vira_morta(self):
+        mensagem = enfileirar('teste', {'nome': 'Ana'})
+        MensagemSaida.objects.filter(pk=mensagem.pk).update(tentativas=SAIDA_MAX_TENTATIVAS - 1)
+        self.erro = 'HTTP 500: erro'
+        self.assertEqual(drenar_lote()['mortas'], 1)
+        mensagem.refresh_from_db()
+        self.assertEqual(mensagem.status, 'MORTA')
+        self.assertEqual(mensagem.tentativas, SAIDA_MAX_TENTATIVAS)
+
+    def test_processando_orfa_e_retomada_e_a_recente_nao(self):
+        orfa = MensagemSaida.objects.create(tipo='teste', payload={}, status='PROCESSANDO')
+        em_andamento = MensagemSaida.objects.create(tipo='teste', payload={}, status='PROCESSANDO')
+        MensagemSaida.objects.filter(pk=orfa.pk).update(
+            atualizado_em=timezone.now() - MENSAGEM_ORFA_APOS - timedelta(minutes=1)
+        )
+
+        self.assertEqual(drenar_lote()['enviadas'], 1)
+        self.assertEqual(self.chamadas, [orfa.pk])
+        orfa.refresh_from_db()
+        em_andamento.refresh_from_db()
+        self.assertEqual(orfa.status, 'ENVIADA')
+        self.assertEqual(em_andamento.status, 'PROCESSANDO')
@@ -1,7 +1,9 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.db import connection
 from django.http import JsonResponse
-from .models import TemplateMensagem, ConexaoWhatsapp, LogEnvio
-from .utils import enviar_mensagem_evolution
+from .models import TemplateMensagem, ConexaoWhatsapp
+from .services_envio import enviar_e_registrar
+from .services_template import compilado_de
 from cadastros_fit.models import Aluno
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
@@ -12,30 +14,13 @@ def processar_e_enviar(aluno, template, dados_extras=None):
     """
     Pega o template, substitui as variáveis e envia.
     """
-    texto = template.conteudo
-    
-    # Substituições base
-    texto = texto.replace('[[aluno]]', aluno.nome)
-    texto = texto.replace('[[telefone]]', aluno.telefone)
-    
-    # Se tiver dados de aula (data/horário)
-    if dados_extras:
-        if 'horario' in dados_extras:
-            texto = texto.replace('[[horario]]', dados_extras['horario'])
-        if 'data' in dados_extras:
-            texto = texto.replace('[[data]]', dados_extras['data'])
+    variaveis = {'aluno': aluno.nome, 'telefone': aluno.telefone, **(dados_extras or {})}
+    texto = compilado_de(template).renderizar(variaveis)
 
-    # Envia via Evolution
-    sucesso, resposta = enviar_mensagem_evolution(aluno.organizacao, aluno.telefone, texto)
-    
-    # Grava Log
-    LogEnvio.objects.create(
-        organizacao=aluno.organizacao,
-        aluno=aluno,
-        mensagem=texto,
-        status='ENVIADO' if sucesso else f'ERRO: {resposta}'
-    )
-    return sucesso
+    # Envia via Evolution (sessão reaproveitada) e grava o log
+    # O aluno não tem FK de organização: o schema do tenant já isola os dados
+    resultados = enviar_e_registrar(connection.tenant, [(aluno, texto)])
+    return bool(resultados) and resultados[0][1]
 
 # VIEW PARA O BOTÃO DE COBRANÇA NO PERFIL
 def disparar_cobranca_manual(request, aluno_id):
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos_fit', '0003_plano_descricao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contrato',
+            name='agenda_gerada_ate',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -108,6 +108,9 @@ class Contrato(models.Model):
     arquivo_assinado = models.FileField(upload_to='contratos/assinados/', blank=True, null=True)
     criado_em = models.DateTimeField(auto_now_add=True)
 
+    # Até que dia a agenda deste contrato já foi materializada (usado pelo comando gerar_agenda)
+    agenda_gerada_ate = models.DateField(blank=True, null=True, editable=False)
+
     def save(self, *args, **kwargs):
         # 1. Valor padrão se vazio
         if not self.valor_total and self.plano:
@@ -1,15 +1,19 @@
-from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
-from django.db.models import Sum
+from django.db.models import Count, Sum
 import requests
 import json
 from django.conf import settings
 from django.core.mail import send_mail
 from django.urls import reverse
 from django.conf import settings
-from agenda_fit.models import Aula, Presenca
+from agenda_fit.models import Presenca
+from agenda_fit.services import expandir_horarios, gerar_agenda_contrato
 from financeiro_fit.models import Lancamento, CategoriaFinanceira, ContaBancaria
+from financeiro_fit.services_resumo import atualizar_resumo, contribuicoes
+from .models import Contrato
 
 def processar_novo_contrato(contrato):
     """Gera tudo do zero (usado na venda)"""
@@ -18,116 +22,142 @@ def processar_novo_contrato(contrato):
 
 def regenerar_contrato(contrato):
     """
-    Recalcula parcelas e aulas após edição.
-    Preserva o passado (pagos/realizados) e recria o futuro.
+    Recalcula parcelas e aulas após edição, mexendo só no que mudou.
+    Preserva o passado (pagos/realizados), compara o futuro desejado com o que está
+    gravado e aplica apenas a diferença (insere, atualiza ou remove em lote).
+
+    Retorna um resumo das alterações:
+    {'aulas_criadas', 'aulas_removidas', 'parcelas_criadas', 'parcelas_atualizadas', 'parcelas_removidas'}
     """
     print(f"♻️ Regenerando Contrato #{contrato.id}...")
-    
-    # 1. AGENDA: Remove presenças futuras e recria
+
+    with transaction.atomic():
+        resumo = reconciliar_agenda(contrato)
+        resumo.update(reconciliar_financeiro(contrato))
+
+    print(f"✅ Contrato regenerado com sucesso! {resumo}")
+    return resumo
+
+def reconciliar_agenda(contrato):
+    """Diff entre os slots da grade fixa e as presenças futuras gravadas do aluno."""
     agora = timezone.now()
-    Presenca.objects.filter(
+
+    # Recalcula a partir de HOJE (ou da data inicio se for futura)
+    data_inicio_recalculo = max(contrato.data_inicio, agora.date())
+    slots = expandir_horarios(contrato.horarios_fixos.all(), data_inicio_recalculo, contrato.data_fim)
+    desejados = {s for s in slots if s[0] >= agora}
+
+    # Assumindo que o aluno só tem 1 contrato ativo por vez, as presenças futuras dele são deste contrato
+    gravadas = Presenca.objects.filter(
         aluno=contrato.aluno,
         aula__data_hora_inicio__gte=agora, # Apenas aulas futuras
-        # Se quiser ligar a presença ao contrato específico, precisaria de um campo na Presença. 
-        # Assumindo que o aluno só tem 1 contrato ativo por vez:
-    ).delete()
-    
-    # Recria agenda a partir de HOJE (ou da data inicio se for futura)
-    data_inicio_recalculo = max(contrato.data_inicio, agora.date())
-    gerar_agenda(contrato, data_inicio_forcada=data_inicio_recalculo)
+    ).values_list('id', 'aula_id', 'aula__data_hora_inicio', 'aula__profissional_id')
 
+    remover = [(pk, aula_id) for pk, aula_id, inicio, prof_id in gravadas if (inicio, prof_id) not in desejados]
+    ids_remover = [pk for pk, _ in remover]
+    if ids_remover:
+        # O post_delete de cada presença devolve a vaga da aula
+        Presenca.objects.filter(id__in=ids_remover).delete()
+
+    # O motor de agenda já ignora os slots em que o aluno está inscrito
+    criadas = gerar_agenda(contrato, data_inicio_forcada=data_inicio_recalculo)
+
+    return {'aulas_criadas': criadas or 0, 'aulas_removidas': len(ids_remover)}
+
+def reconciliar_financeiro(contrato):
+    """Diff entre as parcelas pendentes desejadas e as gravadas (pareadas por ordem de vencimento)."""
+    pagas = Lancamento.objects.filter(contrato=contrato, status='PAGO').aggregate(
+        total=Sum('valor'), qtde=Count('id')
+    )
+    total_pago = pagas['total'] or 0
+    parcelas_pagas = pagas['qtde']
 
-    # 2. FINANCEIRO: Remove pendentes e recalcula saldo
-    # Remove parcelas pendentes deste contrato
-    Lancamento.objects.filter(contrato=contrato, status='PENDENTE').delete()
-    
-    # Calcula quanto já foi pago
-    total_pago = Lancamento.objects.filter(
-        contrato=contrato, 
-        status='PAGO'
-    ).aggregate(Sum('valor'))['valor__sum'] or 0
-    
-    parcelas_pagas = Lancamento.objects.filter(contrato=contrato, status='PAGO').count()
-    
     # Novo saldo a receber
     saldo_restante = contrato.valor_total - total_pago
     parcelas_restantes = contrato.qtde_parcelas - parcelas_pagas
-    
+
+    desejadas = []
     if saldo_restante > 0 and parcelas_restantes > 0:
-        gerar_financeiro(contrato, valor_custom=saldo_restante, qtde_custom=parcelas_restantes, inicio_custom=parcelas_pagas)
-    
-    print("✅ Contrato regenerado com sucesso!")
+        desejadas = calcular_parcelas(contrato, saldo_restante, parcelas_restantes, parcelas_pagas)
+
+    pendentes = list(
+        Lancamento.objects.filter(contrato=contrato, status='PENDENTE').order_by('data_vencimento', 'id')
+    )
+
+    campos = ['descricao', 'valor', 'data_vencimento', 'parcela_atual', 'total_parcelas']
+    # bulk_update não dispara sinais: o consolidado recebe a diferença direto
+    antes = contribuicoes(pendentes[:len(desejadas)])
+    atualizar = []
+    for lancamento, dados in zip(pendentes, desejadas):
+        mudou = False
+        for campo in campos:
+            if getattr(lancamento, campo) != dados[campo]:
+                setattr(lancamento, campo, dados[campo])
+                mudou = True
+        if mudou:
+            atualizar.append(lancamento)
+
+    remover = pendentes[len(desejadas):]
+    novas = desejadas[len(pendentes):]
+
+    if atualizar:
+        # bulk_update não aplica o auto_now
+        agora = timezone.now()
+        for lancamento in atualizar:
+            lancamento.atualizado_em = agora
+        Lancamento.objects.bulk_update(atualizar, campos + ['atualizado_em'])
+        atualizar_resumo(antes=antes, depois=contribuicoes(pendentes[:len(desejadas)]))
+    if remover:
+        Lancamento.objects.filter(id__in=[l.id for l in remover]).delete()
+
+    criadas = 0
+    if novas:
+        criadas = gravar_parcelas(contrato, novas)
+
+    return {
+        'parcelas_criadas': criadas,
+        'parcelas_atualizadas': len(atualizar),
+        'parcelas_removidas': len(remover),
+    }
 
 
 # --- FUNÇÕES AUXILIARES ---
 
 def gerar_agenda(contrato, data_inicio_forcada=None):
-    horarios = contrato.horarios_fixos.all()
-    if not horarios.exists(): return
+    """
+    Expande a grade fixa do contrato e grava aulas/presenças em lote
+    (ver agenda_fit.services.agendar_aluno_em_slots).
+    """
+    data_inicio = data_inicio_forcada or contrato.data_inicio
+    if not contrato.data_fim or data_inicio > contrato.data_fim: return 0
 
-    data_atual = data_inicio_forcada or contrato.data_inicio
-    data_fim = contrato.data_fim
-    agora = timezone.now() # Pegamos o horário atual para comparar
-    
-    if data_atual > data_fim: return
+    # Respeita a capacidade_maxima de cada aula (contador vagas_ocupadas)
+    criadas = gerar_agenda_contrato(contrato, data_inicio=data_inicio)
 
-    while data_atual <= data_fim:
-        dia_semana_atual = data_atual.weekday()
-        
-        for h in horarios:
-            if h.dia_semana == dia_semana_atual:
-                inicio = timezone.make_aware(timezone.datetime.combine(data_atual, h.horario))
-                fim = inicio + timedelta(hours=1)
-                
-                # Definimos o status baseado na data: se for futuro, é AGENDADA
-                status_inicial = 'AGENDADA' if inicio > agora else 'REALIZADA'
-
-                aula, created = Aula.objects.get_or_create(
-                    data_hora_inicio=inicio,
-                    profissional=h.profissional,
-                    defaults={
-                        'unidade': contrato.unidade,
-                        'data_hora_fim': fim,
-                        'status': status_inicial # Define o status ao criar
-                    }
-                )
-
-                # Se a aula já existia mas é futura, garantimos que o status dela seja AGENDADA
-                if not created and inicio > agora and aula.status != 'AGENDADA':
-                    aula.status = 'AGENDADA'
-                    aula.save()
-                
-                if aula.presencas.count() < 10: # Ajuste para sua capacidade máxima
-                    if not aula.presencas.filter(aluno=contrato.aluno).exists():
-                        # CRIAMOS A PRESENÇA COM STATUS EXPLÍCITO
-                        Presenca.objects.create(
-                            aula=aula, 
-                            aluno=contrato.aluno,
-                            status=status_inicial # Garante que a presença do aluno também seja AGENDADA
-                        )
-        
-        data_atual += timedelta(days=1)
+    # Contrato inteiro materializado: o comando diário não precisa mais passar por ele
+    contrato.agenda_gerada_ate = contrato.data_fim
+    Contrato.objects.filter(pk=contrato.pk).update(agenda_gerada_ate=contrato.data_fim)
+    return criadas
 
 def gerar_financeiro(contrato, valor_custom=None, qtde_custom=None, inicio_custom=0):
     valor_total = valor_custom if valor_custom is not None else contrato.valor_total
     qtde = qtde_custom if qtde_custom is not None else contrato.qtde_parcelas
     
-    if valor_total <= 0 or qtde <= 0: return
+    if valor_total <= 0 or qtde <= 0: return 0
 
-    valor_parcela = valor_total / qtde
-    
-    # Busca Categoria/Conta (ajuste conforme seu banco)
-    # Como removemos organizacao do Plano, pegamos do Contrato.aluno.organizacao ou do request (mas aqui é service)
-    # Assumindo que o contrato tem unidade e unidade tem acesso ou o schema já define.
-    # No multi-tenant, Category.objects.first() pega a categoria do schema atual.
-    
-    categoria = CategoriaFinanceira.objects.filter(tipo='RECEITA').first()
-    conta = ContaBancaria.objects.first()
-    
-    if not categoria or not conta: return # Evita crash
+    return gravar_parcelas(contrato, calcular_parcelas(contrato, valor_total, qtde, inicio_custom))
+
+def calcular_parcelas(contrato, valor_total, qtde, inicio=0):
+    """
+    Monta (sem gravar) as parcelas do contrato.
+    O valor é arredondado em centavos e a diferença do arredondamento vai para a última parcela.
+    """
+    valor_parcela = (Decimal(valor_total) / qtde).quantize(Decimal('0.01'))
+    ultima_parcela = Decimal(valor_total) - valor_parcela * (qtde - 1)
 
+    parcelas = []
     for i in range(qtde):
-        numero_parcela = inicio_custom + i + 1
+        numero_parcela = inicio + i + 1
         
         # Data Vencimento
         data_venc = contrato.data_inicio + relativedelta(months=(numero_parcela - 1))
@@ -135,19 +165,39 @@ def gerar_financeiro(contrato, valor_custom=None, qtde_custom=None, inicio_custo
             data_venc = data_venc.replace(day=contrato.dia_vencimento)
         except ValueError:
             data_venc = data_venc + relativedelta(day=31)
-            
-        # Não gera boleto no passado se já venceu há muito tempo? (Opcional)
-        
-        Lancamento.objects.create(
-            descricao=f"Mensalidade {numero_parcela}/{contrato.qtde_parcelas} - {contrato.plano.nome}",
-            aluno=contrato.aluno,
-            contrato=contrato,
-            categoria=categoria,
-            conta=conta,
-            valor=valor_parcela,
-            data_vencimento=data_venc,
-            status='PENDENTE'
-        )
+
+        parcelas.append({
+            'descricao': f"Mensalidade {numero_parcela}/{contrato.qtde_parcelas} - {contrato.plano.nome}",
+            'valor': ultima_parcela if i == qtde - 1 else valor_parcela,
+            'data_vencimento': data_venc,
+            'parcela_atual': numero_parcela,
+            'total_parcelas': contrato.qtde_parcelas,
+        })
+    return parcelas
+
+def gravar_parcelas(contrato, parcelas):
+    """Grava as parcelas calculadas em um único bulk_create."""
+    # Busca Categoria/Conta (ajuste conforme seu banco)
+    # No multi-tenant, Category.objects.first() pega a categoria do schema atual.
+    categoria = CategoriaFinanceira.objects.filter(tipo='RECEITA').first()
+    conta = ContaBancaria.objects.first()
+    
+    if not categoria or not conta: return 0 # Evita crash
+
+    with transaction.atomic():
+        novos = Lancamento.objects.bulk_create([
+            Lancamento(
+                aluno=contrato.aluno,
+                contrato=contrato,
+                categoria=categoria,
+                conta=conta,
+                status='PENDENTE',
+                **dados
+            )
+            for dados in parcelas
+        ])
+        atualizar_resumo(depois=contribuicoes(novos))
+    return len(parcelas)
 
 def enviar_contrato_n8n(contrato):
     """
@@ -273,7 +273,13 @@ class ContratoUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        regenerar_contrato(self.object)
+        resumo = regenerar_contrato(self.object)
+        messages.info(
+            self.request,
+            f"Agenda: +{resumo['aulas_criadas']} / -{resumo['aulas_removidas']} aulas. "
+            f"Financeiro: +{resumo['parcelas_criadas']} / ~{resumo['parcelas_atualizadas']} / "
+            f"-{resumo['parcelas_removidas']} parcelas."
+        )
         return response
 
 class ContratoDeleteView(LoginRequiredMixin, DeleteView):
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+
+# ==============================================================================
+# CACHE DE EXTRAÇÕES DE IA (ENDEREÇADO POR CONTEÚDO)
+# ==============================================================================
+# A chave é o hash da imagem + versão do prompt + modelo: reprocessar o mesmo
+# documento não chama o Gemini de novo, e mudar o prompt ou o modelo invalida
+# sozinho as respostas antigas. Fica em disco, na media do tenant
+# (MEDIA_ROOT/<schema>/cache_extracao), um JSON por chave. Expira por TTL e,
+# passando do limite de itens, remove os menos usados (mtime = último acesso).
+
+TTL_DIAS = getattr(settings, 'CACHE_EXTRACAO_TTL_DIAS', 90)
+MAX_ITENS = getattr(settings, 'CACHE_EXTRACAO_MAX_ITENS', 20000)
+
+
+def hash_imagem(imagem_pil):
+    """Hash do conteúdo da imagem (pixels + dimensões), independente de nome ou metadados do arquivo."""
+    h = hashlib.sha256()
+    h.update(f"{imagem_pil.mode}:{imagem_pil.size}".encode())
+    h.update(imagem_pil.tobytes())
+    return h.hexdigest()
+
+
+def hash_conteudo(dados):
+    """Hash de bytes já codificados (ex.: a imagem JPEG enviada à IA)."""
+    return hashlib.sha256(dados).hexdigest()
+
+
+class CacheExtracao:
+    """Acertos/falhas são contados por instância (ex.: uma reconciliação inteira)."""
+
+    def __init__(self, pasta, ttl_dias=TTL_DIAS, max_itens=MAX_ITENS):
+        self.pasta = pasta
+        self.ttl = ttl_dias * 86400
+        self.max_itens = max_itens
+        self.acertos = 0
+        self.falhas = 0
+        self._gravacoes = 0
+        self._trava = threading.Lock()
+        os.makedirs(self.pasta, exist_ok=True)
+
+    @classmethod
+    def do_tenant(cls, schema_name=None):
+        """
+        Cache do tenant atual. Crie na thread da request: as threads do pool de extração
+        não herdam o schema da conexão.
+        """
+        schema_name = schema_name or getattr(connection, 'schema_name', 'public')
+        return cls(os.path.join(settings.MEDIA_ROOT, schema_name, 'cache_extracao'))
+
+    @staticmethod
+    def chave(hash_conteudo, versao_prompt, modelo):
+        return hashlib.sha256(f"{modelo}|{versao_prompt}|{hash_conteudo}".encode()).hexdigest()
+
+    def _caminho(self, chave):
+        # Dois níveis de pasta para não acumular milhares de arquivos num diretório só
+        return os.path.join(self.pasta, chave[:2], f"{chave}.json")
+
+    def obter(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            idade = time.time() - os.path.getmtime(caminho)
+            if idade > self.ttl:
+                os.remove(caminho)
+                raise FileNotFoundError
+            with open(caminho, encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+            os.utime(caminho)  # marca o último acesso (LRU)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._contar(acerto=False)
+            return None
+        self._contar(acerto=True)
+        return dados
+
+    def guardar(self, chave, dados):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+        with self._trava:
+            self._gravacoes += 1
+            despejar = self._gravacoes % 100 == 0
+        if despejar:
+            self.despejar()
+
+    def obter_ou_extrair(self, chave, extrair):
+        """Devolve do cache ou chama `extrair()`; só respostas válidas (dict sem 'erro') são guardadas."""
+        dados = self.obter(chave)
+        if dados is not None:
+            return dados
+        dados = extrair()
+        if dados and isinstance(dados, dict) and 'erro' not in dados:
+            self.guardar(chave, dados)
+        return dados
+
+    def _arquivos(self):
+        for raiz, _, nomes in os.walk(self.pasta):
+            for nome in nomes:
+                if nome.endswith('.json'):
+                    caminho = os.path.join(raiz, nome)
+                    try:
+                        info = os.stat(caminho)
+                    except FileNotFoundError:
+                        continue
+                    yield caminho, info
+
+    def despejar(self):
+        """Remove os vencidos pelo TTL e, acima de max_itens, os acessados há mais tempo. Retorna quantos saíram."""
+        limite = time.time() - self.ttl
+        vivos, removidos = [], 0
+        for caminho, info in self._arquivos():
+            if info.st_mtime < limite:
+                removidos += self._remover(caminho)
+            else:
+                vivos.append((info.st_mtime, caminho))
+
+        excesso = len(vivos) - self.max_itens
+        if excesso > 0:
+            for _, caminho in sorted(vivos)[:excesso]:
+                removidos += self._remover(caminho)
+        return removidos
+
+    @staticmethod
+    def _remover(caminho):
+        try:
+            os.remove(caminho)
+            return 1
+        except FileNotFoundError:
+            return 0  # outra thread/processo já removeu
+
+    def _contar(self, acerto):
+        with self._trava:
+            if acerto:
+                self.acertos += 1
+            else:
+                self.falhas += 1
+
+    def resumo(self):
+        consultas = self.acertos + self.falhas
+        taxa = round(self.acertos / consultas * 100, 1) if consultas else 0.0
+        return {'acertos': self.acertos, 'falhas': self.falhas, 'taxa_acerto': taxa}
+
+    def estatisticas(self):
+        """Acertos/falhas desta instância + ocupação em disco do cache."""
+        itens, tamanho = 0, 0
+        for _, info in self._arquivos():
+            itens += 1
+            tamanho += info.st_size
+        return {**self.resumo(), 'itens': itens, 'bytes': tamanho}
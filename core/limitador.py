@@ -0,0 +1,34 @@
+import threading
+import time
+
+# ==============================================================================
+# CONTROLE DE VAZÃO (TOKEN BUCKET)
+# ==============================================================================
+# Usado pela extração com Gemini (pdf_tools) e pelos disparos de WhatsApp
+# (comunicacao_fit): o ritmo das chamadas segue a cota do provedor.
+
+
+class LimitadorTaxa:
+    """
+    Token bucket thread-safe: libera até `por_minuto` chamadas por minuto, com rajadas
+    de até `rajada` chamadas seguidas. Substitui os time.sleep fixos entre páginas:
+    o ritmo passa a ser o da cota da API, não um atraso cego por página.
+    """
+    def __init__(self, por_minuto, rajada=None):
+        self.taxa = por_minuto / 60.0
+        self.capacidade = float(rajada or max(1, por_minuto // 6))
+        self.tokens = self.capacidade
+        self.ultimo = time.monotonic()
+        self.trava = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self.trava:
+                agora = time.monotonic()
+                self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                falta = (1 - self.tokens) / self.taxa
+            time.sleep(falta)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_public_schema_name, get_tenant_model
+from core.cache_extracao import CacheExtracao
+
+class Command(BaseCommand):
+    help = 'Mostra a ocupação do cache de extrações de IA por tenant e aplica o despejo (TTL/LRU)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--despejar', action='store_true', help='Remove itens vencidos e o excedente')
+        parser.add_argument('--schema', help='Processa apenas este schema')
+
+    def handle(self, *args, **options):
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+
+        for tenant in tenants:
+            cache = CacheExtracao.do_tenant(tenant.schema_name)
+            removidos = cache.despejar() if options['despejar'] else 0
+            stats = cache.estatisticas()
+            self.stdout.write(
+                f"[{tenant.schema_name}] {stats['itens']} itens, {stats['bytes'] / 1024:.0f} KB"
+                + (f", {removidos} removidos" if options['despejar'] else "")
+            )
+
+        self.stdout.write(self.style.SUCCESS('Cache de extração verificado!'))
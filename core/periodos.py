@@ -0,0 +1,44 @@
+from datetime import date, datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+
+# ==============================================================================
+# PERÍODOS COMO INTERVALOS SEMI-ABERTOS [inicio, fim)
+# ==============================================================================
+# Filtros como `__date`, `__year` e `__month` aplicam uma função na coluna
+# e impedem o Postgres de usar o índice. Aqui todo período vira um intervalo
+# `campo >= inicio AND campo < fim`, calculado no fuso do tenant.
+
+def limites_dia(dia):
+    return dia, dia + timedelta(days=1)
+
+def limites_intervalo(data_inicio, data_fim):
+    """Datas inclusivas (como vêm dos filtros de tela) -> intervalo semi-aberto."""
+    return data_inicio, data_fim + timedelta(days=1)
+
+def limites_semana(dia):
+    """Semana de segunda a domingo que contém `dia`."""
+    inicio = dia - timedelta(days=dia.weekday())
+    return inicio, inicio + timedelta(days=7)
+
+def limites_mes(ano, mes):
+    inicio = date(ano, mes, 1)
+    fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    return inicio, fim
+
+def limites_ano(ano):
+    return date(ano, 1, 1), date(ano + 1, 1, 1)
+
+def inicio_do_dia(dia):
+    """Meia-noite do dia no fuso atual, como datetime aware."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+def filtro_periodo(campo, inicio, fim, com_hora=True):
+    """
+    Q(campo >= inicio, campo < fim).
+    com_hora=True para DateTimeField (as datas viram meia-noite no fuso do tenant);
+    com_hora=False para DateField.
+    """
+    if com_hora:
+        inicio, fim = inicio_do_dia(inicio), inicio_do_dia(fim)
+    return Q(**{f'{campo}__gte': inicio, f'{campo}__lt': fim})
@@ -17,6 +17,7 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from cadastros_fit.models import Aluno
 from agenda_fit.models import Aula
+from .periodos import filtro_periodo, limites_dia
 from financeiro_fit.models import Lancamento
 from django.views.generic import ListView, CreateView, UpdateView
 from django.contrib.auth.models import User
@@ -27,7 +28,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 # Essa função agora manda o HTML completo (com menu)
 @login_required
 def home(request):
-    hoje = timezone.now().date()
+    hoje = timezone.localdate()
     
     # Pega os banners (da sua segunda função antiga)
     banners = BannerHome.objects.filter(ativo=True)
@@ -35,7 +36,7 @@ def home(request):
     # Prepara o contexto com os dados do dashboard (da sua primeira função antiga)
     context = {
         'total_alunos': Aluno.objects.count(),
-        'aulas_hoje': Aula.objects.filter(data_hora_inicio__date=hoje).count(),
+        'aulas_hoje': Aula.objects.filter(filtro_periodo('data_hora_inicio', *limites_dia(hoje))).count(),
         'receber_hoje': Lancamento.objects.filter(
             categoria__tipo='RECEITA', 
             data_vencimento=hoje, 
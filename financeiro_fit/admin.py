@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CategoriaFinanceira, ContaBancaria, Lancamento
+from .models import CategoriaFinanceira, ContaBancaria, Lancamento, MovimentoConta, ResumoFinanceiroMensal
 
 @admin.register(CategoriaFinanceira)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -10,8 +10,30 @@ class CategoriaAdmin(admin.ModelAdmin):
 class ContaAdmin(admin.ModelAdmin):
     list_display = ['nome', 'saldo_atual']
 
+    def get_readonly_fields(self, request, obj=None):
+        # Depois de criada, o saldo só muda por movimentos no diário
+        return ['saldo_atual'] if obj else []
+
+@admin.register(MovimentoConta)
+class MovimentoContaAdmin(admin.ModelAdmin):
+    list_display = ['data', 'conta', 'tipo', 'valor', 'historico']
+    list_filter = ['conta', 'tipo']
+    search_fields = ['historico']
+
+    # Diário só de inserção: ajustes entram como novos movimentos
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 @admin.register(Lancamento)
 class LancamentoAdmin(admin.ModelAdmin):
     list_display = ['data_vencimento', 'descricao', 'valor', 'status', 'categoria']
     list_filter = ['status', 'categoria__tipo', 'data_vencimento']
-    search_fields = ['descricao']
\ No newline at end of file
+    search_fields = ['descricao']
+
+@admin.register(ResumoFinanceiroMensal)
+class ResumoFinanceiroMensalAdmin(admin.ModelAdmin):
+    list_display = ['mes', 'categoria', 'conta', 'status', 'total', 'quantidade']
+    list_filter = ['mes', 'tipo', 'status']
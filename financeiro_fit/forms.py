@@ -37,6 +37,14 @@ class ContaBancariaForm(forms.ModelForm):
             'nome': forms.TextInput(attrs={'class': 'form-control'}),
             'saldo_atual': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
         }
+        labels = {'saldo_atual': 'Saldo inicial'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # O saldo só é informado na criação (vira o movimento de abertura); depois disso
+        # ele só muda por movimentos (baixas, estornos, ajustes), nunca editando o campo
+        if self.instance.pk:
+            del self.fields['saldo_atual']
 
 # ==============================================================================
 # 2. LANÇAMENTO DE DESPESA (CONTAS A PAGAR)
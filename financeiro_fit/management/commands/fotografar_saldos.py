@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from financeiro_fit.services_conta import fotografar_saldos
+
+class Command(BaseCommand):
+    help = 'Grava as fotos de saldo de fim de mês das contas bancárias (padrão: até o fim do mês passado), em todos os tenants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ate', help='Data limite (AAAA-MM-DD)')
+        parser.add_argument('--schema', help='Processa apenas este schema')
+
+    def handle(self, *args, **options):
+        ate = parse_date(options['ate']) if options['ate'] else None
+
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+
+        for tenant in tenants:
+            with tenant_context(tenant):
+                criadas = fotografar_saldos(ate=ate)
+            if criadas:
+                self.stdout.write(f"[{tenant.schema_name}] {criadas} fotos de saldo gravadas.")
+
+        self.stdout.write(self.style.SUCCESS('Saldos fotografados!'))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def popular_resumo(apps, schema_editor):
+    # O consolidado é mantido por deltas, então precisa nascer batendo com os lançamentos
+    Lancamento = apps.get_model('financeiro_fit', 'Lancamento')
+    ResumoFinanceiroMensal = apps.get_model('financeiro_fit', 'ResumoFinanceiroMensal')
+
+    grupos = Lancamento.objects.annotate(mes=TruncMonth('data_vencimento')).order_by().values(
+        'mes', 'categoria_id', 'categoria__tipo', 'conta_id', 'status'
+    ).annotate(total=Sum('valor'), quantidade=Count('id'))
+
+    ResumoFinanceiroMensal.objects.bulk_create([
+        ResumoFinanceiroMensal(
+            mes=g['mes'], categoria_id=g['categoria_id'], conta_id=g['conta_id'],
+            tipo=g['categoria__tipo'], status=g['status'],
+            total=g['total'], quantidade=g['quantidade'],
+        )
+        for g in grupos
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro_fit', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoFinanceiroMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês de vencimento')),
+                ('tipo', models.CharField(choices=[('RECEITA', 'Receita'), ('DESPESA', 'Despesa')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PAGO', 'Pago'), ('CANCELADO', 'Cancelado')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='financeiro_fit.categoriafinanceira')),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='financeiro_fit.contabancaria')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mes', 'status', 'tipo'], name='resumo_fin_mes_status_tipo_idx')],
+                'constraints': [models.UniqueConstraint(fields=('mes', 'categoria', 'conta', 'status'), name='resumo_fin_mes_cat_conta_status_unico')],
+            },
+        ),
+        migrations.RunPython(popular_resumo, migrations.RunPython.noop),
+    ]
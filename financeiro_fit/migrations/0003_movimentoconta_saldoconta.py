@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def popular_movimentos(apps, schema_editor):
+    # Cada lançamento PAGO vira uma baixa no diário; o que sobrar do saldo atual
+    # (saldo digitado no cadastro da conta) entra como saldo de abertura.
+    ContaBancaria = apps.get_model('financeiro_fit', 'ContaBancaria')
+    Lancamento = apps.get_model('financeiro_fit', 'Lancamento')
+    MovimentoConta = apps.get_model('financeiro_fit', 'MovimentoConta')
+
+    for conta in ContaBancaria.objects.all():
+        movimentos = []
+        for l in Lancamento.objects.filter(conta=conta, status='PAGO').select_related('categoria').order_by('data_pagamento', 'id'):
+            valor = l.valor if l.categoria.tipo == 'RECEITA' else -l.valor
+            movimentos.append(MovimentoConta(
+                conta=conta, lancamento=l, tipo='BAIXA',
+                data=l.data_pagamento or l.data_vencimento, valor=valor, historico=l.descricao[:200],
+            ))
+
+        diferenca = conta.saldo_atual - sum((m.valor for m in movimentos), 0)
+        if diferenca:
+            primeira = min((m.data for m in movimentos), default=timezone.localdate())
+            movimentos.insert(0, MovimentoConta(
+                conta=conta, tipo='ABERTURA', data=primeira, valor=diferenca, historico='Saldo de abertura',
+            ))
+
+        MovimentoConta.objects.bulk_create(movimentos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro_fit', '0002_resumofinanceiromensal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoConta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('BAIXA', 'Baixa'), ('ESTORNO', 'Estorno'), ('ABERTURA', 'Saldo de Abertura'), ('AJUSTE', 'Ajuste')], max_length=10)),
+                ('data', models.DateField()),
+                ('valor', models.DecimalField(decimal_places=2, help_text='Positivo entra, negativo sai', max_digits=12)),
+                ('historico', models.CharField(blank=True, max_length=200)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimentos', to='financeiro_fit.contabancaria')),
+                ('lancamento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos', to='financeiro_fit.lancamento')),
+            ],
+            options={
+                'ordering': ['data', 'id'],
+                'indexes': [models.Index(fields=['conta', 'data', 'id'], name='movimento_conta_data_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaldoConta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='financeiro_fit.contabancaria')),
+            ],
+            options={
+                'ordering': ['conta', 'data'],
+                'constraints': [models.UniqueConstraint(fields=('conta', 'data'), name='saldo_conta_data_unico')],
+            },
+        ),
+        migrations.RunPython(popular_movimentos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro_fit', '0003_movimentoconta_saldoconta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lancamento',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
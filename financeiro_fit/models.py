@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 import uuid
 from cadastros_fit.models import Aluno, Profissional
 from contratos_fit.models import Contrato
@@ -93,7 +93,97 @@ class Lancamento(models.Model):
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
     criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
     observacao = models.TextField(blank=True, null=True)
+
+    def save(self, *args, **kwargs):
+        # Os sinais (saldo e consolidado mensal) rodam na mesma transação da gravação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         tipo = "Receita" if self.categoria.tipo == 'RECEITA' else "Despesa"
-        return f"[{tipo}] {self.descricao} - R$ {self.valor}"
\ No newline at end of file
+        return f"[{tipo}] {self.descricao} - R$ {self.valor}"
+
+# ==============================================================================
+# 3. MOVIMENTAÇÃO DAS CONTAS (EXTRATO)
+# ==============================================================================
+
+class MovimentoConta(models.Model):
+    """
+    Diário de movimentações da conta, só de inserção: uma baixa vira um crédito/débito
+    e um estorno vira o lançamento contrário, nunca uma edição.
+    O saldo_atual da conta é atualizado com F() junto de cada movimento.
+    """
+    TIPO_CHOICES = [
+        ('BAIXA', 'Baixa'),
+        ('ESTORNO', 'Estorno'),
+        ('ABERTURA', 'Saldo de Abertura'),
+        ('AJUSTE', 'Ajuste'),
+    ]
+
+    conta = models.ForeignKey(ContaBancaria, on_delete=models.PROTECT, related_name='movimentos')
+    lancamento = models.ForeignKey(Lancamento, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    data = models.DateField()
+    valor = models.DecimalField(max_digits=12, decimal_places=2, help_text="Positivo entra, negativo sai")
+    historico = models.CharField(max_length=200, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['data', 'id']
+        indexes = [
+            models.Index(fields=['conta', 'data', 'id'], name='movimento_conta_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y} {self.conta.nome} R$ {self.valor} ({self.tipo})"
+
+class SaldoConta(models.Model):
+    """Foto do saldo da conta no fim de `data` (ponto de partida para calcular saldos passados)."""
+    conta = models.ForeignKey(ContaBancaria, on_delete=models.CASCADE, related_name='saldos')
+    data = models.DateField()
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        ordering = ['conta', 'data']
+        constraints = [
+            models.UniqueConstraint(fields=['conta', 'data'], name='saldo_conta_data_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.conta.nome} em {self.data:%d/%m/%Y}: R$ {self.saldo}"
+
+# ==============================================================================
+# 4. CONSOLIDADO MENSAL (DRE / DASHBOARD)
+# ==============================================================================
+
+class ResumoFinanceiroMensal(models.Model):
+    """
+    Total dos lançamentos por mês de vencimento, categoria, conta e status.
+    Mantido por financeiro_fit.services_resumo na mesma transação que grava o lançamento;
+    o DRE e o dashboard leem daqui em vez de agregar Lancamento.
+    """
+    mes = models.DateField(help_text="Primeiro dia do mês de vencimento")
+    categoria = models.ForeignKey(CategoriaFinanceira, on_delete=models.CASCADE)
+    conta = models.ForeignKey(ContaBancaria, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=10, choices=CategoriaFinanceira.TIPO_CHOICES)
+    status = models.CharField(max_length=20, choices=Lancamento.STATUS_CHOICES)
+
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'categoria', 'conta', 'status'], name='resumo_fin_mes_cat_conta_status_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['mes', 'status', 'tipo'], name='resumo_fin_mes_status_tipo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.mes:%m/%Y} - {self.categoria} / {self.conta.nome} ({self.status})"
@@ -0,0 +1,22 @@
+import os
+from xhtml2pdf import pisa
+
+# ==============================================================================
+# CONVERSÃO HTML -> PDF (roda nos processos do pool)
+# ==============================================================================
+# Este módulo não importa nada do Django: os processos filhos sobem sem
+# configurar o projeto nem abrir conexão com o banco.
+
+
+def html_para_pdf(html, destino):
+    """Gera o PDF em `destino` (escreve num temporário e renomeia, para nunca expor arquivo pela metade)."""
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    with open(temporario, 'wb') as arquivo:
+        status = pisa.CreatePDF(html, dest=arquivo)
+
+    if status.err:
+        os.remove(temporario)
+        raise RuntimeError(f"xhtml2pdf terminou com {status.err} erro(s)")
+
+    os.replace(temporario, destino)
+    return destino
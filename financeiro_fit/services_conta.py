@@ -0,0 +1,129 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import CategoriaFinanceira, ContaBancaria, MovimentoConta, SaldoConta
+
+# ==============================================================================
+# DIÁRIO DE MOVIMENTAÇÕES E SALDO DAS CONTAS
+# ==============================================================================
+# O saldo nunca é lido, somado em Python e salvo de volta (duas baixas simultâneas
+# na mesma conta perderiam uma delas). Cada movimento é inserido no diário e o
+# saldo_atual anda junto, com um UPDATE usando F(). As fotos em SaldoConta permitem
+# calcular o saldo de qualquer dia sem somar a conta desde o início.
+
+
+def registrar_movimento(conta_id, valor, data, tipo='BAIXA', lancamento=None, historico=''):
+    """Insere o movimento e aplica o valor no saldo atual e nas fotos de saldo a partir de `data`."""
+    with transaction.atomic():
+        movimento = MovimentoConta.objects.create(
+            conta_id=conta_id, lancamento=lancamento, tipo=tipo,
+            data=data, valor=valor, historico=historico[:200],
+        )
+        ContaBancaria.objects.filter(pk=conta_id).update(saldo_atual=F('saldo_atual') + valor)
+        # Movimento com data retroativa: as fotos posteriores passam a incluí-lo
+        SaldoConta.objects.filter(conta_id=conta_id, data__gte=data).update(saldo=F('saldo') + valor)
+    return movimento
+
+
+def efeito_no_saldo(lancamento, tipos):
+    """(conta_id, valor com sinal, data) do lançamento pago; None se ele não mexe no saldo."""
+    if lancamento is None or lancamento.status != 'PAGO':
+        return None
+    valor = Decimal(lancamento.valor)
+    if tipos.get(lancamento.categoria_id) != 'RECEITA':
+        valor = -valor
+    data = lancamento.data_pagamento or lancamento.data_vencimento
+    if isinstance(data, str):
+        data = parse_date(data)
+    return lancamento.conta_id, valor, data
+
+
+def sincronizar_lancamento(anterior, atual, historico=''):
+    """
+    Gera os movimentos da transição anterior -> atual de um lançamento:
+    baixa (passou a PAGO), estorno (deixou de ser PAGO ou foi excluído) ou
+    estorno + nova baixa (lançamento pago teve valor/conta/data alterados).
+    """
+    tipos = dict(CategoriaFinanceira.objects.filter(
+        id__in={l.categoria_id for l in (anterior, atual) if l is not None and l.status == 'PAGO'}
+    ).values_list('id', 'tipo'))
+
+    antes = efeito_no_saldo(anterior, tipos)
+    depois = efeito_no_saldo(atual, tipos)
+    if antes == depois:
+        return
+
+    lancamento = atual if atual is not None and atual.pk else None
+    historico = historico or (atual or anterior).descricao
+
+    with transaction.atomic():
+        if antes:
+            conta_id, valor, _ = antes
+            # O estorno entra na data em que acontece; o histórico passado não é reescrito
+            registrar_movimento(conta_id, -valor, timezone.localdate(), 'ESTORNO', lancamento, historico)
+        if depois:
+            conta_id, valor, data = depois
+            registrar_movimento(conta_id, valor, data, 'BAIXA', lancamento, historico)
+
+
+def saldo_em(conta, data):
+    """Saldo da conta no fim de `data`: última foto até a data + movimentos depois dela."""
+    foto = SaldoConta.objects.filter(conta=conta, data__lte=data).order_by('-data').first()
+    movimentos = MovimentoConta.objects.filter(conta=conta, data__lte=data)
+    base = Decimal('0')
+    if foto:
+        base = foto.saldo
+        movimentos = movimentos.filter(data__gt=foto.data)
+    return base + (movimentos.aggregate(total=Sum('valor'))['total'] or 0)
+
+
+def extrato(conta, data_inicio, data_fim):
+    """
+    Movimentos da conta em [data_inicio, data_fim] com o saldo acumulado linha a linha.
+    Retorna (saldo_inicial, movimentos, saldo_final); cada movimento ganha o atributo `saldo`.
+    """
+    saldo = saldo_inicial = saldo_em(conta, data_inicio - timedelta(days=1))
+
+    movimentos = list(
+        MovimentoConta.objects.filter(conta=conta, data__gte=data_inicio, data__lte=data_fim)
+        .select_related('lancamento__categoria')
+        .order_by('data', 'id')
+    )
+    for m in movimentos:
+        saldo += m.valor
+        m.saldo = saldo
+
+    return saldo_inicial, movimentos, saldo
+
+
+def fotografar_saldos(ate=None):
+    """
+    Grava a foto de saldo de fim de mês de cada conta, do mês seguinte à última foto até `ate`
+    (padrão: fim do mês passado). Retorna quantas fotos foram criadas.
+    """
+    ate = ate or timezone.localdate().replace(day=1) - timedelta(days=1)
+    criadas = 0
+
+    for conta in ContaBancaria.objects.all():
+        with transaction.atomic():
+            ultima = SaldoConta.objects.filter(conta=conta, data__lte=ate).order_by('-data').first()
+            saldo = ultima.saldo if ultima else Decimal('0')
+
+            movimentos = MovimentoConta.objects.filter(conta=conta, data__lte=ate)
+            if ultima:
+                movimentos = movimentos.filter(data__gt=ultima.data)
+
+            fotos = []
+            for mes in movimentos.annotate(mes=TruncMonth('data')).order_by('mes').values('mes').annotate(total=Sum('valor')):
+                saldo += mes['total']
+                fim_mes = min((mes['mes'] + timedelta(days=32)).replace(day=1) - timedelta(days=1), ate)
+                fotos.append(SaldoConta(conta=conta, data=fim_mes, saldo=saldo))
+
+            SaldoConta.objects.bulk_create(fotos, ignore_conflicts=True)
+            criadas += len(fotos)
+
+    return criadas
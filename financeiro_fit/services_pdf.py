@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Max, Q, Sum
+from django.template.loader import get_template
+from .models import Lancamento, MovimentoConta
+from .pdf_worker import html_para_pdf
+
+# ==============================================================================
+# EXTRATO EM PDF (RENDERIZAÇÃO EM SEGUNDO PLANO + CACHE)
+# ==============================================================================
+# O xhtml2pdf é pesado e preso à CPU. A request só monta o HTML e entrega a conversão
+# para um pool de processos; o arquivo fica na media do tenant, com o nome
+# amarrado à conta, ao período e à "versão" do extrato. Enquanto nada mudar,
+# o download seguinte sai direto do disco.
+
+_pool = None
+_trava = threading.Lock()
+_em_andamento = {}
+
+
+def _obter_pool():
+    global _pool
+    with _trava:
+        if _pool is None:
+            # spawn: os filhos não herdam conexões de banco nem threads do processo web
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PDF_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _lancamentos_extrato(conta, data_inicio, data_fim):
+    lancamentos = Lancamento.objects.filter(conta=conta, status='PAGO')
+    if data_inicio:
+        lancamentos = lancamentos.filter(data_pagamento__gte=data_inicio)
+    if data_fim:
+        lancamentos = lancamentos.filter(data_pagamento__lte=data_fim)
+    return lancamentos
+
+
+def versao_extrato(conta, data_inicio=None, data_fim=None):
+    """
+    Marca de "última alteração" do extrato: último movimento da conta (baixas, estornos,
+    exclusões e o saldo exibido) + última edição dos lançamentos do período.
+    """
+    ultimo_movimento = MovimentoConta.objects.filter(conta=conta).aggregate(m=Max('id'))['m'] or 0
+    ultima_edicao = _lancamentos_extrato(conta, data_inicio, data_fim).aggregate(m=Max('atualizado_em'))['m']
+    return f"{ultimo_movimento}-{int(ultima_edicao.timestamp()) if ultima_edicao else 0}"
+
+
+def _prefixo(conta, data_inicio, data_fim):
+    return f"extratos/conta_{conta.pk}/{data_inicio or 'inicio'}_{data_fim or 'hoje'}_"
+
+
+def renderizar_html(conta, data_inicio=None, data_fim=None):
+    lancamentos = _lancamentos_extrato(conta, data_inicio, data_fim)
+    totais = lancamentos.aggregate(
+        entradas=Sum('valor', filter=Q(categoria__tipo='RECEITA')),
+        saidas=Sum('valor', filter=Q(categoria__tipo='DESPESA')),
+    )
+    return get_template('financeiro_fit/extrato_pdf.html').render({
+        'conta': conta,
+        'lancamentos': lancamentos.select_related('aluno', 'categoria').order_by('data_pagamento', 'id'),
+        'inicio': data_inicio,
+        'fim': data_fim,
+        'total_entradas': totais['entradas'] or 0,
+        'total_saidas': totais['saidas'] or 0,
+    })
+
+
+def solicitar_extrato_pdf(conta, data_inicio=None, data_fim=None, espera=3):
+    """
+    Devolve o nome (no default_storage) do PDF pronto, ou None se ele ainda está sendo gerado.
+    Só dispara uma renderização por arquivo; chamadas repetidas esperam até `espera` segundos
+    pela que já está em andamento.
+    """
+    prefixo = _prefixo(conta, data_inicio, data_fim)
+    nome = f"{prefixo}{versao_extrato(conta, data_inicio, data_fim)}.pdf"
+    if default_storage.exists(nome):
+        return nome
+
+    # O caminho absoluto já sai com a pasta do tenant (TenantFileSystemStorage)
+    destino = default_storage.path(nome)
+
+    with _trava:
+        futuro = _em_andamento.get(destino)
+
+    if futuro is None:
+        html = renderizar_html(conta, data_inicio, data_fim)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        _remover_versoes_antigas(prefixo, nome)
+
+        pool = _obter_pool()
+        with _trava:
+            futuro = _em_andamento.get(destino)
+            if futuro is None:
+                futuro = pool.submit(html_para_pdf, html, destino)
+                _em_andamento[destino] = futuro
+                futuro.add_done_callback(lambda f: _concluido(destino, f))
+
+    try:
+        futuro.result(timeout=espera)
+    except TimeoutError:
+        return None
+    except Exception:
+        # A falha foi entregue a quem pediu: a próxima solicitação tenta renderizar de novo
+        _descartar(destino, futuro)
+        raise
+    return nome
+
+
+def _concluido(destino, futuro):
+    # Uma renderização que falhou continua registrada até alguém ler o erro; senão a
+    # página de espera (que se recarrega sozinha) dispararia outra para sempre
+    if futuro.cancelled() or futuro.exception() is None:
+        _descartar(destino, futuro)
+
+
+def _descartar(destino, futuro):
+    with _trava:
+        if _em_andamento.get(destino) is futuro:
+            del _em_andamento[destino]
+
+
+def _remover_versoes_antigas(prefixo, nome_atual):
+    pasta, inicio_nome = os.path.split(prefixo)
+    if not default_storage.exists(pasta):
+        return
+    _, arquivos = default_storage.listdir(pasta)
+    for arquivo in arquivos:
+        if arquivo.startswith(inicio_nome) and arquivo.endswith('.pdf') and f"{pasta}/{arquivo}" != nome_atual:
+            default_storage.delete(f"{pasta}/{arquivo}")
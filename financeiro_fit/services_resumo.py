@@ -0,0 +1,84 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from .models import CategoriaFinanceira, Lancamento, ResumoFinanceiroMensal
+
+# ==============================================================================
+# CONSOLIDADO MENSAL DO FINANCEIRO (ResumoFinanceiroMensal)
+# ==============================================================================
+# Cada lançamento contribui com (valor, 1) no balde (mês de vencimento, categoria,
+# conta, status). Criar, baixar, estornar, editar ou excluir vira um delta
+# "depois - antes" aplicado com F() na mesma transação da gravação.
+
+CAMPOS_RESUMO = ['data_vencimento', 'categoria_id', 'conta_id', 'status', 'valor']
+
+
+def contribuicoes(lancamentos):
+    """{(mes, categoria_id, conta_id, status): [valor, quantidade]} dos lançamentos informados."""
+    baldes = defaultdict(lambda: [Decimal('0'), 0])
+    for l in lancamentos:
+        chave = (l.data_vencimento.replace(day=1), l.categoria_id, l.conta_id, l.status)
+        baldes[chave][0] += Decimal(l.valor)
+        baldes[chave][1] += 1
+    return baldes
+
+
+def atualizar_resumo(antes=None, depois=None):
+    """Aplica no consolidado a diferença entre duas contribuições (ver `contribuicoes`)."""
+    antes, depois = antes or {}, depois or {}
+
+    deltas = {}
+    for chave in set(antes) | set(depois):
+        valor_antes, qtde_antes = antes.get(chave, (0, 0))
+        valor_depois, qtde_depois = depois.get(chave, (0, 0))
+        if valor_depois != valor_antes or qtde_depois != qtde_antes:
+            deltas[chave] = (valor_depois - valor_antes, qtde_depois - qtde_antes)
+
+    if not deltas:
+        return
+
+    tipos = dict(CategoriaFinanceira.objects.filter(id__in={c[1] for c in deltas}).values_list('id', 'tipo'))
+
+    with transaction.atomic():
+        # Ordem fixa das chaves para duas transações não se travarem em ordem cruzada
+        for chave in sorted(deltas):
+            mes, categoria_id, conta_id, status = chave
+            valor, qtde = deltas[chave]
+            filtro = {'mes': mes, 'categoria_id': categoria_id, 'conta_id': conta_id, 'status': status}
+
+            if ResumoFinanceiroMensal.objects.filter(**filtro).update(
+                total=F('total') + valor, quantidade=F('quantidade') + qtde
+            ):
+                continue
+
+            try:
+                with transaction.atomic():
+                    ResumoFinanceiroMensal.objects.create(
+                        tipo=tipos.get(categoria_id), total=valor, quantidade=qtde, **filtro
+                    )
+            except IntegrityError:
+                # Outra transação criou o balde no meio do caminho
+                ResumoFinanceiroMensal.objects.filter(**filtro).update(
+                    total=F('total') + valor, quantidade=F('quantidade') + qtde
+                )
+
+
+def reconstruir_resumo():
+    """Refaz o consolidado inteiro do schema atual a partir dos lançamentos."""
+    grupos = Lancamento.objects.annotate(mes=TruncMonth('data_vencimento')).order_by().values(
+        'mes', 'categoria_id', 'categoria__tipo', 'conta_id', 'status'
+    ).annotate(total=Sum('valor'), quantidade=Count('id'))
+
+    with transaction.atomic():
+        ResumoFinanceiroMensal.objects.all().delete()
+        linhas = ResumoFinanceiroMensal.objects.bulk_create([
+            ResumoFinanceiroMensal(
+                mes=g['mes'], categoria_id=g['categoria_id'], conta_id=g['conta_id'],
+                tipo=g['categoria__tipo'], status=g['status'],
+                total=g['total'], quantidade=g['quantidade'],
+            )
+            for g in grupos
+        ], batch_size=1000)
+    return len(linhas)
@@ -1,27 +1,71 @@
-from django.db import models
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Lancamento
+from django.utils import timezone
+from .models import CategoriaFinanceira, ContaBancaria, Lancamento, ResumoFinanceiroMensal
+from .services_conta import registrar_movimento, sincronizar_lancamento
+from .services_resumo import CAMPOS_RESUMO, atualizar_resumo, contribuicoes
 
+# Campos da versão gravada que os sinais comparam com a nova
+CAMPOS_ANTERIOR = CAMPOS_RESUMO + ['data_pagamento']
+
+
+@receiver(pre_save, sender=Lancamento)
+def guardar_lancamento_anterior(sender, instance, raw=False, **kwargs):
+    """Guarda a versão gravada para o post_save aplicar só a diferença (saldo e consolidado)."""
+    instance._anterior = None
+    if instance.pk and not raw:
+        instance._anterior = Lancamento.objects.filter(pk=instance.pk).only(*CAMPOS_ANTERIOR).first()
+
+
+# ==============================================================================
+# SALDO DAS CONTAS (DIÁRIO DE MOVIMENTAÇÕES)
+# ==============================================================================
+
+@receiver(post_save, sender=Lancamento)
+def atualizar_saldo(sender, instance, raw=False, **kwargs):
+    """Baixa, estorno ou edição de um lançamento pago viram movimentos no diário da conta."""
+    if raw:
+        return
+    sincronizar_lancamento(getattr(instance, '_anterior', None), instance)
+
+
+@receiver(post_delete, sender=Lancamento)
+def estornar_saldo_removido(sender, instance, **kwargs):
+    # O lançamento já foi apagado: o estorno fica no diário só com o histórico
+    sincronizar_lancamento(instance, None, historico=f"Excluído: {instance.descricao}")
+
+
+@receiver(post_save, sender=ContaBancaria)
+def abrir_conta(sender, instance, created, raw=False, **kwargs):
+    # O saldo digitado no cadastro entra no diário como saldo de abertura
+    if created and not raw and instance.saldo_atual:
+        saldo = instance.saldo_atual
+        ContaBancaria.objects.filter(pk=instance.pk).update(saldo_atual=0)
+        registrar_movimento(instance.pk, saldo, timezone.localdate(), 'ABERTURA', historico='Saldo de abertura')
+
+
+# ==============================================================================
+# CONSOLIDADO MENSAL (DRE / DASHBOARD)
+# ==============================================================================
 
 @receiver(post_save, sender=Lancamento)
-def atualizar_saldo(sender, instance, created, **kwargs):
-    """
-    Recalcula o saldo da conta bancária sempre que um lançamento é salvo.
-    Lógica simplificada: Soma tudo que é PAGO dessa conta.
-    """
-    conta = instance.conta
-    
-    # Soma Receitas Pagas
-    receitas = Lancamento.objects.filter(
-        conta=conta, status='PAGO', categoria__tipo='RECEITA'
-    ).aggregate(total=models.Sum('valor'))['total'] or 0
-    
-    # Soma Despesas Pagas
-    despesas = Lancamento.objects.filter(
-        conta=conta, status='PAGO', categoria__tipo='DESPESA'
-    ).aggregate(total=models.Sum('valor'))['total'] or 0
-    
-    # Atualiza
-    conta.saldo_atual = receitas - despesas
-    conta.save()
\ No newline at end of file
+def lancamento_salvo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_anterior', None)
+    atualizar_resumo(
+        antes=contribuicoes([anterior] if anterior else []),
+        depois=contribuicoes([instance]),
+    )
+
+
+@receiver(post_delete, sender=Lancamento)
+def lancamento_removido(sender, instance, **kwargs):
+    atualizar_resumo(antes=contribuicoes([instance]))
+
+
+@receiver(post_save, sender=CategoriaFinanceira)
+def categoria_salva(sender, instance, created, raw=False, **kwargs):
+    # O tipo é copiado no consolidado; se a categoria mudar de tipo, acompanha
+    if not created and not raw:
+        ResumoFinanceiroMensal.objects.filter(categoria=instance).exclude(tipo=instance.tipo).update(tipo=instance.tipo)
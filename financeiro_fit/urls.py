@@ -40,6 +40,7 @@ urlpatterns = [
     # 4. EXTRATOS E RELATÓRIOS
     path('config/contas/<int:pk>/extrato/', views.ContaExtratoView.as_view(), name='conta_extrato'),
     path('contas/<int:pk>/exportar/excel/', views.exportar_extrato_excel, name='exportar_extrato_excel'),
+    path('contas/<int:pk>/exportar/csv/', views.exportar_extrato_csv, name='exportar_extrato_csv'),
     path('contas/<int:pk>/exportar/pdf/', views.exportar_extrato_pdf, name='exportar_extrato_pdf'),
 
     path('fornecedores/', views.FornecedorListView.as_view(), name='fornecedor_list'),
@@ -5,28 +5,35 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Sum
-from django.http import HttpResponseRedirect, HttpResponse
-from django.template.loader import get_template
+from django.http import FileResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.utils.dateparse import parse_date
 import calendar
+import logging
 from django.db.models import Q
 from .models import Lancamento
 import uuid
 import csv
+import tempfile
 from dateutil.relativedelta import relativedelta
-from xhtml2pdf import pisa
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 from datetime import datetime, date  # <--- CERTIFIQUE-SE DE TER O 'date' AQUI
 import calendar
 
 # Imports Locais
-from .models import Lancamento, CategoriaFinanceira, ContaBancaria, Fornecedor
+from .models import Lancamento, CategoriaFinanceira, ContaBancaria, Fornecedor, ResumoFinanceiroMensal
 from .forms import CategoriaForm, ContaBancariaForm, DespesaForm, FornecedorForm
+from .services_conta import extrato
+from .services_pdf import solicitar_extrato_pdf
 from cadastros_fit.models import Aluno
 
-from django.db.models.functions import ExtractMonth
 from contratos_fit.models import Contrato
+from core.periodos import filtro_periodo, limites_ano
+
+logger = logging.getLogger(__name__)
 
 # ==============================================================================
 # 1. CONTAS A RECEBER (ANTIGO FLUXO DE CAIXA GERAL)
@@ -189,50 +196,43 @@ def baixar_lancamento(request, pk):
     
     if request.method == 'POST':
         # Pega os dados do modal
-        data_pagto = request.POST.get('data_pagamento')
+        data_pagto = parse_date(request.POST.get('data_pagamento') or '')
         obs = request.POST.get('observacao')
         forma = request.POST.get('forma_pagamento', 'PIX')
 
-        lancamento.status = 'PAGO'
-        lancamento.data_pagamento = data_pagto if data_pagto else timezone.now().date()
-        lancamento.observacao = obs
-        lancamento.forma_pagamento = forma
-        lancamento.save()
-        
-        # Atualiza o saldo bancário
-        if lancamento.conta:
-            if lancamento.categoria.tipo == 'RECEITA':
-                lancamento.conta.saldo_atual += lancamento.valor
-            else:
-                lancamento.conta.saldo_atual -= lancamento.valor
-            lancamento.conta.save()
+        with transaction.atomic():
+            # Trava o lançamento: dois cliques/abas não geram duas baixas no saldo
+            lancamento = Lancamento.objects.select_for_update().get(pk=pk)
+            if lancamento.status == 'PAGO':
+                messages.info(request, "Este lançamento já estava baixado.")
+                return redirect(request.META.get('HTTP_REFERER', 'contas_receber'))
+
+            lancamento.status = 'PAGO'
+            lancamento.data_pagamento = data_pagto or timezone.localdate()
+            lancamento.observacao = obs
+            lancamento.forma_pagamento = forma
+            # O sinal registra a baixa no diário da conta e atualiza o saldo
+            lancamento.save()
         
-        messages.success(request, f"Recebimento de {lancamento.aluno.nome} confirmado!")
+        messages.success(request, f"Recebimento de {lancamento.aluno.nome if lancamento.aluno else lancamento.descricao} confirmado!")
         
     return redirect(request.META.get('HTTP_REFERER', 'contas_receber'))
 
 @login_required
 def estornar_lancamento(request, pk):
     """ Reverte um lançamento PAGO para PENDENTE """
-    lancamento = get_object_or_404(Lancamento, pk=pk)
-    
-    if request.method == 'POST' and lancamento.status == 'PAGO':
-        # Remove o valor do saldo bancário (revertendo)
-        if lancamento.conta:
-            if lancamento.categoria.tipo == 'RECEITA':
-                lancamento.conta.saldo_atual -= lancamento.valor
-            else:
-                lancamento.conta.saldo_atual += lancamento.valor
-            lancamento.conta.save()
-
-        # Reseta os campos
-        lancamento.status = 'PENDENTE'
-        lancamento.data_pagamento = None
-        # Mantemos a observação mas avisamos que foi estornado
-        lancamento.observacao = f"[ESTORNADO] {lancamento.observacao or ''}"
-        lancamento.save()
+    if request.method == 'POST':
+        with transaction.atomic():
+            lancamento = get_object_or_404(Lancamento.objects.select_for_update(), pk=pk)
+            if lancamento.status == 'PAGO':
+                # Reseta os campos (o sinal lança o estorno no diário da conta)
+                lancamento.status = 'PENDENTE'
+                lancamento.data_pagamento = None
+                # Mantemos a observação mas avisamos que foi estornado
+                lancamento.observacao = f"[ESTORNADO] {lancamento.observacao or ''}"
+                lancamento.save()
         
-        messages.warning(request, "Lançamento estornado com sucesso!")
+                messages.warning(request, "Lançamento estornado com sucesso!")
         
     return redirect(request.META.get('HTTP_REFERER', 'contas_receber'))
 
@@ -318,69 +318,111 @@ class ContaExtratoView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Filtros de data vindos da URL (?data_inicio=...&data_fim=...)
-        data_inicio = self.request.GET.get('data_inicio')
-        data_fim = self.request.GET.get('data_fim')
-        
-        # Busca lançamentos desta conta
-        lancamentos = Lancamento.objects.filter(conta=self.object).order_by('-data_vencimento')
+        # Filtros de data vindos da URL (?data_inicio=...&data_fim=...); padrão: mês atual
+        hoje = timezone.localdate()
+        data_inicio = parse_date(self.request.GET.get('data_inicio') or '') or hoje.replace(day=1)
+        data_fim = parse_date(self.request.GET.get('data_fim') or '') or hoje
         
-        if data_inicio:
-            lancamentos = lancamentos.filter(data_vencimento__gte=data_inicio)
-        if data_fim:
-            lancamentos = lancamentos.filter(data_vencimento__lte=data_fim)
+        # Saldo de abertura (foto + movimentos) e uma varredura por intervalo no diário da conta
+        saldo_inicial, movimentos, saldo_final = extrato(self.object, data_inicio, data_fim)
             
-        context['lancamentos'] = lancamentos
-        context['filtros'] = self.request.GET # Para manter as datas nos campos do form
+        context['movimentos'] = movimentos
+        context['saldo_inicial'] = saldo_inicial
+        context['saldo_final'] = saldo_final
+        context['filtros'] = {'data_inicio': data_inicio.isoformat(), 'data_fim': data_fim.isoformat()}
         return context
 # ==============================================================================
 # 5. EXPORTAÇÃO (EXCEL E PDF)
 # ==============================================================================
     
+COLUNAS_EXTRATO = ['Data', 'Descrição', 'Aluno/Fornecedor', 'Valor', 'Status']
+
+def _lancamentos_exportacao(request, conta):
+    """
+    Lançamentos da conta no período pedido (?data_inicio=&data_fim=, opcionais), já com os nomes
+    de aluno/fornecedor no mesmo SELECT e lidos em blocos por cursor no servidor.
+    """
+    lancamentos = Lancamento.objects.filter(conta=conta)
+    data_inicio = parse_date(request.GET.get('data_inicio') or '')
+    data_fim = parse_date(request.GET.get('data_fim') or '')
+    if data_inicio:
+        lancamentos = lancamentos.filter(data_vencimento__gte=data_inicio)
+    if data_fim:
+        lancamentos = lancamentos.filter(data_vencimento__lte=data_fim)
+
+    colunas = lancamentos.order_by('data_vencimento', 'id').values_list(
+        'data_vencimento', 'descricao', 'aluno__nome', 'fornecedor__nome', 'valor', 'status'
+    )
+    for vencimento, descricao, aluno, fornecedor, valor, status in colunas.iterator(chunk_size=2000):
+        yield vencimento.strftime('%d/%m/%Y'), descricao, aluno or fornecedor or "", valor, status
+
+@login_required
 def exportar_extrato_excel(request, pk):
     conta = get_object_or_404(ContaBancaria, pk=pk)
-    lancamentos = Lancamento.objects.filter(conta=conta).order_by('data_vencimento')
     
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Extrato - {conta.nome}"
+    # write_only: as linhas vão direto para um arquivo temporário, sem montar a planilha em memória
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=f"Extrato - {conta.nome}"[:31])
+    ws.append(COLUNAS_EXTRATO)
     
-    # Cabeçalho
-    columns = ['Data', 'Descrição', 'Aluno/Fornecedor', 'Valor', 'Status']
-    ws.append(columns)
+    for data, descricao, nome, valor, status in _lancamentos_exportacao(request, conta):
+        ws.append([data, descricao, nome, float(valor), status])
     
-    for l in lancamentos:
-        ws.append([
-            l.data_vencimento.strftime('%d/%m/%Y'),
-            l.descricao,
-            l.aluno.nome if l.aluno else (l.fornecedor.nome if l.fornecedor else ""),
-            float(l.valor),
-            l.status
-        ])
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=extrato_{conta.nome}.xlsx'
-    wb.save(response)
+    arquivo = tempfile.TemporaryFile()
+    wb.save(arquivo)
+    arquivo.seek(0)
+
+    # FileResponse envia o arquivo em blocos e fecha (apagando o temporário) no final
+    return FileResponse(
+        arquivo, as_attachment=True, filename=f'extrato_{conta.nome}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+class _Eco:
+    """Buffer falso: o csv.writer devolve a linha formatada em vez de guardar."""
+    def write(self, valor):
+        return valor
+
+@login_required
+def exportar_extrato_csv(request, pk):
+    conta = get_object_or_404(ContaBancaria, pk=pk)
+    escritor = csv.writer(_Eco(), delimiter=';')
+
+    def linhas():
+        # BOM + ';' + vírgula decimal: o Excel em português abre direto
+        yield '\ufeff' + escritor.writerow(COLUNAS_EXTRATO)
+        for data, descricao, nome, valor, status in _lancamentos_exportacao(request, conta):
+            yield escritor.writerow([data, descricao, nome, f"{valor:.2f}".replace('.', ','), status])
+
+    response = StreamingHttpResponse(linhas(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="extrato_{conta.nome}.csv"'
     return response
 
 # --- EXPORTAR PDF ---
+@login_required
 def exportar_extrato_pdf(request, pk):
     conta = get_object_or_404(ContaBancaria, pk=pk)
-    lancamentos = Lancamento.objects.filter(conta=conta).order_by('data_vencimento')
-    
-    template_path = 'financeiro_fit/extrato_pdf_template.html'
-    context = {'conta': conta, 'lancamentos': lancamentos, 'hoje': timezone.now()}
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="extrato_{conta.nome}.pdf"'
-    
-    template = get_template(template_path)
-    html = template.render(context)
+    data_inicio = parse_date(request.GET.get('data_inicio') or '')
+    data_fim = parse_date(request.GET.get('data_fim') or '')
     
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('Erro ao gerar PDF', status=500)
-    return response
+    # A conversão roda num pool de processos; se o extrato não mudou, o PDF já está no disco
+    try:
+        nome = solicitar_extrato_pdf(conta, data_inicio, data_fim)
+    except Exception:
+        logger.exception(f"Erro ao gerar PDF do extrato da conta #{conta.pk}")
+        # Sem Refresh: a página para de tentar e mostra o erro; o usuário pode pedir de novo
+        return render(request, 'financeiro_fit/extrato_pdf_aguarde.html', {'conta': conta, 'erro': True}, status=500)
+
+    if nome is None:
+        # Ainda gerando: a página pede de novo sozinha em alguns segundos
+        response = render(request, 'financeiro_fit/extrato_pdf_aguarde.html', {'conta': conta}, status=202)
+        response['Refresh'] = '3'
+        return response
+
+    return FileResponse(
+        default_storage.open(nome, 'rb'), as_attachment=True,
+        filename=f'extrato_{conta.nome}.pdf', content_type='application/pdf',
+    )
 
 class DashboardFinanceiroView(LoginRequiredMixin, TemplateView):
     template_name = 'financeiro_fit/dashboard_financeiro.html'
@@ -399,29 +441,30 @@ class DashboardFinanceiroView(LoginRequiredMixin, TemplateView):
         context['ano_atual'] = ano
         context['mes_atual'] = mes
         
-        # 1. Totais do Mês
-        lancamentos_mes = Lancamento.objects.filter(data_vencimento__range=[inicio_mes, fim_mes])
-        
-        receitas = lancamentos_mes.filter(categoria__tipo='RECEITA', status='PAGO').aggregate(Sum('valor'))['valor__sum'] or 0
-        despesas = lancamentos_mes.filter(categoria__tipo='DESPESA', status='PAGO').aggregate(Sum('valor'))['valor__sum'] or 0
+        # 1. Totais do Mês (lidos do consolidado mensal)
+        totais_mes = ResumoFinanceiroMensal.objects.filter(mes=inicio_mes, status='PAGO').aggregate(
+            receitas=Sum('total', filter=Q(tipo='RECEITA')),
+            despesas=Sum('total', filter=Q(tipo='DESPESA')),
+        )
+        receitas = totais_mes['receitas'] or 0
+        despesas = totais_mes['despesas'] or 0
         context['receita_mes'] = receitas
         context['despesa_mes'] = despesas
         context['resultado_mes'] = receitas - despesas
 
         # 2. Gráfico Mês a Mês (Ano Todo)
-        # Pega dados do ano inteiro agrupados por mês
-        dados_ano = Lancamento.objects.filter(data_vencimento__year=ano, status='PAGO') \
-            .annotate(mes=ExtractMonth('data_vencimento')) \
-            .values('mes', 'categoria__tipo') \
-            .annotate(total=Sum('valor'))
+        # No máximo 12 meses x 2 tipos, independente do volume de lançamentos
+        dados_ano = ResumoFinanceiroMensal.objects.filter(
+            filtro_periodo('mes', *limites_ano(ano), com_hora=False), status='PAGO'
+        ).values('mes', 'tipo').annotate(total=Sum('total'))
             
         # Prepara arrays para o Chart.js (12 posições zeradas)
         receita_anual = [0] * 12
         despesa_anual = [0] * 12
         
         for d in dados_ano:
-            idx = d['mes'] - 1
-            if d['categoria__tipo'] == 'RECEITA':
+            idx = d['mes'].month - 1
+            if d['tipo'] == 'RECEITA':
                 receita_anual[idx] = float(d['total'])
             else:
                 despesa_anual[idx] = float(d['total'])
@@ -462,27 +505,27 @@ def relatorio_dre(request):
     mes_selecionado = int(request.GET.get('mes', hoje.month))
     ano_selecionado = int(request.GET.get('ano', hoje.year))
 
-    # 2. Filtrar Lançamentos PAGOS no período
+    # 2. Consolidado dos lançamentos PAGOS no mês
     # Usamos o status 'PAGO' para ser um DRE de regime de caixa (o que realmente entrou/saiu)
-    base_queryset = Lancamento.objects.filter(
+    base_queryset = ResumoFinanceiroMensal.objects.filter(
+        mes=date(ano_selecionado, mes_selecionado, 1),
         status='PAGO',
-        data_vencimento__month=mes_selecionado,
-        data_vencimento__year=ano_selecionado
+        quantidade__gt=0,
     )
 
     # 3. Agrupar Receitas por Categoria
-    dre_receitas = base_queryset.filter(categoria__tipo='RECEITA').values(
+    dre_receitas = list(base_queryset.filter(tipo='RECEITA').values(
         'categoria__nome'
     ).annotate(
-        total=Sum('valor')
-    ).order_by('-total')
+        total=Sum('total')
+    ).order_by('-total'))
 
     # 4. Agrupar Despesas por Categoria
-    dre_despesas = base_queryset.filter(categoria__tipo='DESPESA').values(
+    dre_despesas = list(base_queryset.filter(tipo='DESPESA').values(
         'categoria__nome'
     ).annotate(
-        total=Sum('valor')
-    ).order_by('-total')
+        total=Sum('total')
+    ).order_by('-total'))
 
     # 5. Calcular Totais Finais
     total_receitas = sum(item['total'] for item in dre_receitas) or 0
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import JobConciliacao
 
-# Register your models here.
+@admin.register(JobConciliacao)
+class JobConciliacaoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'usuario', 'status', 'tentativas', 'criado_em', 'concluido_em']
+    list_filter = ['status']
+    readonly_fields = ['caminho_comprovantes', 'caminhos_boletos', 'url_resultado', 'erro', 'tentativas', 'iniciado_em', 'concluido_em']
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pdf_tools import services
+from pdf_tools.services_boleto import DATA_BASE_FATOR, DATA_BASE_FATOR_REINICIO, modulo10, modulo11
+from core.cache_extracao import CacheExtracao
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class ModeloFalso:
+    """
+    Substituto local do genai.GenerativeModel. Reconhece cada imagem pelo hash do JPEG
+    (as páginas sintéticas são rasterizadas antes, com a mesma função do pipeline) e
+    responde com o gabarito, depois de `latencia` segundos e falhando com `taxa_erro`.
+    """
+    gabarito = {}
+    latencia = 0.0
+    taxa_erro = 0.0
+    chamadas = 0
+    _trava = threading.Lock()
+
+    def __init__(self, model_name, *args, **kwargs):
+        self.model_name = model_name
+
+    @classmethod
+    def configurar(cls, gabarito, latencia, taxa_erro):
+        cls.gabarito, cls.latencia, cls.taxa_erro, cls.chamadas = gabarito, latencia, taxa_erro, 0
+
+    def generate_content(self, partes, generation_config=None, **kwargs):
+        with self._trava:
+            ModeloFalso.chamadas += 1
+        time.sleep(self.latencia)
+        if random.random() < self.taxa_erro:
+            raise RuntimeError('Erro simulado da API')
+
+        if any(isinstance(p, str) and 'CANDIDATO ÍNDICE' in p for p in partes):
+            return RespostaFalsa(self._desempate(partes))
+
+        imagens = [self.gabarito.get(hashlib.sha256(p['data']).hexdigest(), {}) for p in partes if isinstance(p, dict)]
+        if any(isinstance(p, str) and p.startswith('PÁGINA ') for p in partes):
+            return RespostaFalsa([{'pagina': n, **self._campos(g)} for n, g in enumerate(imagens, start=1)])
+        return RespostaFalsa(self._campos(imagens[0]))
+
+    @staticmethod
+    def _campos(verdade):
+        return {k: v for k, v in verdade.items() if not k.startswith('_')}
+
+    def _desempate(self, partes):
+        imagens = [self.gabarito.get(hashlib.sha256(p['data']).hexdigest(), {}) for p in partes if isinstance(p, dict)]
+        boleto, candidatos = imagens[0], imagens[1:]
+        for i, c in enumerate(candidatos):
+            if c.get('_pagina') is not None and c.get('_pagina') == boleto.get('_par'):
+                return {'melhor_indice_candidato': i, 'justificativa': 'gabarito'}
+        return {'melhor_indice_candidato': -1, 'justificativa': 'sem par no gabarito'}
+
+
+class RespostaFalsa:
+    def __init__(self, dados):
+        self.text = json.dumps(dados)
+
+
+def montar_linha_digitavel(valor, vencimento, rng):
+    """Linha digitável bancária válida (DVs mod 10/11) para o valor e vencimento dados."""
+    base_fator = DATA_BASE_FATOR_REINICIO if vencimento >= date(2025, 2, 22) else DATA_BASE_FATOR
+    fator = (vencimento - base_fator).days
+    campo_livre = ''.join(rng.choice('0123456789') for _ in range(25))
+    sem_dv = f"3419{fator:04d}{int(round(valor * 100)):010d}{campo_livre}"
+    codigo = sem_dv[:4] + str(modulo11(sem_dv)) + sem_dv[4:]
+
+    c1, c2, c3 = codigo[0:4] + codigo[19:24], codigo[24:34], codigo[34:44]
+    linha = f"{c1}{modulo10(c1)}{c2}{modulo10(c2)}{c3}{modulo10(c3)}{codigo[4]}{codigo[5:19]}"
+    formatada = f"{linha[0:5]}.{linha[5:10]} {linha[10:15]}.{linha[15:21]} {linha[21:26]}.{linha[26:32]} {linha[32]} {linha[33:]}"
+    return linha, formatada
+
+
+def moeda(valor):
+    return f"{valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark offline da conciliação de boletos: gera boletos e comprovantes sintéticos com '
+        'gabarito, troca o Gemini por um modelo local (latência e taxa de erro configuráveis) e mede '
+        'páginas/s, pico de RSS, precisão/revocação do casamento e chamadas à API por página. '
+        'Cada execução é anexada a um histórico JSONL para acompanhar a evolução.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boletos', type=int, default=60)
+        parser.add_argument('--pagos', type=float, default=0.85, help='Fração dos boletos com comprovante')
+        parser.add_argument('--sem-texto', type=float, default=0.5, help='Fração das páginas só com imagem (escaneadas)')
+        parser.add_argument('--sem-codigo', type=float, default=0.3, help='Fração dos comprovantes sem linha digitável')
+        parser.add_argument('--valores-repetidos', type=float, default=0.2, help='Fração dos boletos com valor repetido')
+        parser.add_argument('--latencia', type=float, default=0.2, help='Segundos por chamada ao modelo falso')
+        parser.add_argument('--taxa-erro', type=float, default=0.02)
+        parser.add_argument('--rpm', type=int, default=0, help='Limite de chamadas/min (0 = sem limite)')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument(
+            '--historico', default=os.path.join(settings.MEDIA_ROOT, 'tmp', 'benchmarks', 'conciliacao.jsonl'),
+            help='Arquivo JSONL com o histórico das execuções (fora do que é versionado)',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['semente'])
+        random.seed(options['semente'])
+        pasta = tempfile.mkdtemp(prefix='bench_conciliacao_')
+        try:
+            t0 = time.perf_counter()
+            caminho_comprovantes, caminhos_boletos, pares = self.gerar(pasta, rng, options)
+            gabarito = self.montar_gabarito(caminho_comprovantes, caminhos_boletos)
+            total_paginas = len(caminhos_boletos) + len(gabarito['comprovantes'])
+            self.stdout.write(f'{len(caminhos_boletos)} boletos e {len(gabarito["comprovantes"])} comprovantes gerados em {time.perf_counter() - t0:.1f}s')
+
+            ModeloFalso.configurar(gabarito['por_hash'], options['latencia'], options['taxa_erro'])
+            limitador = services.LimitadorTaxa(options['rpm'] or 10**9, rajada=options['rpm'] or 10**9)
+            cache = CacheExtracao(os.path.join(pasta, 'cache'))
+
+            with mock.patch.object(services.genai, 'GenerativeModel', ModeloFalso), \
+                    mock.patch.object(services, 'limitador_gemini', limitador), \
+                    mock.patch.object(CacheExtracao, 'do_tenant', return_value=cache):
+                t0 = time.perf_counter()
+                previstos, url = self.executar(caminho_comprovantes, caminhos_boletos)
+                duracao = time.perf_counter() - t0
+
+            if url:
+                arquivo_zip = os.path.join(services.PASTA_DOWNLOADS, os.path.basename(url.rstrip('/')))
+                if os.path.exists(arquivo_zip):
+                    os.remove(arquivo_zip)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+        corretos = sum(1 for nome, pagina in previstos.items() if pares.get(nome) == pagina)
+        esperados = sum(1 for p in pares.values() if p is not None)
+        metricas = {
+            'paginas_por_segundo': round(total_paginas / duracao, 2) if duracao else None,
+            'duracao_s': round(duracao, 2),
+            'pico_rss_mb': self.pico_rss_mb(),
+            'precisao': round(corretos / len(previstos), 4) if previstos else 0.0,
+            'revocacao': round(corretos / esperados, 4) if esperados else 0.0,
+            'chamadas_api_por_pagina': round(ModeloFalso.chamadas / total_paginas, 3),
+        }
+        self.registrar(options, total_paginas, metricas)
+
+    # ------------------------------------------------------------------
+    # MASSA SINTÉTICA
+    # ------------------------------------------------------------------
+    def gerar(self, pasta, rng, options):
+        """Gera os PDFs e devolve (comprovantes, boletos, gabarito nome_boleto -> página do comprovante)."""
+        pasta_boletos = os.path.join(pasta, 'boletos')
+        os.makedirs(pasta_boletos)
+        hoje = timezone.localdate()
+        valores_comuns = [round(rng.uniform(80, 400), 2) for _ in range(3)]
+
+        boletos = []
+        for i in range(options['boletos']):
+            if rng.random() < options['valores_repetidos']:
+                valor = rng.choice(valores_comuns)
+            else:
+                valor = round(rng.uniform(50, 3000), 2)
+            vencimento = hoje + timedelta(days=rng.randint(-20, 20))
+            linha, formatada = montar_linha_digitavel(valor, vencimento, rng)
+            boletos.append({
+                'nome': f'boleto_{i:04d}.pdf', 'valor': valor, 'vencimento': vencimento,
+                'linha': linha, 'formatada': formatada, 'pagador': f'ALUNO BENCHMARK {i}',
+            })
+
+        for b in boletos:
+            linhas = [
+                'BANCO ITAU S.A. | 341-7', b['formatada'],
+                'Beneficiário: ACADEMIA BENCHMARK LTDA  CNPJ: 12.345.678/0001-99',
+                f"Pagador: {b['pagador']}",
+                f"Vencimento: {b['vencimento']:%d/%m/%Y}",
+                f"Valor do documento: R$ {moeda(b['valor'])}",
+            ]
+            self.escrever_pdf([linhas], os.path.join(pasta_boletos, b['nome']), rng, options['sem_texto'])
+
+        pagos = [b for b in boletos if rng.random() < options['pagos']]
+        rng.shuffle(pagos)
+        paginas_comprovantes, pares = [], {b['nome']: None for b in boletos}
+        for pagina, b in enumerate(pagos):
+            pares[b['nome']] = pagina
+            linhas = [
+                'Comprovante de pagamento de boleto',
+                f"Pagador: {b['pagador']}",
+                'Beneficiário: ACADEMIA BENCHMARK LTDA',
+                f"Data do pagamento: {b['vencimento']:%d/%m/%Y}",
+                f"Valor pago: R$ {moeda(b['valor'])}",
+            ]
+            b['comprovante_com_codigo'] = rng.random() >= options['sem_codigo']
+            if b['comprovante_com_codigo']:
+                linhas.insert(1, f"Código de barras: {b['formatada']}")
+            paginas_comprovantes.append(linhas)
+            b['pagina_comprovante'] = pagina
+
+        caminho_comprovantes = os.path.join(pasta, 'comprovantes.pdf')
+        self.escrever_pdf(paginas_comprovantes, caminho_comprovantes, rng, options['sem_texto'])
+        self.boletos = boletos
+        return caminho_comprovantes, [os.path.join(pasta_boletos, b['nome']) for b in boletos], pares
+
+    @staticmethod
+    def escrever_pdf(paginas, caminho, rng, fracao_sem_texto):
+        doc = fitz.open()
+        for linhas in paginas:
+            page = doc.new_page()
+            for n, texto in enumerate(linhas):
+                page.insert_text((50, 80 + n * 22), texto, fontsize=11)
+            if rng.random() < fracao_sem_texto:
+                # "Escaneada": a página vira uma imagem, sem camada de texto
+                pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
+                rect = page.rect
+                doc.delete_page(page.number)
+                doc.new_page(width=rect.width, height=rect.height).insert_image(rect, pixmap=pix)
+        doc.save(caminho)
+        doc.close()
+
+    def montar_gabarito(self, caminho_comprovantes, caminhos_boletos):
+        """Rasteriza cada página com a mesma função do pipeline e associa o hash da imagem à verdade."""
+        por_hash, comprovantes = {}, []
+        por_pagina = {b['pagina_comprovante']: b for b in self.boletos if 'pagina_comprovante' in b}
+
+        documento = services.DocumentoPdf(caminho_comprovantes)
+        for pagina in documento.paginas():
+            b = por_pagina[pagina.indice]
+            verdade = {
+                'codigo_barras_numerico': b['linha'] if b['comprovante_com_codigo'] else None,
+                'data_pagamento': b['vencimento'].isoformat(), 'data_vencimento': None,
+                'valor_float': b['valor'], 'valor_virgula': moeda(b['valor']).replace('.', ''),
+                'nome_pagador': b['pagador'], 'nome_beneficiario': 'ACADEMIA BENCHMARK LTDA',
+                'cnpj_pagador': None, 'cnpj_beneficiario': None, '_pagina': pagina.indice,
+            }
+            por_hash[hashlib.sha256(pagina.imagem()['data']).hexdigest()] = verdade
+            comprovantes.append(verdade)
+        documento.fechar()
+
+        for caminho, b in zip(caminhos_boletos, self.boletos):
+            documento = services.DocumentoPdf(caminho)
+            por_hash[hashlib.sha256(documento.pagina(0).imagem()['data']).hexdigest()] = {
+                'codigo_barras_numerico': b['linha'],
+                'data_vencimento': b['vencimento'].isoformat(), 'data_pagamento': None,
+                'valor_float': b['valor'], 'valor_virgula': moeda(b['valor']).replace('.', ''),
+                'nome_pagador': b['pagador'], 'nome_beneficiario': 'ACADEMIA BENCHMARK LTDA',
+                'cnpj_pagador': None, 'cnpj_beneficiario': '12.345.678/0001-99',
+                '_par': b.get('pagina_comprovante'),
+            }
+            documento.fechar()
+        return {'por_hash': por_hash, 'comprovantes': comprovantes}
+
+    # ------------------------------------------------------------------
+    # EXECUÇÃO E MÉTRICAS
+    # ------------------------------------------------------------------
+    def executar(self, caminho_comprovantes, caminhos_boletos):
+        """Consome o stream NDJSON da conciliação e devolve ({boleto: página casada}, url do ZIP)."""
+        previstos, url = {}, None
+        padrao = re.compile(r'COMBINADO: (.+) -> Comprovante Pág (\d+)')
+        for linha in services.processar_reconciliacao(caminho_comprovantes, caminhos_boletos, None):
+            evento = json.loads(linha)
+            if evento['type'] == 'log':
+                encontrado = padrao.search(evento['data'])
+                if encontrado:
+                    previstos[encontrado.group(1)] = int(encontrado.group(2)) - 1
+            elif evento['type'] == 'finish':
+                url = evento['data']['url']
+        return previstos, url
+
+    @staticmethod
+    def pico_rss_mb():
+        if resource is None:
+            return None
+        # ru_maxrss vem em KB no Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    def registrar(self, options, total_paginas, metricas):
+        parametros = {k: options[k] for k in ('boletos', 'pagos', 'sem_texto', 'sem_codigo', 'valores_repetidos', 'latencia', 'taxa_erro', 'rpm', 'semente')}
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR).stdout.strip()
+        except OSError:
+            commit = ''
+
+        anterior = None
+        if os.path.exists(options['historico']):
+            with open(options['historico'], encoding='utf-8') as arquivo:
+                for linha in arquivo:
+                    registro = json.loads(linha)
+                    if registro.get('parametros') == parametros:
+                        anterior = registro
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {total_paginas} páginas ==='))
+        for nome, valor in metricas.items():
+            comparacao = ''
+            if anterior and isinstance(valor, (int, float)) and isinstance(anterior['metricas'].get(nome), (int, float)):
+                comparacao = f"  (anterior {anterior['metricas'][nome]} @ {anterior.get('commit') or '?'})"
+            self.stdout.write(f'{nome:>26}: {valor}{comparacao}')
+
+        os.makedirs(os.path.dirname(options['historico']), exist_ok=True)
+        with open(options['historico'], 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps({
+                'quando': timezone.now().isoformat(), 'commit': commit,
+                'parametros': parametros, 'metricas': metricas,
+            }) + '\n')
+        self.stdout.write(self.style.SUCCESS(f"Resultado anexado em {options['historico']}"))
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_public_schema_name, get_tenant_model, tenant_context
+from pdf_tools.services_jobs import executar_job, reivindicar_proximo_job
+
+class Command(BaseCommand):
+    help = (
+        'Worker das conciliações de boletos: pega os jobs na fila de cada tenant e executa. '
+        'Jobs interrompidos (worker reiniciado) são retomados a partir das páginas já gravadas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e sai (útil em cron)')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera com a fila vazia')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Worker de conciliação iniciado.')
+        while True:
+            trabalhou = self.rodar_rodada()
+            if not trabalhou:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+
+    def rodar_rodada(self):
+        """Executa no máximo um job por tenant, para nenhum tenant monopolizar o worker."""
+        trabalhou = False
+        for tenant in get_tenant_model().objects.exclude(schema_name=get_public_schema_name()):
+            with tenant_context(tenant):
+                job = reivindicar_proximo_job()
+                if job is None:
+                    continue
+                trabalhou = True
+                self.stdout.write(f"[{tenant.schema_name}] Conciliação #{job.pk} (tentativa {job.tentativas})...")
+                job = executar_job(job)
+                estilo = self.style.SUCCESS if job.status == 'CONCLUIDO' else self.style.ERROR
+                self.stdout.write(estilo(f"[{tenant.schema_name}] Conciliação #{job.pk}: {job.get_status_display()}"))
+        return trabalhou
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobConciliacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Na fila'), ('PROCESSANDO', 'Processando'), ('CONCLUIDO', 'Concluído'), ('ERRO', 'Erro')], default='PENDENTE', max_length=12)),
+                ('caminho_comprovantes', models.CharField(max_length=500)),
+                ('caminhos_boletos', models.JSONField(default=list)),
+                ('url_resultado', models.CharField(blank=True, max_length=300)),
+                ('erro', models.TextField(blank=True)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs_conciliacao', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Job de Conciliação',
+                'verbose_name_plural': 'Jobs de Conciliação',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='job_conciliacao_fila_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaginaProcessada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('comprovante', 'Comprovante'), ('boleto', 'Boleto'), ('desempate', 'Desempate da IA')], max_length=12)),
+                ('chave', models.CharField(help_text='Índice da página ou nome do arquivo', max_length=255)),
+                ('dados', models.JSONField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paginas', to='pdf_tools.jobconciliacao')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('job', 'tipo', 'chave'), name='pagina_processada_unica')],
+            },
+        ),
+    ]
@@ -1,3 +1,78 @@
-from django.db import models
+import os
+from django.conf import settings
+from django.db import connection, models
 
-# Create your models here.
+# ==============================================================================
+# JOBS DE CONCILIAÇÃO (BOLETOS x COMPROVANTES)
+# ==============================================================================
+# A conciliação roda num worker (manage.py worker_conciliacao), fora da request.
+# Cada página extraída fica gravada em PaginaProcessada: se o worker reiniciar, o
+# job continua de onde parou sem pagar a extração de novo. Os eventos vão para um
+# arquivo NDJSON do job, que o navegador pode reler a partir de qualquer posição.
+
+class JobConciliacao(models.Model):
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Na fila'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDO', 'Concluído'),
+        ('ERRO', 'Erro'),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs_conciliacao')
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='PENDENTE')
+
+    # Cópias dos arquivos enviados (a pasta de upload do usuário pode ser limpa durante o job)
+    caminho_comprovantes = models.CharField(max_length=500)
+    caminhos_boletos = models.JSONField(default=list)
+
+    url_resultado = models.CharField(max_length=300, blank=True)
+    erro = models.TextField(blank=True)
+    tentativas = models.PositiveIntegerField(default=0)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    # Batimento do worker: job PROCESSANDO sem batimento recente é de um worker que morreu
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Job de Conciliação"
+        verbose_name_plural = "Jobs de Conciliação"
+        ordering = ['-criado_em']
+        indexes = [models.Index(fields=['status', 'criado_em'], name='job_conciliacao_fila_idx')]
+
+    def __str__(self):
+        return f"Conciliação #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def finalizado(self):
+        return self.status in ('CONCLUIDO', 'ERRO')
+
+    @staticmethod
+    def pasta_do_job(job_id, schema_name=None):
+        schema_name = schema_name or connection.schema_name
+        return os.path.join(settings.MEDIA_ROOT, schema_name, 'conciliacoes', str(job_id))
+
+    @property
+    def caminho_log(self):
+        return os.path.join(self.pasta_do_job(self.pk), 'eventos.ndjson')
+
+
+class PaginaProcessada(models.Model):
+    """Checkpoint: resultado da extração de uma página (ou do desempate da IA) dentro de um job."""
+    TIPO_CHOICES = [
+        ('comprovante', 'Comprovante'),
+        ('boleto', 'Boleto'),
+        ('desempate', 'Desempate da IA'),
+    ]
+
+    job = models.ForeignKey(JobConciliacao, on_delete=models.CASCADE, related_name='paginas')
+    tipo = models.CharField(max_length=12, choices=TIPO_CHOICES)
+    chave = models.CharField(max_length=255, help_text="Índice da página ou nome do arquivo")
+    dados = models.JSONField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'tipo', 'chave'], name='pagina_processada_unica'),
+        ]
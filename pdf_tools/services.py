@@ -1,17 +1,23 @@
-import io
 import os
+import tempfile
 import zipfile
 import uuid
 import json
 import re
 import logging
 import time
+import threading
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 import fitz  # PyMuPDF
-from difflib import SequenceMatcher
-from pypdf import PdfReader, PdfWriter
-from PIL import Image
 import google.generativeai as genai
+from pydantic import BaseModel, TypeAdapter
 from django.conf import settings
+from django.urls import reverse
+from core.cache_extracao import CacheExtracao, hash_conteudo
+from core.limitador import LimitadorTaxa
+from .services_boleto import extrair_boleto_do_texto
+from .services_conciliacao import BONUS_IA, IndiceComprovantes, atribuir
 
 # Configuração do logger
 logger = logging.getLogger(__name__)
@@ -19,6 +25,34 @@ logger = logging.getLogger(__name__)
 # Configura a API do Google Gemini
 genai.configure(api_key=settings.GOOGLE_API_KEY)
 
+# ============================================================
+# CONTROLE DE VAZÃO DA API (TOKEN BUCKET)
+# ============================================================
+
+# Ajustáveis pelo settings conforme a cota contratada do Gemini
+GEMINI_REQUISICOES_POR_MINUTO = getattr(settings, 'GEMINI_REQUISICOES_POR_MINUTO', 60)
+GEMINI_CONCORRENCIA = getattr(settings, 'GEMINI_CONCORRENCIA', 4)
+
+limitador_gemini = LimitadorTaxa(GEMINI_REQUISICOES_POR_MINUTO)
+
+def mapear_em_ordem(funcao, itens, max_workers=None):
+    """
+    Executa `funcao(item)` em paralelo (pool de threads) e devolve os resultados
+    na ordem dos itens, à medida que cada um fica pronto. Assim o stream NDJSON
+    continua na mesma ordem, mesmo com as páginas terminando fora de ordem.
+    """
+    itens = list(itens)
+    if not itens:
+        return
+    executor = ThreadPoolExecutor(max_workers=max_workers or GEMINI_CONCORRENCIA)
+    try:
+        futuros = [executor.submit(funcao, item) for item in itens]
+        for item, futuro in zip(itens, futuros):
+            yield item, futuro.result()
+    finally:
+        # Se o cliente desconectar no meio do stream, as páginas que nem começaram são descartadas
+        executor.shutdown(wait=False, cancel_futures=True)
+
 # ============================================================
 # FERRAMENTAS AUXILIARES
 # ============================================================
@@ -27,11 +61,6 @@ def limpar_numeros(texto):
     """Remove todos os caracteres não numéricos de uma string."""
     return re.sub(r'\D', '', str(texto or ""))
 
-def calcular_similaridade(a, b):
-    """Calcula a similaridade entre duas strings."""
-    if not a or not b: return 0.0
-    return SequenceMatcher(None, a, b).ratio()
-
 def normalizar_valor(v_str):
     """Converte uma string de valor monetário para float."""
     try:
@@ -52,99 +81,325 @@ def extrair_valor_nome(nome_arquivo):
         except: pass
     return 0.0
 
-def pdf_bytes_para_imagem_pil(pdf_bytes):
-    """Converte a primeira página de um PDF em uma imagem PIL de alta qualidade."""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    page = doc[0]
-    matriz_zoom = fitz.Matrix(2, 2)
-    pix = page.get_pixmap(matrix=matriz_zoom)
-    return Image.open(io.BytesIO(pix.tobytes("jpeg")))
+# ============================================================
+# DOCUMENTOS ABERTOS UMA VEZ, PÁGINAS POR REFERÊNCIA
+# ============================================================
+# Cada PDF de origem é aberto uma única vez com o PyMuPDF. Uma página é só
+# (documento, índice): o texto e a imagem saem direto do documento aberto, e o PDF
+# final é montado copiando intervalos de páginas, sem serializar cada página em
+# bytes e reabrir esses bytes a cada etapa.
+
+# O MuPDF não é thread-safe; as threads de extração só disputam esta trava no
+# trecho curto de leitura/rasterização, nunca durante a chamada à IA.
+_trava_fitz = threading.Lock()
+
+class DocumentoPdf:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with _trava_fitz:
+            self.doc = fitz.open(caminho)
+            self.total_paginas = len(self.doc)
+
+    def pagina(self, indice):
+        return PaginaPdf(self, indice)
+
+    def paginas(self):
+        return [PaginaPdf(self, i) for i in range(self.total_paginas)]
+
+    def fechar(self):
+        with _trava_fitz:
+            self.doc.close()
+
+class PaginaPdf:
+    __slots__ = ('documento', 'indice')
+
+    def __init__(self, documento, indice):
+        self.documento = documento
+        self.indice = indice
+
+    def texto(self):
+        with _trava_fitz:
+            return self.documento.doc[self.indice].get_text()
+
+    def imagem(self):
+        """Imagem da página pronta para a IA: {'mime_type', 'data'} com JPEG em tons de cinza."""
+        with _trava_fitz:
+            return {'mime_type': 'image/jpeg', 'data': rasterizar(self.documento.doc[self.indice])}
+
+# ------------------------------------------------------------
+# RASTERIZAÇÃO ADAPTATIVA
+# ------------------------------------------------------------
+# A resolução sai do tamanho da página (alvo de pixels no lado maior) e sobe um pouco
+# quando o texto é miúdo/denso. Quando há camada de texto, a imagem é recortada na
+# faixa vertical onde estão valor, vencimento, nomes e a linha digitável. A saída é
+# JPEG em tons de cinza, enviado como está (sem o PIL reempacotar em WebP sem perda).
+
+RASTER_PIXELS_LADO_MAIOR = getattr(settings, 'RASTER_PIXELS_LADO_MAIOR', 1600)
+RASTER_QUALIDADE_JPEG = getattr(settings, 'RASTER_QUALIDADE_JPEG', 75)
+ZOOM_MINIMO, ZOOM_MAXIMO = 1.0, 3.0
+# Caracteres por polegada quadrada acima do qual a fonte é considerada miúda
+DENSIDADE_TEXTO_ALTA = 40
+MARGEM_RECORTE = 24  # pontos
+
+PADRAO_PALAVRA_RELEVANTE = re.compile(
+    r'valor|venc|pagador|benefici|cedente|sacado|cnpj|cpf|total|pago|pagamento|autentica|^\d{5}|\d+,\d{2}$',
+    re.IGNORECASE,
+)
+
+def escolher_zoom(page, texto):
+    rect = page.rect
+    zoom = RASTER_PIXELS_LADO_MAIOR / max(rect.width, rect.height)
+    area_pol2 = (rect.width / 72) * (rect.height / 72)
+    if texto and len(texto) / area_pol2 > DENSIDADE_TEXTO_ALTA:
+        zoom *= 1.3
+    return min(ZOOM_MAXIMO, max(ZOOM_MINIMO, zoom))
+
+def regiao_relevante(page):
+    """Faixa da página (largura total) com os campos de interesse; None = página inteira."""
+    palavras = [p for p in page.get_text("words") if PADRAO_PALAVRA_RELEVANTE.search(p[4])]
+    if not palavras:
+        return None
+    rect = page.rect
+    topo = max(rect.y0, min(p[1] for p in palavras) - MARGEM_RECORTE)
+    base = min(rect.y1, max(p[3] for p in palavras) + MARGEM_RECORTE)
+    if base - topo > 0.85 * rect.height:
+        return None
+    return fitz.Rect(rect.x0, topo, rect.x1, base)
+
+def rasterizar(page):
+    """Renderiza a página (ou o recorte relevante) em JPEG cinza. Chamar com a _trava_fitz."""
+    texto = page.get_text()
+    zoom = escolher_zoom(page, texto)
+    area = (regiao_relevante(page) if texto.strip() else None) or page.rect
+    # O clip descarta na renderização o que está fora do recorte
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=area, colorspace=fitz.csGRAY)
+    return pix.tobytes("jpeg", jpg_quality=RASTER_QUALIDADE_JPEG)
+
+def montar_pdf(trechos):
+    """
+    Junta em um PDF novo os intervalos (documento, primeira, ultima) na ordem dada.
+    As páginas são copiadas direto dos documentos já abertos.
+    """
+    with _trava_fitz:
+        saida = fitz.open()
+        try:
+            for documento, primeira, ultima in trechos:
+                saida.insert_pdf(documento.doc, from_page=primeira, to_page=ultima)
+            return saida.tobytes(garbage=3, deflate=True)
+        finally:
+            saida.close()
 
 # ============================================================
-# NOVA FUNÇÃO DE EXTRAÇÃO ESTRUTURADA COM IA
+# EXTRAÇÃO ESTRUTURADA COM IA (UMA PÁGINA OU LOTE)
 # ============================================================
+# A resposta é restrita a um JSON Schema (response_schema) e validada com pydantic;
+# nada de limpar cercas de markdown. Várias páginas vão numa chamada só, com as
+# instruções enviadas uma vez por lote; página que vier faltando ou inválida no lote
+# é repetida sozinha.
+
+MODELO_EXTRACAO = 'gemini-2.5-pro'
+# Mude a versão sempre que o prompt abaixo mudar: as respostas em cache da versão antiga deixam de valer
+PROMPT_EXTRACAO_VERSAO = 'extracao-v2'
+GEMINI_PAGINAS_POR_LOTE = getattr(settings, 'GEMINI_PAGINAS_POR_LOTE', 5)
+
+class DadosDocumento(BaseModel):
+    codigo_barras_numerico: Optional[str] = None
+    data_vencimento: Optional[str] = None
+    data_pagamento: Optional[str] = None
+    valor_float: Optional[float] = None
+    valor_virgula: Optional[str] = None
+    nome_beneficiario: Optional[str] = None
+    nome_pagador: Optional[str] = None
+    cnpj_beneficiario: Optional[str] = None
+    cnpj_pagador: Optional[str] = None
+
+class DadosPaginaLote(DadosDocumento):
+    pagina: int
+
+_TEXTO = {'type': 'STRING', 'nullable': True}
+SCHEMA_DOCUMENTO = {
+    'type': 'OBJECT',
+    'properties': {
+        'codigo_barras_numerico': _TEXTO,
+        'data_vencimento': _TEXTO,
+        'data_pagamento': _TEXTO,
+        'valor_float': {'type': 'NUMBER', 'nullable': True},
+        'valor_virgula': _TEXTO,
+        'nome_beneficiario': _TEXTO,
+        'nome_pagador': _TEXTO,
+        'cnpj_beneficiario': _TEXTO,
+        'cnpj_pagador': _TEXTO,
+    },
+}
+SCHEMA_LOTE = {
+    'type': 'ARRAY',
+    'items': {
+        **SCHEMA_DOCUMENTO,
+        'properties': {'pagina': {'type': 'INTEGER'}, **SCHEMA_DOCUMENTO['properties']},
+        'required': ['pagina'],
+    },
+}
+_validar_lote = TypeAdapter(list[DadosPaginaLote])
+
+CAMPOS_EXTRACAO = """
+    - `codigo_barras_numerico`: A linha digitável ou código de barras, contendo APENAS NÚMEROS.
+    - `data_vencimento`: A data de vencimento do boleto (formato YYYY-MM-DD).
+    - `data_pagamento`: A data em que o pagamento foi efetuado (formato YYYY-MM-DD).
+    - `valor_float`: O valor principal do documento como número (ex: 123.45).
+    - `valor_virgula`: O mesmo valor como texto com vírgula (ex: "123,45").
+    - `nome_beneficiario` / `cnpj_beneficiario`: Quem recebe o dinheiro.
+    - `nome_pagador` / `cnpj_pagador`: Quem está pagando.
+    Campo não encontrado = null. Preste muita atenção para diferenciar beneficiário de pagador.
+"""
 
-def extrair_dados_estruturados_com_ia(imagem_pil, tipo_doc):
+def _chave_cache(cache, imagem, tipo_doc):
+    return cache.chave(hash_conteudo(imagem['data']), f"{PROMPT_EXTRACAO_VERSAO}:{tipo_doc}", MODELO_EXTRACAO)
+
+def _config_json(schema):
+    return genai.GenerationConfig(response_mime_type='application/json', response_schema=schema)
+
+def extrair_dados_estruturados_com_ia(imagem, tipo_doc, cache=None):
     """
     Usa um modelo de IA para extrair um JSON estruturado de uma imagem de documento.
+    Com `cache`, a mesma imagem (mesmo prompt e modelo) não vai para a API de novo.
     """
-    model = genai.GenerativeModel('gemini-2.5-pro')
-    prompt = f"""
-    Analise esta imagem de um {tipo_doc}. Sua tarefa é extrair as seguintes informações
-    e retorná-las em um objeto JSON VÁLIDO.
-
-    1.  `codigo_barras_numerico`: A linha digitável ou código de barras, contendo APENAS NÚMEROS.
-    2.  `data_vencimento`: A data de vencimento do boleto (formato YYYY-MM-DD). Se não houver, use null.
-    3.  `data_pagamento`: A data em que o pagamento foi efetuado (formato YYYY-MM-DD). Se não houver, use null.
-    4.  `valor_float`: O valor principal do documento como um número float (ex: 123.45).
-    5.  `valor_virgula`: O mesmo valor, mas como uma string com vírgula (ex: "123,45").
-    6.  `nome_beneficiario`: O nome da empresa ou pessoa que recebe o dinheiro.
-    7.  `nome_pagador`: O nome da empresa ou pessoa que está pagando.
-    8.  `cnpj_beneficiario`: O CNPJ do beneficiário.
-    9.  `cnpj_pagador`: O CNPJ do pagador.
-
-    REGRAS IMPORTANTES:
-    - Se um campo não for encontrado, seu valor DEVE ser `null`.
-    - O JSON de saída não deve conter nenhum caractere de formatação como ```json ou ```.
-    - Preste muita atenção para diferenciar beneficiário de pagador.
-
-    Exemplo de Saída:
-    {{
-      "codigo_barras_numerico": "34191790010352013781368109400000187220000015000",
-      "data_vencimento": "2024-07-31",
-      "data_pagamento": "2024-07-30",
-      "valor_float": 150.00,
-      "valor_virgula": "150,00",
-      "nome_beneficiario": "MINHA EMPRESA LTDA",
-      "nome_pagador": "CLIENTE EXEMPLO SA",
-      "cnpj_beneficiario": "12.345.678/0001-99",
-      "cnpj_pagador": "98.765.432/0001-11"
-    }}
-    """
+    if cache is None:
+        return _extrair_com_ia(imagem, tipo_doc)
+    return cache.obter_ou_extrair(_chave_cache(cache, imagem, tipo_doc), lambda: _extrair_com_ia(imagem, tipo_doc))
+
+def _extrair_com_ia(imagem, tipo_doc):
+    model = genai.GenerativeModel(MODELO_EXTRACAO)
+    prompt = f"Analise esta imagem de um {tipo_doc} e extraia:\n{CAMPOS_EXTRACAO}"
     for tentativa in range(3):
         try:
-            response = model.generate_content([prompt, imagem_pil])
-            texto_resposta = response.text.strip()
-            if texto_resposta.startswith("```json"):
-                texto_resposta = texto_resposta[7:]
-            if texto_resposta.endswith("```"):
-                texto_resposta = texto_resposta[:-3]
-            return json.loads(texto_resposta.strip())
-        except (json.JSONDecodeError, Exception) as e:
+            limitador_gemini.aguardar()
+            response = model.generate_content([prompt, imagem], generation_config=_config_json(SCHEMA_DOCUMENTO))
+            return DadosDocumento.model_validate_json(response.text).model_dump()
+        except Exception as e:
             logger.error(f"Erro na extração estruturada (tentativa {tentativa+1}): {e}")
             time.sleep(2 * (tentativa + 1))
     return {}
 
+def extrair_lote_com_ia(imagens, tipo_doc):
+    """
+    Extrai várias imagens numa única chamada (um item do array por página).
+    Devolve uma lista alinhada com `imagens`; páginas que faltarem ou vierem
+    inválidas na resposta do lote são extraídas de novo, uma a uma.
+    """
+    if len(imagens) == 1:
+        return [_extrair_com_ia(imagens[0], tipo_doc)]
+
+    model = genai.GenerativeModel(MODELO_EXTRACAO)
+    partes = [
+        f"Você vai receber {len(imagens)} imagens de {tipo_doc}, cada uma precedida por 'PÁGINA n'. "
+        f"Retorne um array JSON com um objeto por página, com `pagina` = n e os campos:\n{CAMPOS_EXTRACAO}"
+    ]
+    for n, imagem in enumerate(imagens, start=1):
+        partes.extend([f"PÁGINA {n}", imagem])
+
+    por_pagina = {}
+    for tentativa in range(2):
+        try:
+            limitador_gemini.aguardar()
+            response = model.generate_content(partes, generation_config=_config_json(SCHEMA_LOTE))
+            por_pagina = {item.pagina: item for item in _validar_lote.validate_json(response.text)}
+            break
+        except Exception as e:
+            logger.error(f"Erro na extração em lote de {len(imagens)} páginas (tentativa {tentativa+1}): {e}")
+            time.sleep(2 * (tentativa + 1))
+
+    resultados = []
+    for n, imagem in enumerate(imagens, start=1):
+        item = por_pagina.get(n)
+        if item is None:
+            logger.warning(f"Página {n} do lote sem resposta válida; extraindo individualmente.")
+            resultados.append(_extrair_com_ia(imagem, tipo_doc))
+        else:
+            resultados.append(item.model_dump(exclude={'pagina'}))
+    return resultados
+
 # ============================================================
 # FUNÇÕES DO FLUXO PRINCIPAL (ATUALIZADAS)
 # ============================================================
 
-def processar_pagina(pdf_bytes, tipo_doc, nome_arquivo=""):
+PASTA_DOWNLOADS = os.path.join(settings.MEDIA_ROOT, 'downloads')
+
+# Desligue no settings para mandar toda página para a IA (ex.: para comparar as duas leituras)
+EXTRACAO_LOCAL_ATIVA = getattr(settings, 'EXTRACAO_LOCAL_ATIVA', True)
+
+def _montar_resultado(dados_ia, origem, nome_arquivo=""):
+    resultado = {
+        'codigo': limpar_numeros(dados_ia.get('codigo_barras_numerico')),
+        'valor': normalizar_valor(dados_ia.get('valor_float')),
+        'dados_completos': dados_ia,
+        'origem': origem
+    }
+
+    if resultado['valor'] == 0 and nome_arquivo:
+        valor_nome = extrair_valor_nome(nome_arquivo)
+        if valor_nome > 0:
+            resultado['valor'] = valor_nome
+            resultado['origem'] = 'NOME_ARQUIVO'
+
+    return resultado
+
+def processar_lote(itens, tipo_doc, cache=None):
     """
-    Processa uma página de PDF, usando a extração estruturada.
+    Processa páginas de PDF; `itens` é uma lista de (pagina, nome_arquivo).
+    Cada página tenta primeiro a camada de texto (sem rede) e depois o cache; as que
+    sobrarem vão juntas numa única chamada de extração com IA.
+    Devolve os resultados na ordem dos itens.
     """
-    try:
-        imagem_pil = pdf_bytes_para_imagem_pil(pdf_bytes)
-        dados_ia = extrair_dados_estruturados_com_ia(imagem_pil, tipo_doc)
-        
-        resultado = {
-            'codigo': limpar_numeros(dados_ia.get('codigo_barras_numerico')),
-            'valor': normalizar_valor(dados_ia.get('valor_float')),
-            'dados_completos': dados_ia,
-            'origem': 'IA_GEMINI_ESTRUTURADO'
-        }
-        
-        if resultado['valor'] == 0 and nome_arquivo:
-            valor_nome = extrair_valor_nome(nome_arquivo)
-            if valor_nome > 0:
-                resultado['valor'] = valor_nome
-                resultado['origem'] = 'NOME_ARQUIVO'
-        
-        return resultado
-    except Exception as e:
-        logger.error(f"Erro ao processar página do PDF '{nome_arquivo}': {e}")
-        valor_nome = extrair_valor_nome(nome_arquivo)
-        return {'codigo': '', 'valor': valor_nome, 'dados_completos': {}, 'origem': 'ERRO_FATAL'}
+    resultados = [None] * len(itens)
+    pendentes = []
+    for pos, (pagina, nome_arquivo) in enumerate(itens):
+        try:
+            dados_ia = extrair_boleto_do_texto(pagina.texto()) if EXTRACAO_LOCAL_ATIVA else None
+            if dados_ia is not None:
+                resultados[pos] = _montar_resultado(dados_ia, 'TEXTO_LOCAL', nome_arquivo)
+                continue
+
+            imagem = pagina.imagem()
+            chave = _chave_cache(cache, imagem, tipo_doc) if cache else None
+            dados_ia = cache.obter(chave) if cache else None
+            if dados_ia is not None:
+                resultados[pos] = _montar_resultado(dados_ia, 'IA_GEMINI_ESTRUTURADO', nome_arquivo)
+                continue
+            pendentes.append((pos, imagem, chave))
+        except Exception as e:
+            logger.error(f"Erro ao processar página do PDF '{nome_arquivo}': {e}")
+            resultados[pos] = _montar_resultado({}, 'ERRO_FATAL', nome_arquivo)
+
+    if pendentes:
+        extraidos = extrair_lote_com_ia([imagem for _, imagem, _ in pendentes], tipo_doc)
+        for (pos, _, chave), dados_ia in zip(pendentes, extraidos):
+            if cache and dados_ia:
+                cache.guardar(chave, dados_ia)
+            resultados[pos] = _montar_resultado(dados_ia, 'IA_GEMINI_ESTRUTURADO', itens[pos][1])
+    return resultados
+
+def processar_pagina(pagina, tipo_doc, nome_arquivo="", cache=None):
+    """Processa uma única página de PDF (ver processar_lote)."""
+    return processar_lote([(pagina, nome_arquivo)], tipo_doc, cache=cache)[0]
+
+def extrair_em_lotes(itens, tipo_doc, cache=None, salvos=None):
+    """
+    Divide `itens` (pagina, nome_arquivo) em lotes de GEMINI_PAGINAS_POR_LOTE, processa os
+    lotes em paralelo e devolve (item, resultado) na ordem original. `salvos` é uma lista
+    alinhada com os itens com resultados já conhecidos (checkpoint), que não são refeitos.
+    """
+    salvos = salvos or [None] * len(itens)
+
+    def rodar(lote):
+        faltam = [p for p in lote if not salvos[p]]
+        novos = dict(zip(faltam, processar_lote([itens[p] for p in faltam], tipo_doc, cache))) if faltam else {}
+        return [salvos[p] or novos[p] for p in lote]
+
+    posicoes = list(range(len(itens)))
+    lotes = [posicoes[i:i + GEMINI_PAGINAS_POR_LOTE] for i in range(0, len(posicoes), GEMINI_PAGINAS_POR_LOTE)]
+    for lote, resultados in mapear_em_ordem(rodar, lotes):
+        for p, resultado in zip(lote, resultados):
+            yield itens[p], resultado
 
 def chamar_gemini_desempate(img_boleto, lista_imgs_comprovantes):
     """Usa IA para análise profunda e desempate."""
@@ -164,6 +419,7 @@ def chamar_gemini_desempate(img_boleto, lista_imgs_comprovantes):
     Formato: { "melhor_indice_candidato": <numero>, "justificativa": "<sua análise>" }
     """)
     try:
+        limitador_gemini.aguardar()
         response = model.generate_content(prompt_parts)
         texto_resposta = response.text.replace('```json', '').replace('```', '').strip()
         return json.loads(texto_resposta)
@@ -175,7 +431,15 @@ def chamar_gemini_desempate(img_boleto, lista_imgs_comprovantes):
 # FLUXO PRINCIPAL DA RECONCILIAÇÃO (LÓGICA ATUALIZADA)
 # ============================================================
 
-def processar_reconciliacao(caminho_comprovantes, lista_caminhos_boletos, user):
+def _vale_checkpoint(dados_pagina):
+    # Falhas de leitura não são gravadas: numa retomada, a página é tentada de novo
+    return dados_pagina['origem'] != 'ERRO_FATAL' and bool(dados_pagina['dados_completos'])
+
+def processar_reconciliacao(caminho_comprovantes, lista_caminhos_boletos, user, checkpoint=None):
+    """
+    Gera os eventos NDJSON da conciliação. Com `checkpoint` (ver services_jobs), páginas
+    e desempates já resolvidos numa execução anterior do mesmo job são reaproveitados.
+    """
     def emit(tipo, dados):
         return json.dumps({'type': tipo, 'data': dados}) + "\n"
     
@@ -194,101 +458,143 @@ def processar_reconciliacao(caminho_comprovantes, lista_caminhos_boletos, user):
 
     yield emit('log', '🚀 Iniciando reconciliação com extração estruturada...')
 
-    # --- ETAPA 1: LER COMPROVANTES ---
-    yield emit('log', '📸 Lendo Comprovantes...')
-    pool_comprovantes = []
+    # Criado aqui, na thread da request, para usar a pasta do tenant certo
+    cache = CacheExtracao.do_tenant()
+
+    # Todo PDF aberto entra aqui e é fechado no finally, em qualquer saída: fim normal,
+    # erro, return antecipado ou o gerador fechado no meio (cliente desconectou)
+    documentos_abertos = []
     try:
-        doc_comprovantes = fitz.open(caminho_comprovantes)
-        reader_zip = PdfReader(caminho_comprovantes)
-        for i, page in enumerate(doc_comprovantes):
-            writer = PdfWriter(); writer.add_page(reader_zip.pages[i]); bio = io.BytesIO(); writer.write(bio)
-            pdf_bytes = bio.getvalue()
-            time.sleep(1.5)
-            dados_pagina = processar_pagina(pdf_bytes, "comprovante bancário")
-            pool_comprovantes.append({
-                'id': i, **dados_pagina,
-                'pdf_bytes': pdf_bytes, 'usado': False
-            })
-            yield emit('log', formatar_log_extracao(dados_pagina, "Comprovante", f"Pág {i+1}"))
-            yield emit('comp_status', {'index': i, 'msg': f"R$ {dados_pagina['valor']:.2f}"})
-    except Exception as e:
-        yield emit('log', f"❌ Erro crítico ao ler comprovantes: {e}"); return
-
-    # --- ETAPA 2: LER BOLETOS E COMBINAR ---
-    yield emit('log', '⚡ Analisando Boletos e combinando...')
-    lista_final_boletos = []
-    for path_boleto in lista_caminhos_boletos:
-        nome_arquivo = os.path.basename(path_boleto)
-        yield emit('file_start', {'filename': nome_arquivo})
+        # --- ETAPA 1: LER COMPROVANTES ---
+        yield emit('log', '📸 Lendo Comprovantes...')
+        pool_comprovantes = []
         try:
-            with open(path_boleto, 'rb') as f: pdf_bytes_boleto = f.read()
-            time.sleep(1)
-            dados_boleto = processar_pagina(pdf_bytes_boleto, "boleto bancário", nome_arquivo)
-            yield emit('log', formatar_log_extracao(dados_boleto, "Boleto", f'({nome_arquivo})'))
+            doc_comprovantes = DocumentoPdf(caminho_comprovantes)
+            documentos_abertos.append(doc_comprovantes)
+
+            # Extração em lotes concorrentes (limitada pela cota); os eventos saem na ordem das páginas
+            paginas = doc_comprovantes.paginas()
+            salvos = [checkpoint.obter('comprovante', p.indice) for p in paginas] if checkpoint else None
+            for (pagina, _), dados_pagina in extrair_em_lotes([(p, "") for p in paginas], "comprovante bancário", cache, salvos):
+                i = pagina.indice
+                if checkpoint and _vale_checkpoint(dados_pagina):
+                    checkpoint.guardar('comprovante', i, dados_pagina)
+                pool_comprovantes.append({
+                    'id': i, **dados_pagina,
+                    'pagina': pagina
+                })
+                yield emit('log', formatar_log_extracao(dados_pagina, "Comprovante", f"Pág {i+1}"))
+                yield emit('comp_status', {'index': i, 'msg': f"R$ {dados_pagina['valor']:.2f}"})
+        except Exception as e:
+            yield emit('log', f"❌ Erro crítico ao ler comprovantes: {e}"); return
 
-            boleto_atual = {
+        # --- ETAPA 2: LER BOLETOS ---
+        yield emit('log', '⚡ Analisando Boletos...')
+        lista_final_boletos = []
+
+        itens_boletos = []
+        for path_boleto in lista_caminhos_boletos:
+            nome_arquivo = os.path.basename(path_boleto)
+            try:
+                documento = DocumentoPdf(path_boleto)
+            except Exception as e:
+                yield emit('file_start', {'filename': nome_arquivo})
+                yield emit('log', f"❌ Erro no arquivo {nome_arquivo}: {e}")
+                continue
+            documentos_abertos.append(documento)
+            itens_boletos.append((documento.pagina(0), nome_arquivo))
+
+        salvos = [checkpoint.obter('boleto', nome) for _, nome in itens_boletos] if checkpoint else None
+        for (pagina_boleto, nome_arquivo), dados_boleto in extrair_em_lotes(itens_boletos, "boleto bancário", cache, salvos):
+            doc_boleto = pagina_boleto.documento
+            yield emit('file_start', {'filename': nome_arquivo})
+            if checkpoint and _vale_checkpoint(dados_boleto):
+                checkpoint.guardar('boleto', nome_arquivo, dados_boleto)
+            yield emit('log', formatar_log_extracao(dados_boleto, "Boleto", f'({nome_arquivo})'))
+            lista_final_boletos.append({
                 'nome': nome_arquivo, **dados_boleto,
-                'pdf_bytes': pdf_bytes_boleto, 'match': None,
+                'documento': doc_boleto, 'match': None,
                 'motivo': 'Sem comprovante compatível'
-            }
-            
-            if boleto_atual['valor'] > 0:
-                candidatos = [c for c in pool_comprovantes if not c['usado'] and abs(c['valor'] - boleto_atual['valor']) < 0.05]
-                if candidatos:
-                    melhor_candidato = None
-                    if boleto_atual['codigo']:
-                        for c in candidatos:
-                            if c['codigo'] and calcular_similaridade(boleto_atual['codigo'], c['codigo']) > 0.95:
-                                melhor_candidato = c
-                                boleto_atual['motivo'] = "CÓDIGO DE BARRAS"
-                                break
-                    if not melhor_candidato and len(candidatos) == 1:
-                        melhor_candidato = candidatos[0]
-                        boleto_atual['motivo'] = "VALOR (Candidato Único)"
-                    elif not melhor_candidato and len(candidatos) > 1:
-                        yield emit('log', f"   - Ambiguidade em R${boleto_atual['valor']:.2f}. Acionando IA de análise profunda...")
-                        img_boleto = pdf_bytes_para_imagem_pil(boleto_atual['pdf_bytes'])
-                        imgs_comprovantes_candidatos = [pdf_bytes_para_imagem_pil(c['pdf_bytes']) for c in candidatos]
-                        resultado_desempate = chamar_gemini_desempate(img_boleto, imgs_comprovantes_candidatos)
-                        indice_escolhido = resultado_desempate.get('melhor_indice_candidato', -1)
-                        if indice_escolhido != -1:
-                            melhor_candidato = candidatos[indice_escolhido]
-                            boleto_atual['motivo'] = f"IA PROFUNDA ({resultado_desempate.get('justificativa')})"
-                        else:
-                            melhor_candidato = candidatos[0]
-                            boleto_atual['motivo'] = "VALOR (IA indecisa, usando Fila)"
-                    if melhor_candidato:
-                        boleto_atual['match'] = melhor_candidato
-                        melhor_candidato['usado'] = True
-
-            if boleto_atual['match']:
-                yield emit('log', f"   ✅ COMBINADO: {nome_arquivo} -> Comprovante Pág {boleto_atual['match']['id']+1} (Motivo: {boleto_atual['motivo']})")
-                yield emit('file_done', {'filename': nome_arquivo, 'status': 'success'})
-            else:
-                yield emit('log', f"   ⚠️ NÃO COMBINADO: {nome_arquivo}")
-                yield emit('file_done', {'filename': nome_arquivo, 'status': 'warning'})
-            lista_final_boletos.append(boleto_atual)
-        except Exception as e:
-            yield emit('log', f"❌ Erro no arquivo {nome_arquivo}: {e}")
+            })
+
+        # --- ETAPA 3: COMBINAR (TODOS OS BOLETOS DE UMA VEZ) ---
+        yield emit('log', '🔗 Combinando boletos e comprovantes...')
+        indice = IndiceComprovantes(pool_comprovantes)
+        comprovantes_por_id = {c['id']: c for c in pool_comprovantes}
+        arestas, motivos = {}, {}
+
+        for b, boleto in enumerate(lista_final_boletos):
+            candidatos = indice.candidatos(boleto['valor'], boleto['codigo'])
+            for candidato in candidatos:
+                chave = (b, candidato['comprovante']['id'])
+                arestas[chave] = candidato['peso']
+                motivos[chave] = candidato['motivo'] or "VALOR (atribuição global)"
+
+            if len(candidatos) == 1 and not candidatos[0]['motivo']:
+                motivos[(b, candidatos[0]['comprovante']['id'])] = "VALOR (Candidato Único)"
+            elif len(candidatos) > 1 and not any(c['motivo'] for c in candidatos):
+                # Vários comprovantes do mesmo valor e nenhum código de barras para separar
+                resultado_desempate = checkpoint.obter('desempate', boleto['nome']) if checkpoint else None
+                if resultado_desempate is None:
+                    yield emit('log', f"   - Ambiguidade em R${boleto['valor']:.2f} ({boleto['nome']}). Acionando IA de análise profunda...")
+                    img_boleto = boleto['documento'].pagina(0).imagem()
+                    imgs_comprovantes_candidatos = [c['comprovante']['pagina'].imagem() for c in candidatos]
+                    resultado_desempate = chamar_gemini_desempate(img_boleto, imgs_comprovantes_candidatos)
+                    if checkpoint and resultado_desempate.get('melhor_indice_candidato', -1) >= 0:
+                        checkpoint.guardar('desempate', boleto['nome'], resultado_desempate)
+                indice_escolhido = resultado_desempate.get('melhor_indice_candidato', -1)
+                if 0 <= indice_escolhido < len(candidatos):
+                    chave = (b, candidatos[indice_escolhido]['comprovante']['id'])
+                    arestas[chave] += BONUS_IA
+                    motivos[chave] = f"IA PROFUNDA ({resultado_desempate.get('justificativa')})"
+                else:
+                    for c in candidatos:
+                        motivos[(b, c['comprovante']['id'])] = "VALOR (IA indecisa, atribuição global)"
+
+        for b, id_comprovante in atribuir(arestas).items():
+            lista_final_boletos[b]['match'] = comprovantes_por_id[id_comprovante]
+            lista_final_boletos[b]['motivo'] = motivos[(b, id_comprovante)]
 
-    # --- ETAPA 3: GERAR ZIP ---
-    yield emit('log', '💾 Montando o arquivo ZIP final...')
-    output_zip = io.BytesIO()
-    with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zip_file:
         for boleto in lista_final_boletos:
-            writer = PdfWriter()
-            writer.append(io.BytesIO(boleto['pdf_bytes']))
             if boleto['match']:
-                writer.append(io.BytesIO(boleto['match']['pdf_bytes']))
-            pdf_combinado_bytes = io.BytesIO()
-            writer.write(pdf_combinado_bytes)
-            zip_file.writestr(boleto['nome'], pdf_combinado_bytes.getvalue())
-
-    pasta_destino = os.path.join(settings.MEDIA_ROOT, 'downloads')
-    os.makedirs(pasta_destino, exist_ok=True)
-    nome_zip = f"Conciliacao_Final_{uuid.uuid4().hex[:8]}.zip"
-    caminho_completo_zip = os.path.join(pasta_destino, nome_zip)
-    with open(caminho_completo_zip, 'wb') as f:
-        f.write(output_zip.getvalue())
-    url_download = f"{settings.MEDIA_URL}downloads/{nome_zip}"
-    yield emit('finish', {'url': url_download, 'total': len(lista_final_boletos)})
+                yield emit('log', f"   ✅ COMBINADO: {boleto['nome']} -> Comprovante Pág {boleto['match']['id']+1} (Motivo: {boleto['motivo']})")
+                yield emit('file_done', {'filename': boleto['nome'], 'status': 'success'})
+            else:
+                yield emit('log', f"   ⚠️ NÃO COMBINADO: {boleto['nome']}")
+                yield emit('file_done', {'filename': boleto['nome'], 'status': 'warning'})
+
+        # --- ETAPA 4: GERAR ZIP ---
+        yield emit('log', '💾 Montando o arquivo ZIP final...')
+        # Cada entrada é montada, gravada no arquivo em disco e descartada: a memória
+        # fica limitada a um PDF por vez, não ao lote inteiro
+        os.makedirs(PASTA_DOWNLOADS, exist_ok=True)
+        nome_zip = f"Conciliacao_Final_{uuid.uuid4().hex[:8]}.zip"
+        temporario = tempfile.NamedTemporaryFile(dir=PASTA_DOWNLOADS, suffix='.tmp', delete=False)
+        try:
+            with temporario, zipfile.ZipFile(temporario, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                for boleto in lista_final_boletos:
+                    # Boleto inteiro + a página do comprovante casado
+                    documento = boleto['documento']
+                    trechos = [(documento, 0, documento.total_paginas - 1)]
+                    if boleto['match']:
+                        pagina = boleto['match']['pagina']
+                        trechos.append((pagina.documento, pagina.indice, pagina.indice))
+                    zip_file.writestr(boleto['nome'], montar_pdf(trechos))
+            # O ZIP só aparece com o nome final quando está completo
+            os.replace(temporario.name, os.path.join(PASTA_DOWNLOADS, nome_zip))
+        except Exception:
+            os.remove(temporario.name)
+            raise
+
+        url_download = reverse('api_download', args=[nome_zip])
+        stats = cache.resumo()
+        paginas_locais = sum(1 for d in pool_comprovantes + lista_final_boletos if d['origem'] == 'TEXTO_LOCAL')
+        yield emit('log', f"🔎 Leitura local (sem IA): {paginas_locais} de {len(pool_comprovantes) + len(lista_final_boletos)} documentos")
+        yield emit('log', f"🗃️ Cache de extração: {stats['acertos']} acertos, {stats['falhas']} chamadas à IA ({stats['taxa_acerto']}% reaproveitado)")
+        yield emit('finish', {
+            'url': url_download, 'total': len(lista_final_boletos),
+            'matches': sum(1 for b in lista_final_boletos if b['match'])
+        })
+    finally:
+        for documento in documentos_abertos:
+            documento.fechar()
@@ -0,0 +1,159 @@
+import re
+from datetime import date, timedelta
+
+# ============================================================
+# PRÉ-EXTRAÇÃO LOCAL DE BOLETOS (CAMADA DE TEXTO DO PDF)
+# ============================================================
+# A maioria dos boletos e comprovantes gerados por banco já traz a linha digitável
+# como texto no PDF. Aqui ela é localizada por regex e conferida pelos dígitos
+# verificadores (módulo 10/11, padrão FEBRABAN); vencimento e valor saem do próprio
+# código de barras. Só quando a leitura não é confiável a página vai para a IA.
+
+# Linha digitável bancária: 5.5 5.6 5.6 1 14 (47 dígitos), com ou sem pontos/espaços
+PADRAO_BANCARIO = re.compile(r'(?<!\d)\d{5}[.\s]?\d{5}\s*\d{5}[.\s]?\d{6}\s*\d{5}[.\s]?\d{6}\s*\d\s*\d{14}(?!\d)')
+# Linha digitável de arrecadação/convênio (contas de consumo, tributos): 4 blocos de 11+1 (48 dígitos)
+PADRAO_CONVENIO = re.compile(r'(?<!\d)8\d{10}[\s-]?\d(?:\s*\d{11}[\s-]?\d){3}(?!\d)')
+# Código de barras ou linha digitável sem nenhuma separação
+PADRAO_CORRIDO = re.compile(r'(?<!\d)(?:\d{48}|\d{47}|\d{44})(?!\d)')
+# Valores monetários escritos no documento (1.234,56 ou 1234,56)
+PADRAO_VALOR = re.compile(r'(?<![\d.,])(\d{1,3}(?:\.\d{3})+|\d+),(\d{2})(?![\d,])')
+
+# Fator de vencimento: dias desde 07/10/1997. Ao chegar a 9999 (21/02/2025) o fator
+# voltou para 1000, então o mesmo fator vale para duas datas; fica a mais próxima de hoje.
+DATA_BASE_FATOR = date(1997, 10, 7)
+DATA_BASE_FATOR_REINICIO = date(2025, 2, 22) - timedelta(days=1000)
+
+
+def modulo10(numeros):
+    soma = 0
+    for i, digito in enumerate(reversed(numeros)):
+        produto = int(digito) * (2 if i % 2 == 0 else 1)
+        soma += produto // 10 + produto % 10
+    return (10 - soma % 10) % 10
+
+
+def modulo11(numeros, convenio=False):
+    soma = sum(int(digito) * (2 + i % 8) for i, digito in enumerate(reversed(numeros)))
+    dv = 11 - soma % 11
+    if dv >= 10:
+        # Bancário: DV 0, 10 ou 11 vira 1; arrecadação: 10 e 11 viram 0
+        return 0 if convenio else 1
+    return dv
+
+
+def _dv_convenio(numeros, codigo_barras):
+    # O 3º dígito do código de barras diz qual módulo a arrecadação usa
+    if codigo_barras[2] in '67':
+        return modulo10(numeros)
+    return modulo11(numeros, convenio=True)
+
+
+def linha_para_codigo_barras(digitos):
+    """
+    Converte linha digitável (47 ou 48 dígitos) para o código de barras de 44 posições,
+    conferindo os DVs de cada campo. Código de barras (44) é só validado.
+    Retorna o código de barras ou None se algum dígito verificador não bater.
+    """
+    if len(digitos) == 47:
+        campos = [(digitos[0:9], digitos[9]), (digitos[10:20], digitos[20]), (digitos[21:31], digitos[31])]
+        if any(modulo10(numeros) != int(dv) for numeros, dv in campos):
+            return None
+        codigo = digitos[0:4] + digitos[32] + digitos[33:47] + digitos[4:9] + digitos[10:20] + digitos[21:31]
+    elif len(digitos) == 48:
+        if digitos[0] != '8':
+            return None
+        blocos = [digitos[i:i + 12] for i in range(0, 48, 12)]
+        codigo = ''.join(bloco[:11] for bloco in blocos)
+        if codigo[2] not in '6789':
+            return None
+        if any(_dv_convenio(bloco[:11], codigo) != int(bloco[11]) for bloco in blocos):
+            return None
+    elif len(digitos) == 44:
+        codigo = digitos
+    else:
+        return None
+    return codigo if codigo_barras_valido(codigo) else None
+
+
+def codigo_barras_valido(codigo):
+    """DV geral do código de barras de 44 posições (posição 5 no bancário, 4 na arrecadação)."""
+    if len(codigo) != 44 or not codigo.isdigit():
+        return False
+    if codigo[0] == '8':
+        if codigo[2] not in '6789':
+            return False
+        return _dv_convenio(codigo[:3] + codigo[4:], codigo) == int(codigo[3])
+    return modulo11(codigo[:4] + codigo[5:]) == int(codigo[4])
+
+
+def data_do_fator(fator, referencia=None):
+    if not fator:
+        return None  # boleto sem vencimento
+    referencia = referencia or date.today()
+    candidatas = [DATA_BASE_FATOR + timedelta(days=fator)]
+    if fator >= 1000:
+        candidatas.append(DATA_BASE_FATOR_REINICIO + timedelta(days=fator))
+    return min(candidatas, key=lambda d: abs((d - referencia).days))
+
+
+def decodificar_codigo_barras(codigo):
+    """Vencimento e valor gravados no código de barras. Arrecadação não traz vencimento."""
+    if codigo[0] == '8':
+        # Dígito 3 = 6 ou 8: valor efetivo em reais; 7 ou 9: valor de referência (não é dinheiro)
+        valor = int(codigo[4:15]) / 100 if codigo[2] in '68' else 0.0
+        return {'data_vencimento': None, 'valor': valor}
+    vencimento = data_do_fator(int(codigo[5:9]))
+    return {'data_vencimento': vencimento, 'valor': int(codigo[9:19]) / 100}
+
+
+def valores_no_texto(texto):
+    return {float(f"{inteiro.replace('.', '')}.{centavos}") for inteiro, centavos in PADRAO_VALOR.findall(texto)}
+
+
+def localizar_linha_digitavel(texto):
+    """Primeira linha digitável/código de barras do texto que passa na validação: (digitos, codigo_barras)."""
+    for padrao in (PADRAO_BANCARIO, PADRAO_CONVENIO, PADRAO_CORRIDO):
+        for encontrado in padrao.finditer(texto):
+            digitos = re.sub(r'\D', '', encontrado.group())
+            codigo = linha_para_codigo_barras(digitos)
+            if codigo:
+                return digitos, codigo
+    return None, None
+
+
+def extrair_boleto_do_texto(texto):
+    """
+    Lê linha digitável, vencimento e valor da camada de texto da página.
+    Só devolve quando a leitura é confiável: DVs conferem, o código traz um valor
+    e esse mesmo valor aparece escrito no documento (num comprovante, confirma que
+    foi pago o valor de face). Caso contrário devolve None e a página segue para a IA.
+    """
+    if not texto:
+        return None
+    digitos, codigo = localizar_linha_digitavel(texto)
+    if not codigo:
+        return None
+
+    decodificado = decodificar_codigo_barras(codigo)
+    valor = decodificado['valor']
+    if valor <= 0 or valor not in valores_no_texto(texto):
+        return None
+
+    vencimento = decodificado['data_vencimento']
+    return {
+        'codigo_barras_numerico': digitos,
+        'codigo_barras': codigo,
+        'data_vencimento': vencimento.isoformat() if vencimento else None,
+        'data_pagamento': None,
+        'valor_float': valor,
+        'valor_virgula': f"{valor:.2f}".replace('.', ','),
+    }
+
+
+def normalizar_codigo(codigo):
+    """
+    Chave canônica do boleto: linha digitável e código de barras do mesmo título viram
+    o mesmo código de 44 posições. Se os DVs não baterem, fica só com os dígitos.
+    """
+    digitos = re.sub(r'\D', '', str(codigo or ''))
+    return linha_para_codigo_barras(digitos) or digitos
@@ -0,0 +1,155 @@
+from collections import defaultdict
+from difflib import SequenceMatcher
+from .services_boleto import normalizar_codigo
+
+# ============================================================
+# CASAMENTO BOLETO x COMPROVANTE (ÍNDICES + ATRIBUIÇÃO ÓTIMA)
+# ============================================================
+# Os comprovantes são indexados por faixa de valor em centavos (consulta só a faixa
+# do boleto e as vizinhas) e por código de barras normalizado (igualdade exata por
+# hash). Cada par possível vira uma aresta com peso; a escolha final é uma atribuição
+# de peso máximo sobre todos os boletos de uma vez, em vez de dar ao primeiro boleto
+# da fila o comprovante que talvez fosse o par certo de outro.
+
+TOLERANCIA_CENTAVOS = 5
+
+# Qualquer par vale mais do que todos os bônus somados: primeiro maximiza a
+# quantidade de boletos casados, depois a qualidade dos pares.
+PESO_PAR = 1000
+BONUS_CODIGO_EXATO = 100
+BONUS_CODIGO_PARECIDO = 50
+BONUS_IA = 100
+
+
+def calcular_similaridade(a, b):
+    """Calcula a similaridade entre duas strings."""
+    if not a or not b: return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def centavos(valor):
+    return int(round(valor * 100))
+
+
+class IndiceComprovantes:
+    def __init__(self, comprovantes):
+        self.comprovantes = comprovantes
+        self.por_faixa = defaultdict(list)
+        self.por_codigo = defaultdict(set)
+        for c in comprovantes:
+            if c['valor'] > 0:
+                self.por_faixa[centavos(c['valor']) // TOLERANCIA_CENTAVOS].append(c)
+            if c['codigo']:
+                self.por_codigo[normalizar_codigo(c['codigo'])].add(c['id'])
+
+    def candidatos(self, valor, codigo=''):
+        """
+        Comprovantes com valor dentro da tolerância, cada um com (peso, motivo).
+        Código de barras idêntico (após normalizar) pesa mais; muito parecido
+        (erro de leitura de um dígito) vem em seguida.
+        """
+        if valor <= 0:
+            return []
+        alvo = centavos(valor)
+        faixa = alvo // TOLERANCIA_CENTAVOS
+        codigo = normalizar_codigo(codigo) if codigo else ''
+        mesmo_codigo = self.por_codigo.get(codigo, ()) if codigo else ()
+
+        encontrados = []
+        for vizinha in (faixa - 1, faixa, faixa + 1):
+            for c in self.por_faixa.get(vizinha, ()):
+                diferenca = abs(centavos(c['valor']) - alvo)
+                if diferenca >= TOLERANCIA_CENTAVOS:
+                    continue
+                peso = PESO_PAR + (TOLERANCIA_CENTAVOS - diferenca)
+                motivo = None
+                if c['id'] in mesmo_codigo:
+                    peso += BONUS_CODIGO_EXATO
+                    motivo = "CÓDIGO DE BARRAS"
+                elif codigo and c['codigo'] and calcular_similaridade(codigo, normalizar_codigo(c['codigo'])) > 0.95:
+                    peso += BONUS_CODIGO_PARECIDO
+                    motivo = "CÓDIGO DE BARRAS (aproximado)"
+                encontrados.append({'comprovante': c, 'peso': peso, 'motivo': motivo})
+        return encontrados
+
+
+def atribuir(arestas):
+    """
+    Atribuição de peso máximo. `arestas` é {(boleto, comprovante): peso}; devolve
+    {boleto: comprovante}. O grafo é quebrado em componentes conexos (normalmente
+    grupos pequenos de mesmo valor) e cada um é resolvido pelo método húngaro.
+    """
+    pai = {}
+
+    def raiz(no):
+        while pai.setdefault(no, no) != no:
+            pai[no] = pai[pai[no]]
+            no = pai[no]
+        return no
+
+    for b, c in arestas:
+        pai[raiz(('b', b))] = raiz(('c', c))
+
+    componentes = defaultdict(list)
+    for (b, c), peso in arestas.items():
+        componentes[raiz(('b', b))].append((b, c, peso))
+
+    resultado = {}
+    for lista in componentes.values():
+        if len(lista) == 1:
+            b, c, _ = lista[0]
+            resultado[b] = c
+            continue
+        boletos = sorted({b for b, _, _ in lista})
+        comprovantes = sorted({c for _, c, _ in lista})
+        pesos = {(b, c): peso for b, c, peso in lista}
+        # O método exige linhas <= colunas; transpõe quando há mais boletos que comprovantes
+        transposto = len(boletos) > len(comprovantes)
+        linhas, colunas = (comprovantes, boletos) if transposto else (boletos, comprovantes)
+        custo = [
+            [-pesos.get((col, lin) if transposto else (lin, col), 0) for col in colunas]
+            for lin in linhas
+        ]
+        for i, j in _hungaro(custo).items():
+            b, c = (colunas[j], linhas[i]) if transposto else (linhas[i], colunas[j])
+            if (b, c) in pesos:
+                resultado[b] = c
+    return resultado
+
+
+def _hungaro(custo):
+    """Custo mínimo para matriz n x m (n <= m). Devolve {linha: coluna}."""
+    n, m = len(custo), len(custo[0])
+    infinito = float('inf')
+    u, v = [0] * (n + 1), [0] * (m + 1)
+    p, caminho = [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minimo = [infinito] * (m + 1)
+        usado = [False] * (m + 1)
+        while True:
+            usado[j0] = True
+            i0, delta, j1 = p[j0], infinito, 0
+            linha = custo[i0 - 1]
+            for j in range(1, m + 1):
+                if not usado[j]:
+                    atual = linha[j - 1] - u[i0] - v[j]
+                    if atual < minimo[j]:
+                        minimo[j], caminho[j] = atual, j0
+                    if minimo[j] < delta:
+                        delta, j1 = minimo[j], j
+            for j in range(m + 1):
+                if usado[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minimo[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = caminho[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    return {p[j] - 1: j - 1 for j in range(1, m + 1) if p[j]}
@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_tenants.utils import schema_context
+from .models import JobConciliacao, PaginaProcessada
+from .services import processar_reconciliacao
+
+# ============================================================
+# EXECUÇÃO PERSISTIDA E RETOMÁVEL DA CONCILIAÇÃO
+# ============================================================
+
+# Job PROCESSANDO sem batimento há mais que isso é considerado órfão (worker caiu) e volta para a fila
+JOB_ORFAO_APOS = timedelta(minutes=5)
+MAX_TENTATIVAS = 3
+INTERVALO_BATIMENTO = 10  # segundos
+
+
+def _evento(tipo, dados):
+    return json.dumps({'type': tipo, 'data': dados}) + "\n"
+
+
+def criar_job(usuario, caminho_comprovantes, caminhos_boletos):
+    """Copia os arquivos enviados para a pasta do job e coloca o job na fila."""
+    with transaction.atomic():
+        job = JobConciliacao.objects.create(usuario=usuario, caminho_comprovantes='')
+        pasta = JobConciliacao.pasta_do_job(job.pk)
+        os.makedirs(os.path.join(pasta, 'boletos'), exist_ok=True)
+
+        job.caminho_comprovantes = shutil.copy2(caminho_comprovantes, pasta)
+        job.caminhos_boletos = [shutil.copy2(c, os.path.join(pasta, 'boletos')) for c in caminhos_boletos]
+        job.save(update_fields=['caminho_comprovantes', 'caminhos_boletos'])
+
+    with open(job.caminho_log, 'w', encoding='utf-8') as log:
+        log.write(_evento('job', {'id': job.pk}))
+        log.write(_evento('log', f'⏳ Conciliação #{job.pk} na fila de processamento...'))
+    return job
+
+
+class CheckpointJob:
+    """
+    Resultados já gravados do job, carregados uma vez. `obter` é só leitura em memória
+    (seguro nas threads de extração); `guardar` acessa o banco e deve ser chamado na
+    thread principal do worker.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.feitos = {(p.tipo, p.chave): p.dados for p in job.paginas.all()}
+
+    def obter(self, tipo, chave):
+        return self.feitos.get((tipo, str(chave)))
+
+    def guardar(self, tipo, chave, dados):
+        chave = str(chave)
+        if (tipo, chave) in self.feitos:
+            return
+        try:
+            with transaction.atomic():
+                PaginaProcessada.objects.create(job=self.job, tipo=tipo, chave=chave, dados=dados)
+        except IntegrityError:
+            pass  # gravado por outra execução do mesmo job
+        self.feitos[(tipo, chave)] = dados
+
+
+def reivindicar_proximo_job():
+    """
+    Pega o próximo job da fila (ou um órfão) e marca como PROCESSANDO.
+    skip_locked permite vários workers sem que dois peguem o mesmo job.
+    """
+    limite_orfao = timezone.now() - JOB_ORFAO_APOS
+    with transaction.atomic():
+        job = (
+            JobConciliacao.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='PENDENTE') | Q(status='PROCESSANDO', atualizado_em__lt=limite_orfao))
+            .order_by('criado_em')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.tentativas += 1
+        if job.tentativas > MAX_TENTATIVAS:
+            job.status = 'ERRO'
+            job.erro = f'Abandonado após {MAX_TENTATIVAS} tentativas interrompidas.'
+            job.concluido_em = timezone.now()
+            job.save()
+            _anexar(job, _evento('log', f'❌ {job.erro}'))
+            return None
+
+        job.status = 'PROCESSANDO'
+        job.iniciado_em = job.iniciado_em or timezone.now()
+        job.save()
+    return job
+
+
+def _anexar(job, linha):
+    with open(job.caminho_log, 'a', encoding='utf-8') as log:
+        log.write(linha)
+
+
+class BatimentoJob:
+    """
+    Atualiza o `atualizado_em` do job a cada INTERVALO_BATIMENTO numa thread própria,
+    independente dos eventos: uma chamada longa à IA (espera de cota, novas tentativas)
+    não faz um job vivo parecer órfão para outro worker.
+    """
+    def __init__(self, job):
+        self.job_id = job.pk
+        self.schema_name = connection.schema_name  # a thread não herda o schema do tenant
+        self.parar = threading.Event()
+        self.thread = threading.Thread(target=self._bater, daemon=True)
+
+    def _bater(self):
+        try:
+            while not self.parar.wait(INTERVALO_BATIMENTO):
+                with schema_context(self.schema_name):
+                    JobConciliacao.objects.filter(pk=self.job_id).update(atualizado_em=timezone.now())
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.parar.set()
+        self.thread.join()
+
+
+def executar_job(job):
+    """Roda a conciliação do job, gravando cada evento no NDJSON e cada página no checkpoint."""
+    checkpoint = CheckpointJob(job)
+
+    with open(job.caminho_log, 'a', encoding='utf-8') as log, BatimentoJob(job):
+        if checkpoint.feitos:
+            log.write(_evento('log', f'♻️ Retomando a conciliação: {len(checkpoint.feitos)} resultados já gravados serão reaproveitados.'))
+            log.flush()
+        try:
+            for linha in processar_reconciliacao(job.caminho_comprovantes, job.caminhos_boletos, job.usuario, checkpoint=checkpoint):
+                log.write(linha)
+                log.flush()
+                evento = json.loads(linha)
+                if evento['type'] == 'finish':
+                    job.url_resultado = evento['data']['url']
+
+            job.status = 'CONCLUIDO' if job.url_resultado else 'ERRO'
+            if not job.url_resultado:
+                job.erro = 'A conciliação terminou sem gerar o arquivo final (veja o log).'
+        except Exception as e:
+            job.status = 'ERRO'
+            job.erro = str(e)
+            log.write(_evento('log', f'❌ Erro inesperado na conciliação: {e}'))
+        log.write(_evento('job_status', {'id': job.pk, 'status': job.status, 'erro': job.erro}))
+
+    job.concluido_em = timezone.now()
+    job.save()
+    return job
+
+
+def ler_eventos(job_id, desde=0, espera=0.5, limite_segundos=1800):
+    """
+    Entrega as linhas do NDJSON do job a partir da linha `desde` e continua
+    acompanhando o arquivo até o job terminar. O navegador guarda quantas linhas
+    já recebeu e, se a conexão cair, reconecta pedindo a partir dali.
+    """
+    caminho = os.path.join(JobConciliacao.pasta_do_job(job_id), 'eventos.ndjson')
+    fim = time.monotonic() + limite_segundos
+    with open(caminho, encoding='utf-8') as log:
+        linha_atual = 0
+        while time.monotonic() < fim:
+            posicao = log.tell()
+            linha = log.readline()
+            if linha.endswith('\n'):
+                if linha_atual >= desde:
+                    yield linha
+                linha_atual += 1
+                continue
+
+            # Fim do arquivo (ou linha ainda sendo escrita): volta ao início dela e espera
+            log.seek(posicao)
+            status = JobConciliacao.objects.filter(pk=job_id).values_list('status', flat=True).first()
+            if status in (None, 'CONCLUIDO', 'ERRO'):
+                # Relê uma última vez: o worker pode ter escrito entre a leitura e a consulta
+                for resto in log:
+                    if resto.endswith('\n') and linha_atual >= desde:
+                        yield resto
+                    linha_atual += 1
+                return
+            time.sleep(espera)
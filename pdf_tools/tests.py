@@ -1,3 +1,99 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date
+import fitz
+from django.test import SimpleTestCase
+from pdf_tools.services import DocumentoPdf
+from pdf_tools.services_boleto import data_do_fator, extrair_boleto_do_texto, linha_para_codigo_barras
+from pdf_tools.services_conciliacao import atribuir
 
-# Create your tests here.
+# Itaú, R$ 123,45, vencimento 10/03/2026 (fator 1381, já no ciclo reiniciado)
+LINHA_VALIDA = '34192.91418 77763.170667 90743.915002 1 13810000012345'
+CODIGO_VALIDO = '34191138100000123452914177763170669074391500'
+
+
+class RasterizacaoTests(SimpleTestCase):
+    def gerar_pdf(self, linhas):
+        doc = fitz.open()
+        pagina = doc.new_page()  # A4 em pontos
+        for i, linha in enumerate(linhas):
+            pagina.insert_text((72, 100 + 20 * i), linha)
+        arquivo = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        arquivo.close()
+        doc.save(arquivo.name)
+        doc.close()
+        self.addCleanup(os.remove, arquivo.name)
+        documento = DocumentoPdf(arquivo.name)
+        self.addCleanup(documento.fechar)
+        return documento
+
+    def decodificar(self, imagem):
+        self.assertEqual(imagem['mime_type'], 'image/jpeg')
+        self.assertTrue(imagem['data'].startswith(b'\xff\xd8\xff'))
+        return fitz.Pixmap(imagem['data'])
+
+    def test_pagina_sem_campos_relevantes_sai_inteira_em_cinza(self):
+        documento = self.gerar_pdf(['Lorem ipsum dolor sit amet'])
+        pix = self.decodificar(documento.pagina(0).imagem())
+        self.assertEqual(pix.n, 1)
+        self.assertEqual(max(pix.width, pix.height), 1600)  # RASTER_PIXELS_LADO_MAIOR
+
+    def test_pagina_com_valor_e_vencimento_sai_recortada(self):
+        documento = self.gerar_pdf(['Vencimento 10/03/2026', 'Valor do documento 123,45'])
+        pix = self.decodificar(documento.pagina(0).imagem())
+        self.assertEqual(pix.n, 1)
+        self.assertLess(pix.height, pix.width)
+
+
+class LinhaDigitavelTests(SimpleTestCase):
+    def test_linha_valida_vira_codigo_de_barras(self):
+        self.assertEqual(linha_para_codigo_barras(LINHA_VALIDA.replace('.', '').replace(' ', '')), CODIGO_VALIDO)
+
+    def test_digito_trocado_num_campo_e_rejeitado(self):
+        corrompida = LINHA_VALIDA.replace('34192.', '34193.')
+        self.assertIsNone(linha_para_codigo_barras(corrompida.replace('.', '').replace(' ', '')))
+        self.assertIsNone(extrair_boleto_do_texto(f"{corrompida}\nValor do documento 123,45"))
+
+    def test_dv_geral_errado_e_rejeitado(self):
+        corrompida = LINHA_VALIDA.replace(' 1 ', ' 2 ')
+        self.assertIsNone(linha_para_codigo_barras(corrompida.replace('.', '').replace(' ', '')))
+
+    def test_texto_com_linha_e_valor_escrito(self):
+        dados = extrair_boleto_do_texto(f"Banco Itaú\n{LINHA_VALIDA}\nValor do documento R$ 123,45")
+        self.assertEqual(dados['codigo_barras'], CODIGO_VALIDO)
+        self.assertEqual(dados['valor_float'], 123.45)
+
+    def test_valor_que_nao_aparece_no_texto_vai_para_a_ia(self):
+        self.assertIsNone(extrair_boleto_do_texto(f"{LINHA_VALIDA}\nValor do documento 99,90"))
+
+
+class FatorVencimentoTests(SimpleTestCase):
+    """O fator chegou a 9999 em 21/02/2025 e voltou para 1000 em 22/02/2025."""
+
+    def test_ultimo_dia_do_primeiro_ciclo(self):
+        self.assertEqual(data_do_fator(9999, referencia=date(2025, 2, 21)), date(2025, 2, 21))
+
+    def test_primeiro_dia_do_ciclo_reiniciado(self):
+        self.assertEqual(data_do_fator(1000, referencia=date(2025, 2, 22)), date(2025, 2, 22))
+
+    def test_fator_ambiguo_fica_com_a_data_mais_proxima(self):
+        self.assertEqual(data_do_fator(1000, referencia=date(2000, 7, 1)), date(2000, 7, 3))
+        self.assertEqual(data_do_fator(1381, referencia=date(2026, 1, 1)), date(2026, 3, 10))
+
+    def test_fator_zero_e_boleto_sem_vencimento(self):
+        self.assertIsNone(data_do_fator(0))
+
+
+class AtribuicaoTests(SimpleTestCase):
+    def test_casamento_guloso_deixaria_um_boleto_sem_par(self):
+        # O guloso daria X para A (maior peso) e B ficaria sem comprovante
+        arestas = {('A', 'X'): 1005, ('A', 'Y'): 1004, ('B', 'X'): 1004}
+        self.assertEqual(atribuir(arestas), {'A': 'Y', 'B': 'X'})
+
+    def test_mais_boletos_que_comprovantes(self):
+        arestas = {('A', 'X'): 1005, ('B', 'X'): 1003, ('B', 'Y'): 1002, ('C', 'Y'): 1004}
+        self.assertEqual(atribuir(arestas), {'A': 'X', 'C': 'Y'})
+
+    def test_componentes_independentes(self):
+        arestas = {('A', 'X'): 1000, ('B', 'Y'): 1000, ('B', 'Z'): 1100}
+        self.assertEqual(atribuir(arestas), {'A': 'X', 'B': 'Z'})
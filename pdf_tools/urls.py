@@ -12,4 +12,6 @@ urlpatterns = [
     path('api/limpar/', views.api_limpar_tudo, name='api_limpar'),
     
     path('api/processar/', views.api_iniciar_processamento, name='api_processar'),
+    path('api/jobs/<int:job_id>/eventos/', views.api_eventos_job, name='api_eventos_job'),
+    path('api/download/<str:nome>/', views.api_download_resultado, name='api_download'),
 ]
\ No newline at end of file
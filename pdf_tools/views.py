@@ -1,13 +1,15 @@
 import os
 import shutil
 import json
-from django.shortcuts import render
-from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from core.decorators import possui_produto
-from .services import processar_reconciliacao
+from .models import JobConciliacao
+from .services import PASTA_DOWNLOADS
+from .services_jobs import criar_job, ler_eventos
 
 # ============================================================
 # FUNÇÕES AUXILIARES
@@ -147,7 +149,8 @@ def api_delete_arquivo(request):
 
 def api_iniciar_processamento(request):
     """
-    Inicia o processamento e retorna stream de logs (NDJSON).
+    Cria o job de conciliação (executado pelo worker_conciliacao) e retorna
+    o stream de logs (NDJSON) desse job.
     
     GET /api/processar/
     
@@ -211,24 +214,12 @@ def api_iniciar_processamento(request):
     print("="*70 + "\n")
     
     # ========================================================
-    # INICIAR STREAM
+    # CRIAR JOB E INICIAR STREAM
     # ========================================================
     
     try:
-        response = StreamingHttpResponse(
-            processar_reconciliacao(
-                caminho_comprovantes=caminho_comp_completo,
-                lista_caminhos_boletos=lista_boletos,
-                user=request.user
-            ),
-            content_type='application/x-ndjson'
-        )
-        
-        # Headers importantes
-        response['Cache-Control'] = 'no-cache'
-        response['X-Accel-Buffering'] = 'no'  # Para Nginx
-        
-        return response
+        job = criar_job(request.user, caminho_comp_completo, lista_boletos)
+        return _stream_eventos(job.pk, desde=0)
     
     except Exception as e:
         print(f"\n❌ ERRO AO INICIAR STREAM: {str(e)}\n")
@@ -236,6 +227,52 @@ def api_iniciar_processamento(request):
             'error': f'Erro ao iniciar processamento: {str(e)}'
         }, status=500)
 
+def _stream_eventos(job_id, desde):
+    response = StreamingHttpResponse(ler_eventos(job_id, desde), content_type='application/x-ndjson')
+    
+    # Headers importantes
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Para Nginx
+    
+    return response
+
+# ============================================================
+# API: EVENTOS DE UM JOB (RECONEXÃO)
+# ============================================================
+
+@possui_produto('gerador-pdf')
+def api_eventos_job(request, job_id):
+    """
+    Reabre o stream NDJSON de um job a partir do evento `desde` (0 = desde o início).
+    O navegador usa ao perder a conexão; o processamento continua no worker.
+    
+    GET /api/jobs/<job_id>/eventos/?desde=N
+    """
+    job = get_object_or_404(JobConciliacao, pk=job_id, usuario=request.user)
+    try:
+        desde = max(0, int(request.GET.get('desde', 0)))
+    except ValueError:
+        return JsonResponse({'error': 'Parâmetro "desde" inválido'}, status=400)
+    return _stream_eventos(job.pk, desde)
+
+# ============================================================
+# API: DOWNLOAD DO RESULTADO
+# ============================================================
+
+@possui_produto('gerador-pdf')
+def api_download_resultado(request, nome):
+    """
+    Entrega o ZIP da conciliação em blocos (FileResponse), sem carregá-lo na memória.
+    
+    GET /api/download/<nome>/
+    """
+    # Segurança: usar apenas basename para evitar path traversal
+    nome = os.path.basename(nome)
+    caminho = os.path.join(PASTA_DOWNLOADS, nome)
+    if not nome.endswith('.zip') or not os.path.exists(caminho):
+        raise Http404('Arquivo não encontrado')
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=nome)
+
 # ============================================================
 # API: LIMPAR TUDO
 # ============================================================
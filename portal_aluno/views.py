@@ -3,6 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.contrib import messages
 from agenda_fit.models import Aula, Presenca
+from agenda_fit.services import liberar_vaga, reservar_vaga
 from financeiro_fit.models import Lancamento
 from cadastros_fit.models import Aluno
 
@@ -62,7 +63,7 @@ def cancelar_aula(request, aula_id):
     
     # Regra: Só pode cancelar com X horas de antecedência?
     # Por enquanto libera geral
-    presenca.delete() # Ou muda status para CANCELADO
+    liberar_vaga(presenca) # Ou muda status para CANCELADO
     
     messages.success(request, "Aula cancelada com sucesso.")
     return redirect('aluno_agenda')
@@ -72,18 +73,11 @@ def marcar_aula(request, aula_id):
     aluno = get_aluno(request)
     aula = get_object_or_404(Aula, id=aula_id)
     
-    # 1. Verifica se já está inscrito
-    if Presenca.objects.filter(aula=aula, aluno=aluno).exists():
-        messages.warning(request, "Você já está agendado nesta aula.")
+    # Checa inscrição + capacidade e grava com a aula travada (sem overbooking)
+    sucesso, resultado = reservar_vaga(aula, aluno, status='PRESENTE')
+    if not sucesso:
+        messages.error(request, resultado)
         return redirect('aluno_agenda')
-
-    # 2. Verifica se tem vaga (Capacidade)
-    if aula.presencas.count() >= aula.capacidade_maxima:
-        messages.error(request, "Esta aula já está lotada.")
-        return redirect('aluno_agenda')
-
-    # 3. Realiza o agendamento
-    Presenca.objects.create(aula=aula, aluno=aluno, status='PRESENTE')
     
     messages.success(request, "Aula agendada com sucesso!")
     return redirect('aluno_agenda')
\ No newline at end of file